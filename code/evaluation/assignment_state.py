@@ -0,0 +1,238 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# Add the project root to sys.path, ahead of this folder so the root helpers module is found
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from helpers import read_dfs, read_variables
+from instance import encode_instance
+from code.models.IR import objective_balance_attributes
+from code.evaluation.kernel import count_pairs
+from code.evaluation.batch_score import objective_weights
+from code.evaluation.check_constraints import (assignment_groups, assignment_frame, group_sizes, satisfied_preferences, balance_bounds,
+                                               violates_group_size, violates_student_pair, violates_teacher_pair,
+                                               violates_max_extra_care, violates_ratio, violates_min_prefs)
+
+def incidence(owners, n):
+    # CSR lists of row ids per student: rows[ptr[s]:ptr[s + 1]] are the rows that mention student s
+    order = np.argsort(owners, kind='stable')
+    ptr = np.searchsorted(owners[order], np.arange(n + 1))
+    return ptr, order
+
+class AssignmentState:
+    # Keeps the objective and every hard constraint counter of one assignment up to date,
+    # a move or swap only touches the rows of the students involved
+    def __init__(self, instance, group, balance_attributes, min_prefs=1, deviation=0.1):
+        self.instance = instance
+        self.group = np.asarray(group, dtype=np.int64).copy()
+        self.min_prefs = min_prefs
+        self.deviation = deviation
+        self.balance_attributes = [a for a in balance_attributes if a in instance.attributes]
+        self.objective_attributes = objective_balance_attributes(instance)
+        n, T = instance.n_students, instance.n_teachers
+
+        # Rows per student: outgoing and incoming preferences, pair and teacher constraints
+        self.out_ptr, self.out_edges = incidence(instance.pref_src, n)
+        self.in_ptr, self.in_edges = incidence(instance.pref_dst, n)
+        n_pairs = len(instance.pair_s1)
+        self.pair_ptr, self.pair_rows = incidence(np.concatenate([instance.pair_s1, instance.pair_s2]), n)
+        self.pair_rows = self.pair_rows % max(n_pairs, 1)
+        self.teacher_ptr, self.teacher_rows = incidence(instance.teacher_student, n)
+
+        # Objective weights, the objective is exactly the one of score_batch
+        layer_weight, self.fairness_weight, self.balance_weight = objective_weights(instance)
+        self.num_prefs = np.bincount(instance.pref_src, minlength=n)
+        self.layer_value = np.concatenate([[0.0], np.cumsum(layer_weight)])
+
+        # Per student, per group and per category counts
+        self.satisfied = satisfied_preferences(instance, self.group)
+        self.sizes = group_sizes(instance, self.group)
+        self.extra_care = count_pairs(np.where(instance.extra_care == 1, 0, -1), self.group, 1, T)[0]
+        self.counts = {}
+        self.bounds = {}
+        self.targets = {}
+        for attribute in dict.fromkeys(self.balance_attributes + self.objective_attributes):
+            codes, categories = instance.attributes[attribute]
+            self.counts[attribute] = count_pairs(codes, self.group, len(categories), T)
+            self.bounds[attribute] = balance_bounds(instance, attribute, deviation)
+            self.targets[attribute] = (np.bincount(codes[codes >= 0], minlength=len(categories)) / T).astype(np.int64)
+
+        # Violation flags per constraint row
+        self.group_violated = violates_group_size(instance, self.group)
+        self.pair_violated = violates_student_pair(instance, self.group)
+        self.teacher_violated = violates_teacher_pair(instance, self.group)
+        self.extra_care_violated = violates_max_extra_care(instance, self.group)
+        self.balance_violated = {a: violates_ratio(instance, self.group, a, deviation) for a in self.balance_attributes}
+        self.min_prefs_violated = violates_min_prefs(instance, self.group, min_prefs)
+
+        self.fairness = float(self.layer_value[np.minimum(self.satisfied, self.num_prefs)].sum())
+        self.deviation_total = int(sum(np.abs(self.counts[a] - self.targets[a][:, None]).sum() for a in self.objective_attributes))
+        self.n_violated = sum(self.violations().values())
+
+    # READING THE STATE
+    def objective(self):
+        return self.fairness_weight * self.fairness - self.balance_weight * self.deviation_total
+
+    def violations(self):
+        violations = {
+            "assignment": int((self.group < 0).sum()),
+            "group_size": int(self.group_violated.sum()),
+            "student_pair": int(self.pair_violated.sum()),
+            "student_teacher": int(self.teacher_violated.sum()),
+            "extra_care": int(self.extra_care_violated.sum()),
+        }
+        for attribute in self.balance_attributes:
+            violations[f"balance:{attribute}"] = int(self.balance_violated[attribute].sum())
+        violations["min_prefs"] = int(self.min_prefs_violated.sum())
+        return violations
+
+    def is_valid(self):
+        return self.n_violated == 0
+
+    def snapshot(self):
+        return {"objective": float(self.objective()), "satisfied": int(self.satisfied.sum()), **self.violations()}
+
+    # EDITS
+    def move_index(self, s, t):
+        # Move student s to group t (-1 removes it from its group)
+        instance = self.instance
+        old = int(self.group[s])
+        if old == t:
+            return
+        self.group[s] = t
+        self.n_violated += int(t < 0) - int(old < 0)
+        variables = instance.variables
+
+        # Group sizes and extra care
+        for group, change in ((old, -1), (t, 1)):
+            if group < 0:
+                continue
+            self.sizes[group] += change
+            self.set_flag(self.group_violated, group, not (variables.min_group_size <= self.sizes[group] <= variables.max_group_size))
+            if instance.extra_care[s]:
+                self.extra_care[group] += change
+                self.set_flag(self.extra_care_violated, group, self.extra_care[group] > variables.max_extra_care)
+
+        # Category counts, balance rows and the balance penalty
+        for attribute, counts in self.counts.items():
+            c = instance.attributes[attribute][0][s]
+            if c < 0:
+                continue
+            lower, upper = self.bounds[attribute]
+            target = self.targets[attribute][c]
+            for group, change in ((old, -1), (t, 1)):
+                if group < 0:
+                    continue
+                before = abs(counts[c, group] - target)
+                counts[c, group] += change
+                if attribute in self.objective_attributes:
+                    self.deviation_total += abs(counts[c, group] - target) - before
+                if attribute in self.balance_violated:
+                    self.set_flag(self.balance_violated[attribute], (c, group), not (lower[c] <= counts[c, group] <= upper[c]))
+
+        # Preferences of s and preferences towards s
+        changed = {}
+        for e in self.out_edges[self.out_ptr[s]:self.out_ptr[s + 1]]:
+            other = self.group[instance.pref_dst[e]]
+            change = int(t >= 0 and t == other) - int(old >= 0 and old == other)
+            if change:
+                changed[s] = changed.get(s, 0) + change
+        for e in self.in_edges[self.in_ptr[s]:self.in_ptr[s + 1]]:
+            u = instance.pref_src[e]
+            change = int(t >= 0 and t == self.group[u]) - int(old >= 0 and old == self.group[u])
+            if change:
+                changed[u] = changed.get(u, 0) + change
+        for u, change in changed.items():
+            before = self.layer_value[min(self.satisfied[u], self.num_prefs[u])]
+            self.satisfied[u] += change
+            self.fairness += self.layer_value[min(self.satisfied[u], self.num_prefs[u])] - before
+            self.set_flag(self.min_prefs_violated, u, self.num_prefs[u] > 0 and self.satisfied[u] < self.min_prefs)
+
+        # Pair and teacher constraints of s
+        for p in self.pair_rows[self.pair_ptr[s]:self.pair_ptr[s + 1]]:
+            g1, g2 = self.group[instance.pair_s1[p]], self.group[instance.pair_s2[p]]
+            same = g1 >= 0 and g1 == g2
+            self.set_flag(self.pair_violated, p, not same if instance.pair_together[p] else same)
+        for r in self.teacher_rows[self.teacher_ptr[s]:self.teacher_ptr[s + 1]]:
+            self.set_flag(self.teacher_violated, r, (t == instance.teacher_teacher[r]) != instance.teacher_together[r])
+
+    def set_flag(self, flags, index, value):
+        # Keeps the total number of violated rows up to date
+        self.n_violated += int(value) - int(flags[index])
+        flags[index] = value
+
+    def move(self, student, teacher):
+        # Returns the change of the objective, satisfied preferences and violation counts
+        before = self.snapshot()
+        self.move_index(self.instance.student_index[student], self.instance.teacher_index[teacher])
+        return self.change(before)
+
+    def swap(self, student1, student2):
+        before = self.snapshot()
+        s1, s2 = self.instance.student_index[student1], self.instance.student_index[student2]
+        t1, t2 = int(self.group[s1]), int(self.group[s2])
+        self.move_index(s1, t2)
+        self.move_index(s2, t1)
+        return self.change(before)
+
+    def change(self, before):
+        after = self.snapshot()
+        return {key: after[key] - value for key, value in before.items() if after[key] != value}
+
+    def to_frame(self):
+        return assignment_frame(self.instance, self.group)
+
+def load_state(school, processed_data_folder, solution_path, balance_attributes, min_prefs=1, deviation=0.1):
+    data = read_dfs(school, processed_data_folder)
+    instance = encode_instance(data, read_variables(data))
+    group, _, _ = assignment_groups(instance, pd.read_csv(solution_path))
+    return AssignmentState(instance, group, balance_attributes, min_prefs, deviation)
+
+def print_change(change):
+    if not change:
+        print("  no change")
+    for key, value in change.items():
+        print(f"  {key}: {value:+.6f}" if key == "objective" else f"  {key}: {value:+d}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print("Usage: python3 code/evaluation/assignment_state.py <school> <method: cp|ilp|highs> <solution.csv> [min_prefs_per_kid] [deviation]")
+        sys.exit(1)
+
+    from code.models import ILP, CP, HiGHS
+
+    school = sys.argv[1]
+    method = sys.argv[2].upper()
+    solution_path = sys.argv[3]
+    min_prefs_per_kid = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+    deviation = float(sys.argv[5]) if len(sys.argv) > 5 else 0.1
+
+    data = read_dfs(school, 'data/processed_data')
+    backend = {"ILP": ILP, "CP": CP, "HIGHS": HiGHS}[method]
+    state = load_state(school, 'data/processed_data', solution_path, backend.get_balance_attributes(data), min_prefs_per_kid, deviation)
+    print(state.snapshot())
+    print("Commands: move <student> <teacher> | swap <student> <student> | show | save <path> | quit")
+
+    # Every edit is applied right away and its effect is printed
+    for line in sys.stdin:
+        command = line.split()
+        if not command:
+            continue
+        try:
+            if command[0] == "move" and len(command) == 3:
+                print_change(state.move(command[1], command[2]))
+            elif command[0] == "swap" and len(command) == 3:
+                print_change(state.swap(command[1], command[2]))
+            elif command[0] == "show":
+                print(state.snapshot())
+            elif command[0] == "save" and len(command) == 2:
+                state.to_frame().to_csv(command[1], index=False)
+                print(f"Saved to {command[1]}")
+            elif command[0] == "quit":
+                break
+            else:
+                print("Unknown command")
+        except KeyError as error:
+            print(f"Unknown student or teacher {error}")
@@ -0,0 +1,124 @@
+import os
+import sys
+import glob
+import numpy as np
+import pandas as pd
+
+# Add the project root to sys.path, ahead of this folder so the root helpers module is found
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from helpers import read_dfs, read_variables
+from instance import encode_instance
+from code.models.IR import objective_balance_attributes, objective_scales
+from code.evaluation.kernel import count_pairs
+from code.evaluation.check_constraints import (assignment_groups, satisfied_preferences, unassigned_students, violates_group_size,
+                                               violates_student_pair, violates_teacher_pair, violates_max_extra_care,
+                                               violates_ratio, violates_min_prefs)
+
+class BatchScores:
+    def __init__(self, layer_counts, fairness, over, under, balance, violations, objective):
+        # layer_counts[k, j]: students of row k with at least j + 1 preferences satisfied
+        self.layer_counts = layer_counts
+        self.fairness = fairness
+
+        # Total over and under deviation from the per group targets, and their sum per attribute
+        self.over = over
+        self.under = under
+        self.balance = balance
+
+        # Hard constraint family -> number of violated rows per assignment
+        self.violations = violations
+        self.objective = objective
+
+    @property
+    def n_violations(self):
+        return sum(self.violations.values())
+
+    def to_frame(self, labels=None):
+        df = pd.DataFrame({"Objective": self.objective, "Fairness": self.fairness, "Over": self.over, "Under": self.under}, index=labels)
+        for j in range(self.layer_counts.shape[1]):
+            df[f"At Least {j + 1}"] = self.layer_counts[:, j]
+        for attribute, deviation in self.balance.items():
+            df[f"Deviation {attribute}"] = deviation
+        for family, counts in self.violations.items():
+            df[f"Violations {family}"] = counts
+        df["Violations"] = self.n_violations
+        return df
+
+def objective_weights(instance):
+    # Weight of layer k = 1..max_k and the normalizing weights, the same as the model objective
+    num_prefs = np.bincount(instance.pref_src, minlength=instance.n_students)
+    layer_k = np.concatenate([np.arange(1, n + 1) for n in num_prefs] + [np.zeros(0, dtype=np.int64)])
+    _, fairness_weight, balance_weight, max_k = objective_scales(instance, layer_k, objective_balance_attributes(instance))
+    return 10.0 ** (max_k - np.arange(1, max_k + 1)), fairness_weight, balance_weight
+
+def score_batch(instance, groups, balance_attributes, min_prefs=1, deviation=0.1):
+    # groups is a K x n_students matrix of group indices (-1: unassigned), scores every row like the model does
+    groups = np.atleast_2d(np.asarray(groups, dtype=np.int64))
+    K, T = len(groups), instance.n_teachers
+
+    # Fairness layers: met_k of a student is 1 iff at least k of its preferences are satisfied
+    num_prefs = np.bincount(instance.pref_src, minlength=instance.n_students)
+    layer_weight, fairness_weight, balance_weight = objective_weights(instance)
+    objective_attributes = objective_balance_attributes(instance)
+
+    satisfied = np.minimum(satisfied_preferences(instance, groups), num_prefs)
+    layer_counts = (satisfied[:, :, None] >= np.arange(1, len(layer_weight) + 1)).sum(axis=1)
+    fairness = layer_counts @ layer_weight
+
+    # Balance penalty: deviation from int(category size / T) per group
+    over, under = np.zeros(K, dtype=np.int64), np.zeros(K, dtype=np.int64)
+    balance = {}
+    for attribute in objective_attributes:
+        codes, categories = instance.attributes[attribute]
+        counts = count_pairs(codes, groups, len(categories), T)
+        target = (np.bincount(codes[codes >= 0], minlength=len(categories)) / T).astype(np.int64)
+        difference = counts - target[:, None]
+        balance[attribute] = np.abs(difference).sum(axis=(1, 2))
+        over += np.maximum(difference, 0).sum(axis=(1, 2))
+        under += np.maximum(-difference, 0).sum(axis=(1, 2))
+
+    violations = {
+        "assignment": unassigned_students(instance, groups).sum(axis=1),
+        "group_size": violates_group_size(instance, groups).sum(axis=1),
+        "student_pair": violates_student_pair(instance, groups).sum(axis=1),
+        "student_teacher": violates_teacher_pair(instance, groups).sum(axis=1),
+        "extra_care": violates_max_extra_care(instance, groups).sum(axis=1),
+    }
+    for attribute in balance_attributes:
+        if attribute in instance.attributes:
+            violations[f"balance:{attribute}"] = violates_ratio(instance, groups, attribute, deviation).sum(axis=(1, 2))
+    violations["min_prefs"] = violates_min_prefs(instance, groups, min_prefs).sum(axis=1)
+
+    objective = fairness_weight * fairness - balance_weight * (over + under)
+    return BatchScores(layer_counts, fairness_weight * fairness, over, under, balance, violations, objective)
+
+def read_solutions(instance, paths):
+    # K x n group matrix from Student/Teacher solution CSVs
+    return np.array([assignment_groups(instance, pd.read_csv(path))[0] for path in paths], dtype=np.int64).reshape(len(paths), instance.n_students)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python3 code/evaluation/batch_score.py <school> <method: cp|ilp|highs> [min_prefs_per_kid] [deviation]")
+        sys.exit(1)
+
+    from code.models import ILP, CP, HiGHS
+
+    school = sys.argv[1]
+    method = sys.argv[2].upper()
+    min_prefs_per_kid = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    deviation = float(sys.argv[4]) if len(sys.argv) > 4 else 0.1
+
+    data = read_dfs(school, 'data/processed_data')
+    instance = encode_instance(data, read_variables(data))
+    backend = {"ILP": ILP, "CP": CP, "HIGHS": HiGHS}[method]
+
+    # Re-score every saved solution of this school and method
+    paths = sorted(glob.glob(os.path.join("data/results", school, method, "solutions", "*.csv")))
+    if not paths:
+        print(f"No solutions found for {school} with {method}")
+        sys.exit(1)
+
+    scores = score_batch(instance, read_solutions(instance, paths), backend.get_balance_attributes(data), min_prefs_per_kid, deviation)
+    df = scores.to_frame([os.path.basename(path) for path in paths]).sort_values("Objective", ascending=False)
+    print(df.to_string())
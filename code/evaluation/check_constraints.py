@@ -1,152 +1,160 @@
-import math
+import os
+import sys
+import numpy as np
+import pandas as pd
 
 try:
-    from .helpers import get_minimum_preferences_satisfied
+    from .kernel import count_pairs
 except ImportError:
-    from helpers import get_minimum_preferences_satisfied
+    from kernel import count_pairs
+
+# Add the project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from instance import encode_instance
+
+# Every check takes a group index per student, one assignment (n,) or a batch (K, n),
+# and returns a boolean mask over its constraint rows with the same leading batch shape.
+# Group -1 means the student is not assigned
 
 # 1. Each student should be assigned to exactly one group.
-def violates_unique_teacher_assignment(df):
-    return df['Student'].duplicated().any()
+def unassigned_students(instance, group):
+    return np.asarray(group) < 0
 
 # 2. Each group should have between min_group_size and max_group_size students.
-def violates_max_group_size(group, groups, max_group_size):
-    return len(groups[group]) >= max_group_size
+def group_sizes(instance, group):
+    return count_pairs(np.zeros(instance.n_students, dtype=np.int64), group, 1, instance.n_teachers)[..., 0, :]
 
-def violates_min_group_size(group, groups, min_group_size):
-    return len(groups[group]) < min_group_size
+def violates_group_size(instance, group):
+    sizes = group_sizes(instance, group)
+    variables = instance.variables
+    return (sizes < variables.min_group_size) | (sizes > variables.max_group_size)
 
 # 3. Pairing constraints for students and teacher
-def violates_student_pair(group, df, constraints_students):
-    students = df[df['Assigned Group'] == group]['Student'].tolist()
-    violations = []
-
-    for _, row in constraints_students.iterrows():
-        s1, s2, together = row['Student 1'], row['Student 2'], row['Together']
-
-        s1_in_group = s1 in students
-        s2_in_group = s2 in students
+def violates_student_pair(instance, group):
+    group = np.asarray(group)
+    g1, g2 = group[..., instance.pair_s1], group[..., instance.pair_s2]
+    same = (g1 == g2) & (g1 >= 0)
+    return np.where(instance.pair_together, ~same, same)
+
+def violates_teacher_pair(instance, group):
+    group = np.asarray(group)
+    with_teacher = group[..., instance.teacher_student] == instance.teacher_teacher
+    return with_teacher != instance.teacher_together
+
+# 4. Each group should have a maximum number of students with extra care.
+def violates_max_extra_care(instance, group):
+    codes = np.where(instance.extra_care == 1, 0, -1)
+    counts = count_pairs(codes, group, 1, instance.n_teachers)[..., 0, :]
+    return counts > instance.variables.max_extra_care
 
-        if together == 'Yes':
-            # Inclusion constraint: both should be in the same group
-            if s1_in_group != s2_in_group:  # one is in the group, the other is not
-                violations.append((s1, s2, 'Should be together'))
-        else:
-            # Exclusion constraint: both should not be in the same group
-            if s1_in_group and s2_in_group:
-                violations.append((s1, s2, 'Should not be together'))
-
-    return violations
+# 5. Each group should have a balanced ratio of students based on certain attributes.
+def balance_bounds(instance, attribute, deviation):
+    # Same bounds as ModelIR.set_limits, per category
+    codes, categories = instance.attributes[attribute]
+    target = np.bincount(codes[codes >= 0], minlength=len(categories)) / instance.n_teachers
+    return np.floor((1 - deviation) * target), np.ceil((1 + deviation) * target)
+
+def violates_ratio(instance, group, attribute, deviation):
+    # Mask of shape (..., n_categories, n_teachers)
+    codes, categories = instance.attributes[attribute]
+    counts = count_pairs(codes, group, len(categories), instance.n_teachers)
+    lower, upper = balance_bounds(instance, attribute, deviation)
+    return (counts < lower[:, None]) | (counts > upper[:, None])
 
-def violates_teacher_pair(group, df, constraints_teachers):
-    students =  df[df['Assigned Group'] == group]['Student'].tolist()
+# 6. Check if all students have at least min_preferences satisfied if they provided as much.
+def satisfied_preferences(instance, group):
+    group = np.asarray(group)
+    src, dst = instance.pref_src, instance.pref_dst
+    satisfied = (group[..., src] == group[..., dst]) & (group[..., src] >= 0)
+
+    # Count satisfied edges per source student: satisfied edges go to "group" 0, the rest are skipped
+    return count_pairs(src, satisfied.astype(np.int64) - 1, instance.n_students, 1)[..., 0]
+
+def violates_min_prefs(instance, group, min_prefs):
+    with_prefs = np.bincount(instance.pref_src, minlength=instance.n_students) > 0
+    return with_prefs & (satisfied_preferences(instance, group) < min_prefs)
+
+def assignment_groups(instance, results):
+    # Group index per student from a Student/Teacher table, together with rows that could not be used
+    students = results['Student'].map(instance.student_index)
+    teachers = results['Teacher'].map(instance.teacher_index)
+    unknown = results[students.isna() | teachers.isna()]
+    duplicated = results.loc[results['Student'].duplicated(keep=False) & students.notna(), 'Student'].unique().tolist()
+
+    known = students.notna() & teachers.notna()
+    group = np.full(instance.n_students, -1, dtype=np.int64)
+    group[students[known].astype(np.int64).to_numpy()] = teachers[known].astype(np.int64).to_numpy()
+    return group, unknown, duplicated
+
+def solution_groups(instance, solution):
+    # Group index per student from a {(student, teacher): 0/1} solver solution
+    group = np.full(instance.n_students, -1, dtype=np.int64)
+    for (student, teacher), assigned in solution.items():
+        if assigned > 0.5:
+            group[instance.student_index[student]] = instance.teacher_index[teacher]
+    return group
+
+def assignment_frame(instance, group):
+    # Student/Teacher table of the assigned students, the inverse of assignment_groups
+    assigned = np.flatnonzero(np.asarray(group) >= 0)
+    df = pd.DataFrame({"Student": [instance.students[s] for s in assigned],
+                       "Teacher": [instance.teachers[t] for t in np.asarray(group)[assigned]]})
+    return df.sort_values(by="Teacher")
+
+def verify_assignment(instance, group, balance_attributes, min_prefs=1, deviation=0.1, unknown=None, duplicated=()):
+    # Checks every hard constraint of the model for one assignment and returns all violations
+    # as (constraint, message) tuples
+    students, teachers = instance.students, instance.teachers
+    variables = instance.variables
     violations = []
 
-    for _, row in constraints_teachers.iterrows():
-        student, teacher, together = row['Student'], row['Teacher'], row['Together']
-
-        student_in_group = student in students
-        teacher_in_group = group == teacher
-
-        if together == 'Yes':
-            # Inclusion constraint: both should be in the same group
-            if student_in_group != teacher_in_group:  # one is in the group, the other is not
-                violations.append((student, teacher, 'Should be together'))
-        else:
-            # Exclusion constraint: both should not be in the same group
-            if student_in_group and teacher_in_group:
-                violations.append((student, teacher, 'Should not be together'))
+    if unknown is not None:
+        for _, row in unknown.iterrows():
+            violations.append(("assignment", f"Student {row['Student']} with teacher {row['Teacher']} is not in the input data."))
+    for student in duplicated:
+        violations.append(("assignment", f"Student {student} is assigned to multiple groups."))
+    for s in np.flatnonzero(unassigned_students(instance, group)):
+        violations.append(("assignment", f"Student {students[s]} is not assigned to a group."))
+
+    sizes = group_sizes(instance, group)
+    for t in np.flatnonzero(violates_group_size(instance, group)):
+        violations.append(("group_size", f"Group {teachers[t]} has {sizes[t]} students, allowed is {variables.min_group_size} to {variables.max_group_size}."))
+
+    for p in np.flatnonzero(violates_student_pair(instance, group)):
+        reason = "Should be together" if instance.pair_together[p] else "Should not be together"
+        violations.append(("student_pair", f"Student {students[instance.pair_s1[p]]} and {students[instance.pair_s2[p]]} violate the constraint: {reason}."))
+
+    for r in np.flatnonzero(violates_teacher_pair(instance, group)):
+        reason = "Should be together" if instance.teacher_together[r] else "Should not be together"
+        violations.append(("student_teacher", f"Student {students[instance.teacher_student[r]]} and teacher {teachers[instance.teacher_teacher[r]]} violate the constraint: {reason}."))
+
+    for t in np.flatnonzero(violates_max_extra_care(instance, group)):
+        violations.append(("extra_care", f"Group {teachers[t]} has more than {variables.max_extra_care} extra care students."))
+
+    for attribute in balance_attributes:
+        if attribute not in instance.attributes:
+            continue
+        categories = instance.attributes[attribute][1]
+        lower, upper = balance_bounds(instance, attribute, deviation)
+        for c, t in zip(*np.nonzero(violates_ratio(instance, group, attribute, deviation))):
+            violations.append((f"balance:{attribute}", f"Group {teachers[t]} violates {attribute} ratio: {attribute} = {categories[c]} should be between {int(lower[c])} and {int(upper[c])} students."))
+
+    satisfied = satisfied_preferences(instance, group)
+    for s in np.flatnonzero(violates_min_prefs(instance, group, min_prefs)):
+        violations.append(("min_prefs", f"Student {students[s]} has {satisfied[s]} preferences satisfied, at least {min_prefs} required."))
 
     return violations
 
-# 4. Each group should have a maximum number of students with extra care or any other binary attribute.
-def violates_max_extra_care(group, df, max_extra_care):
-    return df[(df["Assigned Group"] == group) & (df["Extra Care"] == "Yes")].shape[0] > max_extra_care
-
-# 5. Each group should have a balanced ratio of students based on certain attributes.
-def violates_ratio(group, df, attribute, variables, deviation=0.1):
-    categories = df[attribute].unique()
-    category_counts = df[attribute].value_counts().to_dict()
-    target_per_group = {cat: category_counts[cat] / variables.n_groups for cat in categories}
-
-    students = df[df['Assigned Group'] == group]
-
-    # Check if each category falls within the deviation range
-    for cat in categories:
-        actual = students[students[attribute] == cat].shape[0]
-        target = target_per_group[cat]
-        lower_bound = math.floor((1 - deviation) * target)
-        upper_bound = math.ceil((1 + deviation) * target)
-
-        if not (lower_bound <= actual <= upper_bound):
-            return True
-
-    return False
-
-# 6. Check if all students have at least min_preferences satisfied if they provided as much.
-def violates_min_prefs(df, min_prefs):
-    min_satisfied = get_minimum_preferences_satisfied(df)
-    return min_satisfied < min_prefs
-
-
-
-# Returns True if the constraints are satisfied, False otherwise
-def run_check_constraints(groups, merged, data, variables, min_prefs=1, deviation=0.1):
-    # 1. Check if all students are assigned to exactly one group
-    if violates_unique_teacher_assignment(merged):
-        print("Some students are assigned to multiple groups.")
-        return False
-
-    # 6. Check if all students have at least min_preferences satisfied
-    if violates_min_prefs(merged, min_prefs):
-        print(f"Some students have less than {min_prefs} preferences satisfied.")
-        return False
-
-    for group in groups:
-        # 2. Check if group size is within the allowed range
-        if violates_min_group_size(group, merged, variables.min_group_size):
-            print(f"Group {group} violates minimum group size with size {len(merged[merged['Assigned Group'] == group])}.")
-            return False
-
-        if violates_max_group_size(group, merged, variables.max_group_size):
-            print(f"Group {group} violates maximum group size with size {len(merged[merged['Assigned Group'] == group])}.")
-            return False
-
-        # 3. Check if there are invalid pairings of students and teachers
-        student_pair_violations = violates_student_pair(group, merged, data.constraints_students)
-        if student_pair_violations:
-            for s1, s2, reason in student_pair_violations:
-                print(f"Student {s1} and {s2} violate the constraint: {reason}.")
-            return False
-
-        teacher_pair_violations = violates_teacher_pair(group, merged, data.constraints_teachers)
-        if teacher_pair_violations:
-            for s, t, reason in teacher_pair_violations:
-                print(f"Student {s} and teacher {t} violate the constraint: {reason}.")
-            return False
-
-        # 4. Check if group has too many students with extra care
-        if violates_max_extra_care(group, merged, variables.max_extra_care):
-            print(f"Group {group} violates maximum extra care constraint.")
-            return False
-
-        # 5. Check if groups are balanced within a certain ratio
-        if violates_ratio(group, merged, "Gender", variables, deviation):
-            print(f"Group {group} violates Gender ratio.")
-            return False
-
-        if violates_ratio(group, merged, "Grade", variables, deviation):
-            print(f"Group {group} violates Grade ratio.")
-            return False
-
-        if violates_ratio(group, merged, "Extra Care", variables, deviation):
-            print(f"Group {group} violates Extra Care ratio.")
-            return False
-
-        # Optionally check behavior if attribute is present
-        if "Behavior" in merged.columns:
-            if violates_ratio(group, merged, "Behavior", 0.1, variables):
-                print(f"Group {group} violates Behavior ratio.")
-                return False
-
-    return True
+# Returns the violations of a Student/Teacher result table, all of them are printed
+def run_check_constraints(results, data, variables, balance_attributes, min_prefs=1, deviation=0.1):
+    instance = encode_instance(data, variables)
+    group, unknown, duplicated = assignment_groups(instance, results)
+    violations = verify_assignment(instance, group, balance_attributes, min_prefs, deviation, unknown, duplicated)
+
+    if violations:
+        print(f"The solution violates {len(violations)} hard constraints (min_prefs_per_kid={min_prefs}, deviation={deviation}):")
+        for _, message in violations:
+            print(f"  - {message}")
+    else:
+        print(f"The solution satisfies all hard constraints (min_prefs_per_kid={min_prefs}, deviation={deviation}).")
+    return violations
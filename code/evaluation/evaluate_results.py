@@ -6,10 +6,10 @@ import numpy as np
 import re
 
 try:
-    from .helpers import get_minimum_preferences_satisfied
+    from .kernel import evaluate_assignment
     from .save_results import save_to_excel
 except ImportError:
-    from helpers import get_minimum_preferences_satisfied
+    from kernel import evaluate_assignment
     from save_results import save_to_excel
 
 # Add the project root to sys.path
@@ -18,62 +18,17 @@ from helpers import read_dfs, read_variables
 
 # TOTAL PREFERENCES
 def get_total_preferences_satisfied(df):
-    columns = ['Preference 1', 'Preference 2', 'Preference 3', 'Preference 4', 'Preference 5']
-    total = 0
-
-    for _, row in df.iterrows():
-        student_group = row['Assigned Group']
-        prefs = row[columns].tolist()
-
-        for pref_student in prefs:
-            if pd.isna(pref_student):
-                continue
-            pref_group = df.loc[df['Student'] == pref_student, 'Assigned Group'].values[0]
-            if pref_group == student_group:
-                total += 1
-
-    return total
+    return evaluate_assignment(df).total_satisfied()
 
 def get_total_preferences_provided(df):
-    columns = ['Preference 1', 'Preference 2', 'Preference 3', 'Preference 4', 'Preference 5']
-    total_preferences = 0
-
-    for _, row in df.iterrows():
-        preferences_provided = row[columns].notna().sum()
-        total_preferences += preferences_provided
-
-    return total_preferences
+    return evaluate_assignment(df).total_provided()
 
 def get_satisfaction_rate(df):
-    provided = get_total_preferences_provided(df)
-    satisfied = get_total_preferences_satisfied(df)
-    return satisfied / provided
+    return evaluate_assignment(df).satisfaction_rate()
 
 # BALANCE
 def get_balance(df, attribute, group_col='Assigned Group'):
-    result = {}
-    values = df[attribute].dropna().unique()
-
-    for value in values:
-        subset = df[df[attribute] == value]
-
-        # Counts and percentages of groups for this attribute value
-        group_counts = subset[group_col].value_counts()
-        group_percentages = subset[group_col].value_counts(normalize=True)
-
-        # Build inner dict with counts and percentages
-        result[value] = {
-            "total": int(len(subset)),
-        }
-
-        for group, count in group_counts.items():
-            percent = round(group_percentages[group], 2)
-            result[value][group] = {
-                "count": int(count),
-                "percent": percent
-            }
-
-    return result
+    return evaluate_assignment(df, group_col).balance(attribute)
 
 def ideal_distribution(total, groups):
     base = total // groups
@@ -105,17 +60,51 @@ def compute_normalized_balance_deviation(balance_dict, group_sizes):
     return deviations
 
 # EFFICIENCY
+# Gaps for which the evaluation reports the first time the solver reached them
+GAP_THRESHOLDS = [0.1, 0.05, 0.01]
+
+def primal_gap(value, reference):
+    # 0 for the reference objective, 1 for no solution or a solution of the other sign
+    if value == reference:
+        return 0.0
+    if value * reference < 0:
+        return 1.0
+    return abs(reference - value) / max(abs(reference), abs(value))
+
+def primal_integral(times, objectives, reference, end_time):
+    # Area under the primal gap of the incumbent over time, the gap is 1 until the first solution
+    integral = 0.0
+    previous_time = 0.0
+    gap = 1.0
+    for t, value in zip(times, objectives):
+        integral += gap * (t - previous_time)
+        previous_time = t
+        gap = primal_gap(value, reference)
+    return integral + gap * (end_time - previous_time)
+
 def add_efficiency(school, method, timestamp, evaluation_results):
     logs_folder = os.path.join("data/results", school, method, "logs")
     log_path = os.path.join(logs_folder, f"{method}_{timestamp}.csv")
 
     if os.path.exists(log_path):
-        logs_df, final_status_line = load_log_file_cleaned(log_path)
+        logs_df, _ = load_log_file_cleaned(log_path)
+
+        # Bound, status and summary rows hold their values in the columns after the first
+        bounds = {}
+        for name in ("Best Bound", "Upper Bound"):
+            rows = logs_df[logs_df["Timestamp"] == name]
+            if not rows.empty:
+                bounds[name] = float(rows["Solution #"].iloc[-1])
+        status_rows = logs_df[logs_df["Timestamp"] == "Status"]
+        first_feasible_rows = logs_df[logs_df["Timestamp"] == "First Feasible"]
+        summary_rows = logs_df[logs_df["Timestamp"] == "Summary"]
+
         # Drop any rows that are not data
         logs_df = logs_df[logs_df["Solution #"].apply(lambda x: str(x).isdigit())]
 
         if not logs_df.empty:
             logs_df["Elapsed Time (s)"] = pd.to_numeric(logs_df["Elapsed Time (s)"], errors='coerce')
+            logs_df["Objective Value"] = pd.to_numeric(logs_df["Objective Value"], errors='coerce')
             first_feasible_time = logs_df["Elapsed Time (s)"].iloc[0]
             last_time = logs_df["Elapsed Time (s)"].iloc[-1]
 
@@ -123,45 +112,52 @@ def add_efficiency(school, method, timestamp, evaluation_results):
             evaluation_results["time_to_optimal_or_timeout"] = float(last_time)
             evaluation_results["objective"] = float(logs_df["Objective Value"].iloc[-1])
 
-        if final_status_line.startswith("Status,"):
-            status_value = final_status_line.split(",", 1)[-1].strip()
-            evaluation_results["final_status"] = status_value
+            # Relative gap to the tightest of the solver bound and the relaxation bound
+            if bounds:
+                objective = evaluation_results["objective"]
+                bound = min(bounds.values())
+                evaluation_results["solver_bound"] = bounds.get("Best Bound")
+                evaluation_results["relaxation_bound"] = bounds.get("Upper Bound")
+                evaluation_results["upper_bound"] = bound
+                evaluation_results["gap"] = max(bound - objective, 0.0) / max(abs(objective), 1e-9)
+
+            # First time the solver gap of an incumbent reached each threshold
+            if "Gap" in logs_df.columns:
+                gaps = pd.to_numeric(logs_df["Gap"], errors='coerce')
+                evaluation_results["time_to_gap"] = {
+                    f"{threshold:.0%}": float(logs_df.loc[gaps <= threshold, "Elapsed Time (s)"].iloc[0]) if (gaps <= threshold).any() else None
+                    for threshold in GAP_THRESHOLDS
+                }
+
+            # Primal integral against the best objective of the run
+            evaluation_results["primal_integral"] = primal_integral(logs_df["Elapsed Time (s)"].tolist(), logs_df["Objective Value"].tolist(),
+                                                                    float(logs_df["Objective Value"].max()), float(last_time))
+
+        # Time of the feasibility stage with --feasibility-first, time_to_first_feasible is the first solution with an objective
+        if not first_feasible_rows.empty:
+            evaluation_results["time_to_first_feasible_stage"] = float(first_feasible_rows["Solution #"].iloc[-1])
+
+        if not status_rows.empty:
+            evaluation_results["final_status"] = str(status_rows["Solution #"].iloc[-1]).strip()
+
+            # A search ended by a stop rule names it after the status
+            stop_reason = status_rows["Elapsed Time (s)"].iloc[-1]
+            if pd.notna(stop_reason) and str(stop_reason).strip():
+                evaluation_results["stop_reason"] = str(stop_reason).strip()
+
+        # Summary row: key, value pairs
+        if not summary_rows.empty:
+            values = summary_rows.iloc[-1].dropna().tolist()[1:]
+            for key, value in zip(values[0::2], values[1::2]):
+                name = {"Presolve Time (s)": "presolve_time", "Peak Memory (MB)": "peak_memory_mb"}.get(key)
+                if name:
+                    evaluation_results[name] = float(value)
 
     return evaluation_results
 
 # MINIMUM PREFERENCES/ FAIRNESS
 def only_minimum_satisfied(df):
-    columns = ['Preference 1', 'Preference 2', 'Preference 3', 'Preference 4', 'Preference 5']
-    min_satisfied = get_minimum_preferences_satisfied(df)
-
-    count_min = 0
-    count_above_min = 0
-    eligible_students = 0
-
-    for _, row in df.iterrows():
-        student_group = row['Assigned Group']
-        preferences = row[columns].dropna().tolist()
-        satisfied = 0
-
-        for pref_student in preferences:
-            if pd.isna(pref_student):
-                continue
-            # Find group of preferred student
-            match = df[df['Student'] == pref_student]
-            if not match.empty and match['Assigned Group'].values[0] == student_group:
-                satisfied += 1
-
-        if len(preferences) > min_satisfied:
-            eligible_students += 1
-            if satisfied == min_satisfied:
-                count_min += 1
-            elif satisfied > min_satisfied:
-                count_above_min += 1
-
-    percentage_min = count_min / eligible_students if eligible_students > 0 else 0.0
-    percentage_above_min = count_above_min / eligible_students if eligible_students > 0 else 0.0
-
-    return (count_min, percentage_min), (count_above_min, percentage_above_min)
+    return evaluate_assignment(df).only_minimum()
 
 # SAVE EVALUATION RESULTS
 def convert_keys_to_native(obj):
@@ -213,19 +209,21 @@ def run_evaluate(school, processed_data_folder, method, groups, timestamp):
     merged = pd.merge(groups, data.info_students, on='Student', how='left')
     merged.rename(columns={'Teacher': 'Assigned Group'}, inplace=True)
 
-    (min_count, min_percentage), (above_min_count, above_min_percentage) = only_minimum_satisfied(merged)
+    # Every metric below is derived from the same group index arrays
+    evaluation = evaluate_assignment(merged)
+    (min_count, min_percentage), (above_min_count, above_min_percentage) = evaluation.only_minimum()
 
     evaluation_results = {
-        "preferences_satisfied": get_total_preferences_satisfied(merged),
-        "satisfaction_rate": get_satisfaction_rate(merged),
-        "minimum_preferences": get_minimum_preferences_satisfied(merged),
+        "preferences_satisfied": evaluation.total_satisfied(),
+        "satisfaction_rate": evaluation.satisfaction_rate(),
+        "minimum_preferences": evaluation.minimum_satisfied(),
         "only_minimum_satisfied": min_count,
         "only_minimum_percentage": min_percentage,
         "more_than_minimum_satisfied": above_min_count,
         "more_than_minimum_percentage": above_min_percentage
     }
 
-    group_sizes = merged['Assigned Group'].value_counts().sort_index().to_dict()
+    group_sizes = evaluation.group_sizes()
     evaluation_results["group_sizes"] = group_sizes
 
     # Balance
@@ -234,7 +232,7 @@ def run_evaluate(school, processed_data_folder, method, groups, timestamp):
 
     for attr in categorical_attributes:
         if attr in merged.columns:
-            balance[attr] = get_balance(merged, attr)
+            balance[attr] = evaluation.balance(attr)
 
     evaluation_results["group_balance"] = balance
 
@@ -249,7 +247,7 @@ def run_evaluate(school, processed_data_folder, method, groups, timestamp):
     save_evaluation(school, method, evaluation_results, timestamp)
 
     # Save to Excel
-    save_to_excel(merged, school, method, timestamp)
+    save_to_excel(merged, school, method, timestamp, evaluation)
 
 
 if __name__ == "__main__":
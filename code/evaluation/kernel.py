@@ -0,0 +1,121 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# Add the project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from instance import PREFERENCE_COLUMNS
+
+# All functions below take a group index per student, either one assignment of shape (n,)
+# or a batch of K assignments of shape (K, n). Group -1 means the student is not assigned
+
+def preference_matrix(df, student_index):
+    # Row positions of the preferred students per preference column, -1 when empty.
+    # Unknown students, students preferring themselves and repeated preferences are dropped like in the model
+    names = df[PREFERENCE_COLUMNS].to_numpy(dtype=object)
+    prefs = pd.Series(names.ravel(), dtype=object).map(student_index).to_numpy(dtype=float).reshape(names.shape)
+    prefs = np.where(np.isnan(prefs), -1, prefs).astype(np.int64)
+    prefs[prefs == np.arange(len(df))[:, None]] = -1
+    for column in range(1, prefs.shape[1]):
+        repeated = (prefs[:, [column]] == prefs[:, :column]).any(axis=1)
+        prefs[repeated, column] = -1
+    return prefs
+
+def satisfied_matrix(group, prefs):
+    # satisfied[..., s, p] is True when student s shares a group with its p-th preference
+    group = np.asarray(group)
+    own = group[..., :, None]
+    other = group[..., np.where(prefs >= 0, prefs, 0)]
+    return (prefs >= 0) & (own >= 0) & (own == other)
+
+def count_pairs(codes, group, n_codes, n_groups):
+    # Crosstab of codes (n,) against groups, shape (n_codes, n_groups) or (K, n_codes, n_groups)
+    group = np.asarray(group)
+    batch = group.reshape(-1, group.shape[-1])
+    valid = (codes >= 0) & (batch >= 0)
+    keys = np.arange(len(batch))[:, None] * (n_codes * n_groups) + codes * n_groups + batch
+    counts = np.bincount(keys[valid], minlength=len(batch) * n_codes * n_groups)
+    return counts.reshape(group.shape[:-1] + (n_codes, n_groups))
+
+class Evaluation:
+    def __init__(self, students, teachers, group, prefs, df):
+        self.students = students
+        self.teachers = teachers
+        self.group = group
+        self.prefs = prefs
+        self.df = df
+
+        # The single pass everything else is derived from
+        self.satisfied = satisfied_matrix(group, prefs)
+        self.provided = (prefs >= 0).sum(axis=1)
+        self.n_satisfied = self.satisfied.sum(axis=1)
+
+    def total_provided(self):
+        return int(self.provided.sum())
+
+    def total_satisfied(self):
+        return int(self.n_satisfied.sum())
+
+    def satisfaction_rate(self):
+        provided = self.total_provided()
+        return self.total_satisfied() / provided if provided else 0.0
+
+    def minimum_satisfied(self):
+        # Lowest number of satisfied preferences among students that gave any
+        with_prefs = self.provided > 0
+        return int(self.n_satisfied[with_prefs].min()) if with_prefs.any() else 0
+
+    def only_minimum(self):
+        minimum = self.minimum_satisfied()
+        eligible = self.provided > minimum
+        n_eligible = int(eligible.sum())
+        count_min = int((eligible & (self.n_satisfied == minimum)).sum())
+        count_above_min = int((eligible & (self.n_satisfied > minimum)).sum())
+
+        percentage_min = count_min / n_eligible if n_eligible > 0 else 0.0
+        percentage_above_min = count_above_min / n_eligible if n_eligible > 0 else 0.0
+        return (count_min, percentage_min), (count_above_min, percentage_above_min)
+
+    def group_sizes(self):
+        # Students per group, groups without students are left out
+        sizes = np.bincount(self.group[self.group >= 0], minlength=len(self.teachers))
+        return {teacher: int(size) for teacher, size in zip(self.teachers, sizes) if size > 0}
+
+    def satisfied_with(self):
+        # Names of the satisfied preferences per student, in preference column order
+        students = np.asarray(self.students, dtype=object)
+        return [students[row[mask]].tolist() for row, mask in zip(self.prefs, self.satisfied)]
+
+    def balance(self, attribute):
+        # {value: {"total": n, group: {"count", "percent"}}}, values in order of appearance
+        # and groups from most to least students (ties in order of appearance)
+        codes, values = pd.factorize(self.df[attribute])
+        counts = count_pairs(codes, self.group, len(values), len(self.teachers))
+
+        # Position of the first student of every (value, group) combination
+        valid = (codes >= 0) & (self.group >= 0)
+        keys = codes[valid] * len(self.teachers) + self.group[valid]
+        first = np.full(len(values) * len(self.teachers), len(self.group))
+        unique, index = np.unique(keys, return_index=True)
+        first[unique] = np.flatnonzero(valid)[index]
+        first = first.reshape(len(values), len(self.teachers))
+
+        result = {}
+        for c, value in enumerate(values.tolist()):
+            total = int(counts[c].sum())
+            result[value] = {"total": total}
+            for t in np.lexsort((first[c], -counts[c])):
+                if counts[c, t] > 0:
+                    result[value][self.teachers[t]] = {
+                        "count": int(counts[c, t]),
+                        "percent": round(counts[c, t] / total, 2)
+                    }
+        return result
+
+def evaluate_assignment(df, group_col='Assigned Group'):
+    # df has one row per student with its group and the student info columns
+    students = df['Student'].tolist()
+    codes, teachers = pd.factorize(df[group_col], sort=True)
+    prefs = preference_matrix(df, {s: i for i, s in enumerate(students)})
+    return Evaluation(students, teachers.tolist(), codes.astype(np.int64), prefs, df)
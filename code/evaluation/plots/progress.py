@@ -29,6 +29,11 @@ def parse_result_file(path):
     optimal_found = any("OPTIMAL" in line for line in lines)
     df = pd.read_csv(path, skiprows=data_start)
 
+    # Bound and status rows at the end are not solutions
+    df = df[df["Solution #"].apply(lambda x: str(x).isdigit())]
+    df["Elapsed Time (s)"] = pd.to_numeric(df["Elapsed Time (s)"])
+    df["Objective Value"] = pd.to_numeric(df["Objective Value"])
+
     times = []
     values = []
     last_time = 0
@@ -2,25 +2,17 @@ import pandas as pd
 import os
 import json
 
-def get_preferences_satisfied_per_student(df):
-    columns = ['Preference 1', 'Preference 2', 'Preference 3', 'Preference 4', 'Preference 5']
-    results = {}
+try:
+    from .kernel import evaluate_assignment
+except ImportError:
+    from kernel import evaluate_assignment
 
-    for _, row in df.iterrows():
-        student = row['Student']
-        student_group = row['Assigned Group']
-        prefs = [p for p in row[columns].tolist() if pd.notna(p)]
-
-        satisfied = []
-        for pref_student in prefs:
-            try:
-                pref_group = df.loc[df['Student'] == pref_student, 'Assigned Group'].values[0]
-                if pref_group == student_group:
-                    satisfied.append(pref_student)
-            except IndexError:
-                # In case the preferred student is not in the dataframe
-                continue
+def get_preferences_satisfied_per_student(df, evaluation=None):
+    if evaluation is None:
+        evaluation = evaluate_assignment(df)
 
+    results = {}
+    for student, satisfied in zip(evaluation.students, evaluation.satisfied_with()):
         results[student] = {
             "num_satisfied": len(satisfied),
             "satisfied_with": satisfied
@@ -28,19 +20,13 @@ def get_preferences_satisfied_per_student(df):
 
     return results
 
-def update_df(df):
-    results = get_preferences_satisfied_per_student(df)
-    num_satisfied_list = []
-    satisfied_with_list = []
-
-    for _, row in df.iterrows():
-        student = row['Student']
-        student_result = results.get(student, {"num_satisfied": 0, "satisfied_with": []})
-        num_satisfied_list.append(student_result["num_satisfied"])
-        satisfied_with_list.append(", ".join(map(str, student_result["satisfied_with"])))
+def update_df(df, evaluation=None):
+    if evaluation is None:
+        evaluation = evaluate_assignment(df)
 
-    df['Num Preferences'] = num_satisfied_list
-    df['Matched Preferences'] = satisfied_with_list
+    # Rows of df are the students of the evaluation, in the same order
+    df['Num Preferences'] = evaluation.n_satisfied
+    df['Matched Preferences'] = [", ".join(map(str, satisfied)) for satisfied in evaluation.satisfied_with()]
 
     return df
 
@@ -110,9 +96,9 @@ def create_balance_df(evaluation):
     return df
 
 
-def save_to_excel(df, school, method, timestamp):
+def save_to_excel(df, school, method, timestamp, evaluation=None):
     # Add number of preferences satisfied and satisfied with columns
-    df = update_df(df)
+    df = update_df(df, evaluation)
 
     # Create a directory for the results if it doesn't exist
     solution_folder = os.path.join("data/results", school, method, "solutions")
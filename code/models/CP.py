@@ -1,265 +1,167 @@
 from ortools.sat.python import cp_model
-import math
 import os
 import csv
 import time
 from datetime import datetime
+import numpy as np
 import pandas as pd
-from helpers import create_preference_matrix, read_dfs, read_variables, estimated_max_balance_penalty, estimated_max_fairness
-
-def create_initial_model(students, teachers, data, variables):
+from helpers import read_dfs, read_variables
+from instance import encode_instance
+from code.models.IR import build_model_ir, activity_bounds
+from code.models.cache import instance_digest, model_key, get_cached_model, put_cached_model
+from code.models.diagnose import diagnose_infeasibility
+from code.models.polish import Polisher
+from code.models.pool import SolutionPool
+from code.models.bounds import LP_TIMELIMIT, ObjectiveBounds
+from code.models.search_log import SOLVER_LOG, LogWriter, relative_gap, summary_row
+from code.models.stopping import StopMonitor
+from code.models.checkpoint import Checkpointer
+
+def get_balance_attributes(data):
+    # Attributes that are balanced as hard constraints, Grade is only balanced in the objective
+    attributes = ['Gender', 'Extra Care']
+    for attribute in ['Behavior', 'Learning']:
+        if attribute in data.info_students.columns:
+            attributes.append(attribute)
+    return attributes
+
+def row_bounds(ir):
+    # CP-SAT needs finite integer bounds, open sides are replaced by the row activity bounds
+    min_act, max_act = activity_bounds(ir.A, ir.lb, ir.ub)
+    lo = np.where(np.isfinite(ir.row_lo), ir.row_lo, min_act)
+    hi = np.where(np.isfinite(ir.row_hi), ir.row_hi, max_act)
+    return np.ceil(lo).astype(np.int64), np.floor(hi).astype(np.int64)
+
+def lower_model(ir, row_guard=None):
+    # With row_guard, row r is only enforced while guard literal row_guard[r] is true (-1: always).
+    # Guard literals are created after the IR variables, guard g has proto index ir.n_vars + g
     model = cp_model.CpModel()
+    names = ir.var_names if ir.var_names is not None else [""] * ir.n_vars
+
+    # Variables are created in IR order, so proto index i is IR variable i
+    variables = []
+    for i, (lb, ub) in enumerate(zip(ir.lb.tolist(), ir.ub.tolist())):
+        if lb == 0 and ub == 1:
+            variables.append(model.NewBoolVar(names[i]))
+        else:
+            variables.append(model.NewIntVar(lb, ub, names[i]))
+
+    guards = []
+    if row_guard is not None:
+        guards = [model.NewBoolVar("") for _ in range(int(row_guard.max()) + 1)]
+
+    # Linear rows, indicator rows are only enforced if their literal holds
+    literal = np.full(ir.n_rows, -1, dtype=np.int64)
+    literal[ir.ind_row] = ir.ind_var
+    literal_value = np.zeros(ir.n_rows, dtype=np.int64)
+    literal_value[ir.ind_row] = ir.ind_value
+    assignment = ir.families.index('assignment')
+    lo, hi = row_bounds(ir)
+    A = ir.A
+
+    for r in range(ir.n_rows):
+        cols = A.indices[A.indptr[r]:A.indptr[r + 1]].tolist()
+        if ir.row_family[r] == assignment:
+            # Each student must be assigned to exactly one teacher
+            model.AddExactlyOne([variables[c] for c in cols])
+            continue
 
-    # Decision variables
-    # x[s][t] = 1 if student s assigned to teacher t
-    x = {}
-    for s in students:
-        for t in teachers:
-            x[s, t] = model.NewBoolVar(f'x_{s}_{t}')
-
-    model = add_objective(model, x, students, teachers, data, variables)
+        coefs = A.data[A.indptr[r]:A.indptr[r + 1]].tolist()
+        ct = model.AddLinearConstraint(cp_model.LinearExpr.WeightedSum([variables[c] for c in cols], coefs), int(lo[r]), int(hi[r]))
+        enforcement = []
+        if literal[r] >= 0:
+            lit = variables[literal[r]]
+            enforcement.append(lit if literal_value[r] == 1 else lit.Not())
+        if guards and row_guard[r] >= 0:
+            enforcement.append(guards[row_guard[r]])
+        if enforcement:
+            ct.OnlyEnforceIf(enforcement)
+
+    # res == a AND b
+    for res, a, b in zip(ir.and_res.tolist(), ir.and_a.tolist(), ir.and_b.tolist()):
+        model.AddBoolAnd([variables[a], variables[b]]).OnlyEnforceIf(variables[res])
+        model.AddBoolOr([variables[a].Not(), variables[b].Not()]).OnlyEnforceIf(variables[res].Not())
+
+    # res == OR(ops)
+    for i, res in enumerate(ir.or_res.tolist()):
+        ops = [variables[op] for op in ir.or_ops[ir.or_ptr[i]:ir.or_ptr[i + 1]].tolist()]
+        model.AddBoolOr(ops).OnlyEnforceIf(variables[res])
+        model.AddBoolAnd([op.Not() for op in ops]).OnlyEnforceIf(variables[res].Not())
+
+    objective = np.flatnonzero(ir.objective)
+    model.Maximize(cp_model.LinearExpr.WeightedSum([variables[i] for i in objective.tolist()], ir.objective[objective].tolist()))
+
+    # Map variables back to (student, teacher) names
+    x = {(s, t): variables[ir.x[i, j]] for i, s in enumerate(ir.students) for j, t in enumerate(ir.teachers)}
 
     return model, x
 
-def add_objective(model, x, students, teachers, data, variables):
-    attributes_to_balance = ['Gender', 'Grade', 'Extra Care']
-    if 'Behavior' in data.info_students.columns:
-        attributes_to_balance.append('Behavior')
-
-    balance_penalty_terms = add_balance(model, x, attributes_to_balance, teachers, data)
-
-    preferences = create_preference_matrix(data, variables)
-    fairness_layers = add_fairness_layers(model, x, students, teachers, preferences)
-    fairness_terms = []
-    # Get highest number of preferences given by any student
-    max_k = max(k for k, _ in fairness_layers) if fairness_layers else 1
-    for k, met_k in fairness_layers:
-        # Each layer is weighted exponentially based on how many preferences are met
-        # Higher k means more preferences met, so weight is lower to focus more on
-        # improving fairness for students with fewer preferences met first
-        weight = 10 ** (max_k - k)
-        fairness_terms.append(weight * met_k)
-
-    print("Fairness terms (CP):", fairness_terms[:5])
-
-    # Scale each objective by its estimated max value to normalize
-    balance_scale = 1 / max(1, estimated_max_balance_penalty(data, attributes_to_balance, teachers))
-    fairness_scale = 1 / max(1, estimated_max_fairness(fairness_layers))
-
-    # Apply scaling to weights
-    balance_weight = 2 * balance_scale
-    fairness_weight = 1 * fairness_scale
-
-    model.Maximize(
-        fairness_weight * sum(fairness_terms)
-        - balance_weight * sum(balance_penalty_terms)
-    )
-
-    return model
-
-# SOFT CONSTRAINTS
-def add_balance(model, x, attributes, teachers, data):
-    balance_penalty_terms = []
-    max_students = len(data.info_students)
-
-    for attribute in attributes:
-        # Get the unique categories for the attribute
-        categories = data.info_students[attribute].unique()
-        # Get target per teacher for each category
-        category_students = {cat: data.info_students[data.info_students[attribute] == cat]['Student'].tolist() for cat in categories}
-        target_per_teacher = {cat: len(category_students[cat]) / len(teachers) for cat in categories}
-
-        for t in teachers:
-            for cat in categories:
-                # Get the list of students in this category
-                assigned_count = sum(x[s, t] for s in category_students[cat])
-                target = target_per_teacher[cat]
-
-                # Calculate over and under deviation
-                over_dev = model.NewIntVar(0, max_students, f"over_dev_{t}_{attribute}_{cat}")
-                under_dev = model.NewIntVar(0, max_students, f"under_dev_{t}_{attribute}_{cat}")
-
-                # Measures deviation from target by splitting into over- and under-assignment penalties
-                model.Add(assigned_count - int(target) == over_dev - under_dev)
-                balance_penalty_terms.append(over_dev)
-                balance_penalty_terms.append(under_dev)
-
-    return balance_penalty_terms
-
-def add_fairness_layers(model, x, students, teachers, preferences):
-    all_layer_vars = []
-
-    for s1 in students:
-        preferred_students = [s2 for s2 in students if s1 != s2 and preferences.loc[s1, s2] == 1]
-        num_prefs = len(preferred_students)
-
-        # Skip students with no preferences
-        if num_prefs == 0:
-            continue
-
-        satisfied_bools = []
-        for s2 in preferred_students:
-            # Create var that is 1 if both students are assigned to the same teacher
-            both_assigned = model.NewBoolVar(f"satisfied_{s1}_{s2}")
-            both_assigned_per_teacher = [model.NewBoolVar(f"{s1}_{s2}_with_{t}") for t in teachers]
-            for i, t in enumerate(teachers):
-                # Check if both students are assigned to a teacher
-                model.AddBoolAnd([x[s1, t], x[s2, t]]).OnlyEnforceIf(both_assigned_per_teacher[i])
-                model.AddBoolOr([x[s1, t].Not(), x[s2, t].Not()]).OnlyEnforceIf(both_assigned_per_teacher[i].Not())
-
-            # Var is only 1 if at least one of the together_per_teacher vars is 1
-            model.AddBoolOr(both_assigned_per_teacher).OnlyEnforceIf(both_assigned)
-            model.AddBoolAnd([v.Not() for v in both_assigned_per_teacher]).OnlyEnforceIf(both_assigned.Not())
-            satisfied_bools.append(both_assigned)
-
-        # Count the number of satisfied preferences for this student
-        num_satisfied = model.NewIntVar(0, num_prefs, f"num_satisfied_{s1}")
-        model.Add(num_satisfied == sum(satisfied_bools))
-
-        # Preference layers: has at least k prefs satisfied?
-        for k in range(1, num_prefs + 1):
-            # Create var for each possible k to track if at least k preferences are met
-            met_k = model.NewBoolVar(f"{s1}_at_least_{k}_prefs")
-            # If met_k is 1 then at least k preferences should be met
-            model.Add(num_satisfied >= k).OnlyEnforceIf(met_k)
-            # If met_k is 0 then less than k preferences should be met
-            model.Add(num_satisfied < k).OnlyEnforceIf(met_k.Not())
-            all_layer_vars.append((k, met_k))
-
-    return all_layer_vars
-
-# HARD CONSTRAINTS
-def add_balance_constraints(model, attribute, deviation, x, teachers, data):
-    # Get the unique categories for the attribute
-    categories = data.info_students[attribute].unique()
-    # Get target per teacher for each category
-    category_students = {cat: data.info_students[data.info_students[attribute] == cat]['Student'].tolist() for cat in categories}
-    target_per_teacher = {cat: len(category_students[cat]) / len(teachers) for cat in categories}
-
-    for t in teachers:
-        for cat in categories:
-            # Calculate the lower and upper bounds for the number of students in this category
-            lower_bound = math.floor((1 - deviation) * target_per_teacher[cat])
-            upper_bound = math.ceil((1 + deviation) * target_per_teacher[cat])
-
-            # Get the list of students in this category
-            students_in_cat = category_students[cat]
-
-            # Add the balancing constraints for this category and teacher
-            model.Add(sum(x[s, t] for s in students_in_cat) >= lower_bound)
-            model.Add(sum(x[s, t] for s in students_in_cat) <= upper_bound)
-
-    return model
-
-def add_fairness_constraints(model, x, students, teachers, preferences, min_prefs_per_kid):
-    for s1 in students:
-        # Only add constraints if the minimum preference is set greater than 0
-        if min_prefs_per_kid > 0:
-            preferred_students = [s2 for s2 in students if s1 != s2 and preferences.loc[s1, s2] == 1]
-
-            # Continue if s1 has any preferred students
-            if preferred_students:
-                together_vars = []
-
-                for s2 in preferred_students:
-                    # Create var that is 1 if both students are assigned to the same teacher
-                    both_assigned = model.NewBoolVar(f"satisfied_{s1}_{s2}")
-                    both_assigned_per_teacher = [model.NewBoolVar(f"{s1}_{s2}_with_{t}") for t in teachers]
-                    for i, t in enumerate(teachers):
-                        # Check if both students are assigned to a teacher
-                        model.AddBoolAnd([x[s1, t], x[s2, t]]).OnlyEnforceIf(both_assigned_per_teacher[i])
-                        model.AddBoolOr([x[s1, t].Not(), x[s2, t].Not()]).OnlyEnforceIf(both_assigned_per_teacher[i].Not())
-
-                    # Var is only 1 if at least one of the together_per_teacher vars is 1
-                    model.AddBoolOr(both_assigned_per_teacher).OnlyEnforceIf(both_assigned)
-                    model.AddBoolAnd([v.Not() for v in both_assigned_per_teacher]).OnlyEnforceIf(both_assigned.Not())
-                    together_vars.append(both_assigned)
-
-                # Require that the sum of 'together' variables is at least min_prefs_per_kid for student s1
-                model.Add(sum(together_vars) >= min_prefs_per_kid)
-
-    return model
-
-def add_hard_constraints(model, x, students, teachers, data, variables, preferences, min_prefs_per_kid, deviation):
-    for s1 in students:
-        # Each student must be assigned to exactly one teacher
-        model.AddExactlyOne(x[s1, t] for t in teachers)
-
-    # Assignment constraints
-    for _, (s1, s2, together) in data.constraints_students.iterrows():
-        for t in teachers:
-            if together == "Yes":
-                # Students must be together
-                model.Add(x[s1, t] == x[s2, t])
-            elif together == "No":
-                # Students must not be together
-                model.Add(x[s1, t] + x[s2, t] <= 1)
-
-    for _, (s, t, together) in data.constraints_teachers.iterrows():
-        if together == "Yes":
-            # Student must be with the teacher
-            model.Add(x[s, t] == 1)
-        elif together == "No":
-            # Student must not be with the teacher
-            model.Add(x[s, t] == 0)
-
-    # Maximum group size constraint
-    for t in teachers:
-        model.Add(sum(x[s, t] for s in students) >= variables.min_group_size)
-        model.Add(sum(x[s, t] for s in students) <= variables.max_group_size)
-
-    # Maximum extra care constraints
-    extra_care_values = dict(zip(data.info_students['Student'], data.info_students['Extra Care'].map({'Yes': 1, 'No': 0})))
-    for t in teachers:
-        model.Add(sum(x[s, t] * extra_care_values[s] for s in students) <= variables.max_extra_care)
-
-    # Add fairness constraints
-    model = add_fairness_constraints(model, x, students, teachers, preferences, min_prefs_per_kid)
-
-    # Add balance constraints
-    model = add_balance_constraints(model, 'Gender', deviation, x, teachers, data)
-    # model = add_balance_constraints(model, 'Grade', deviation, x, teachers, data)
-    model = add_balance_constraints(model, 'Extra Care', deviation, x, teachers, data)
-
-    # Add balance constraints for behavior if specified
-    if 'Behavior' in data.info_students.columns:
-        model = add_balance_constraints(model, 'Behavior', deviation, x, teachers, data)
-    if 'Learning' in data.info_students.columns:
-        model = add_balance_constraints(model, 'Learning', deviation, x, teachers, data)
-    if 'Combination' in data.info_students.columns:
-        model = add_balance_constraints(model, 'Learning', deviation, x, teachers, data)
-    else:
-        print("No extra attributes found in the data.")
-
-    return model
-
 # FINAL MODEL CREATION
-def create_model(school, processed_data_folder, min_prefs_per_kid, deviation):
+def create_model_ir(school, processed_data_folder, debug_names=False):
     data = read_dfs(school, processed_data_folder)
-    variables = read_variables(data)
+    instance = encode_instance(data, read_variables(data))
 
-    students = data.info_students['Student'].tolist()
-    teachers = data.info_teachers['Teacher'].tolist()
+    # Built once per instance, min_prefs and deviation are set with ModelIR.set_limits
+    return build_model_ir(instance, get_balance_attributes(data), debug_names)
 
-    # Initialize model
-    model, x = create_initial_model(students, teachers, data, variables)
+def create_model(school, processed_data_folder, min_prefs_per_kid, deviation, debug_names=False):
+    ir = create_model_ir(school, processed_data_folder, debug_names)
+    return lower_model(ir.set_limits(min_prefs_per_kid, deviation))
 
-    # Add hard constraints
-    preference_matrix = create_preference_matrix(data, variables)
-    model = add_hard_constraints(model, x, students, teachers, data, variables, preference_matrix, min_prefs_per_kid, deviation)
+def write_model(model, path):
+    with open(path, 'wb') as file:
+        file.write(model.Proto().SerializeToString())
+
+def read_model(path, meta):
+    model = cp_model.CpModel()
+    with open(path, 'rb') as file:
+        model.Proto().ParseFromString(file.read())
+    model.rebuild_var_and_constant_map()
 
+    # Proto indices of the assignment variables are stored next to the model
+    x = {}
+    for s, row in zip(meta["students"], meta["x"]):
+        for t, index in zip(meta["teachers"], row):
+            x[(s, t)] = model.GetBoolVarFromProtoIndex(index)
     return model, x
 
+def load_model(school, processed_data_folder, min_prefs_per_kid, deviation, digest, ir=None):
+    # Returns the model from the cache when possible, the IR is only built on a cache miss
+    key = model_key(digest, method="CP", min_prefs=min_prefs_per_kid, deviation=deviation, debug_names=False)
+    cached = get_cached_model(school, key, "pb")
+    if cached:
+        model, x = read_model(*cached)
+        return model, x, ir
+
+    if ir is None:
+        ir = create_model_ir(school, processed_data_folder)
+    model, x = lower_model(ir.set_limits(min_prefs_per_kid, deviation))
+    meta = {"students": np.asarray(ir.students).tolist(), "teachers": np.asarray(ir.teachers).tolist(), "x": ir.x.tolist()}
+    put_cached_model(school, key, "pb", lambda path: write_model(model, path), meta)
+    return model, x, ir
+
 # RUNNING THE MODEL
 class ObjectiveLogger(cp_model.CpSolverSolutionCallback):
-    def __init__(self, results_folder, timestamp, timelimit, min_prefs_per_kid, deviation):
+    def __init__(self, results_folder, timestamp, timelimit, min_prefs_per_kid, deviation, pool=None, x=None, solver_log=SOLVER_LOG,
+                 monitor=None, checkpointer=None, resumed_from=None):
         super().__init__()
-        self.start_time = time.time()
+        # A resumed search continues the elapsed time of its checkpoint
+        self.start_time = time.time() - (resumed_from or 0)
         self.best_objective = None
         self.solution_count = 0
         self.timestamp = timestamp
+        self.pool = pool
+        self.x = x
+        self.monitor = monitor
+        self.checkpointer = checkpointer
         self.school =  os.path.basename(os.path.dirname(results_folder))
 
+        # Search statistics of the latest solution, written next to its objective
+        self.best_bound = None
+        self.conflicts = 0
+        self.branches = 0
+        self.presolve_time = None
+
         # Create a subfolder for logs
         log_folder = os.path.join(results_folder, "logs")
         os.makedirs(log_folder, exist_ok=True)
@@ -268,46 +170,149 @@ class ObjectiveLogger(cp_model.CpSolverSolutionCallback):
         # Set up the CSV file with a timestamp-based filename
         self.file_path = os.path.join(self.results_folder, f"CP_{self.timestamp}.csv")
 
-        # Open the CSV file and write headers if it doesn't exist
-        with open(self.file_path, mode='w', newline='') as file:
-            writer = csv.writer(file)
-            # Add metadata to the CSV file
-            writer.writerow(["Run Config"])
-            writer.writerow(["School", self.school])
-            writer.writerow(["Method", "CP"])
-            writer.writerow(["Min Prefs Per Kid", min_prefs_per_kid])
-            writer.writerow(["Deviation", deviation])
-            writer.writerow(["Time Limit (s)", timelimit])
-            writer.writerow([])
-            writer.writerow(["Timestamp", "Solution #", "Elapsed Time (s)", "Objective Value"])
+        # Open the CSV file and write headers, a resumed search keeps appending to the log of its run
+        if resumed_from is not None:
+            with open(self.file_path, mode='a', newline='') as file:
+                csv.writer(file).writerow(["Resumed", round(resumed_from, 3)])
+        else:
+            with open(self.file_path, mode='w', newline='') as file:
+                writer = csv.writer(file)
+                # Add metadata to the CSV file
+                writer.writerow(["Run Config"])
+                writer.writerow(["School", self.school])
+                writer.writerow(["Method", "CP"])
+                writer.writerow(["Min Prefs Per Kid", min_prefs_per_kid])
+                writer.writerow(["Deviation", deviation])
+                writer.writerow(["Time Limit (s)", timelimit])
+                writer.writerow([])
+                writer.writerow(["Timestamp", "Solution #", "Elapsed Time (s)", "Objective Value", "Best Bound", "Gap", "Conflicts", "Branches"])
+
+        # Rows are appended by a background thread, the CP-SAT log of every phase goes to one file
+        self.writer = LogWriter(self.file_path)
+        self.solver_log = solver_log
+        self.solver_log_writer = None
+        if solver_log > 0:
+            self.solver_log_writer = LogWriter(os.path.join(self.results_folder, f"CP_{self.timestamp}.log"), text=True)
 
     def on_solution_callback(self):
         self.solution_count += 1
         current_objective = self.ObjectiveValue()
         elapsed = time.time() - self.start_time
+        self.update_statistics(self.BestObjectiveBound(), self.NumConflicts(), self.NumBranches())
+
+        # Every solution is offered to the pool, not only new best ones
+        if self.pool is not None:
+            self.pool.add({key: self.Value(var) for key, var in self.x.items()}, current_objective)
 
         # Log every new best solution
         if (self.best_objective is None) or (current_objective > self.best_objective):
             self.best_objective = current_objective
             print(f"[{elapsed:.1f}s] New best solution #{self.solution_count}, objective = {current_objective}")
             self.save_to_csv(elapsed, current_objective, self.timestamp)
+            if self.checkpointer is not None:
+                self.checkpointer.update({key: self.Value(var) for key, var in self.x.items()}, current_objective, elapsed)
+            if self.monitor is not None:
+                self.monitor.solution(current_objective, self.best_bound)
+
+    def update_statistics(self, best_bound, conflicts, branches):
+        self.best_bound = best_bound
+        self.conflicts = conflicts
+        self.branches = branches
+
+    def log_line(self, line):
+        # Solver log callback, presolve ends where the search starts. The response has no presolve time,
+        # so the log is always parsed and only written with --solver-log
+        if self.solver_log_writer is not None:
+            self.solver_log_writer.write(line)
+        if self.solver_log > 1:
+            print(line)
+        if line.startswith("Starting search at "):
+            self.presolve_time = float(line.split()[3].rstrip("s"))
+
+    def log_first_feasible(self, status_str):
+        # Time of the feasibility stage, the optimization stage logs its solutions as usual
+        elapsed = time.time() - self.start_time
+        print(f"[{elapsed:.1f}s] Feasibility stage ended with status {status_str}")
+        if status_str in ("FEASIBLE", "OPTIMAL"):
+            self.writer.write(["First Feasible", round(elapsed, 3)])
+        return elapsed
+
+    def log_polished(self, current_objective):
+        # Improvements found by polishing are logged like solver solutions
+        self.solution_count += 1
+        self.best_objective = current_objective
+        elapsed = time.time() - self.start_time
+        print(f"[{elapsed:.1f}s] Polished solution #{self.solution_count}, objective = {current_objective}")
+        self.save_to_csv(elapsed, current_objective, self.timestamp)
 
     def save_to_csv(self, elapsed, current_objective, timestamp):
-        with open(self.file_path, mode='a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([timestamp, self.solution_count, round(elapsed, 3), current_objective])
+        self.writer.write([timestamp, self.solution_count, round(elapsed, 3), current_objective, self.best_bound,
+                           relative_gap(current_objective, self.best_bound), self.conflicts, self.branches])
 
-    def EndSearch(self, status_str):
+    def EndSearch(self, status_str, best_bound=None, upper_bound=None, stop_reason=None):
         if self.best_objective is not None:
             elapsed = time.time() - self.start_time
             print(f"[{elapsed:.1f}s] Search ended. Best solution #{self.solution_count}, objective = {self.best_objective}")
             self.save_to_csv(elapsed, self.best_objective, self.timestamp)
 
-            with open(self.file_path, mode='a', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow(["Status", status_str])
+            # Solver bound and relaxation bound before the final status, the evaluation reports the gap to the tighter one
+            if best_bound is not None:
+                self.writer.write(["Best Bound", best_bound])
+            if upper_bound is not None:
+                self.writer.write(["Upper Bound", upper_bound])
+            # The stop rule that ended the search, if any, follows the status
+            self.writer.write(["Status", status_str] + ([stop_reason] if stop_reason else []))
+        self.writer.write(summary_row(self.presolve_time))
+
+        # Everything queued is on disk once the search has ended
+        self.writer.close()
+        if self.solver_log_writer is not None:
+            self.solver_log_writer.close()
+
+# Share of a phase's time limit the feasibility stage may use, the optimization always gets the rest
+FEASIBILITY_SHARE = 0.5
+
+def priority_students(instance):
+    # Students pinned to a teacher come first, then extra care students, they are the hardest to place
+    pinned = np.unique(instance.teacher_student[instance.teacher_together == 1])
+    extra_care = np.setdiff1d(np.flatnonzero(instance.extra_care), pinned)
+    return [instance.students[s] for s in np.concatenate([pinned, extra_care]).tolist()]
+
+def branching_order(x, priority, teachers):
+    # The k-th priority student tries teacher k first, so extra care students are spread over the groups
+    order = []
+    for k, student in enumerate(priority):
+        for j in range(len(teachers)):
+            order.append(x[(student, teachers[(k + j) % len(teachers)])])
+    return order
+
+def find_first_solution(model, x, priority, timelimit, log_callback=None):
+    # Feasibility stage on a copy without objective: fixed branching on the priority students, stop at the first solution
+    feasible = model.Clone()
+    feasible.ClearObjective()
+    feasible.ClearHints()
+    feasible_x = {key: feasible.GetBoolVarFromProtoIndex(var.Index()) for key, var in x.items()}
+    teachers = list(dict.fromkeys(t for _, t in x))
+    feasible.AddDecisionStrategy(branching_order(feasible_x, priority, teachers), cp_model.CHOOSE_FIRST, cp_model.SELECT_MAX_VALUE)
 
-def solve_model(model, x, results_folder, timestamp, timelimit, min_prefs_per_kid, deviation):
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = timelimit
+    solver.parameters.random_seed = 42
+    solver.parameters.num_search_workers = 1
+    solver.parameters.search_branching = cp_model.FIXED_SEARCH
+    solver.parameters.stop_after_first_solution = True
+    solver.parameters.log_to_stdout = False
+    if log_callback is not None:
+        solver.parameters.log_search_progress = True
+        solver.log_callback = log_callback
+    status = solver.Solve(feasible)
+
+    if status in (cp_model.FEASIBLE, cp_model.OPTIMAL):
+        return {key: solver.Value(var) for key, var in feasible_x.items()}, solver.StatusName(status)
+    return None, solver.StatusName(status)
+
+def solve_model(model, x, results_folder, timestamp, timelimit, min_prefs_per_kid, deviation, polisher=None, pool=None, bounds=None,
+                solver_log=SOLVER_LOG, stop_rules=None, priority=None, checkpointer=None, resume=None):
     solver = cp_model.CpSolver()
     solver.parameters.max_time_in_seconds = timelimit
     solver.parameters.log_search_progress = True
@@ -316,15 +321,74 @@ def solve_model(model, x, results_folder, timestamp, timelimit, min_prefs_per_ki
     solver.parameters.random_seed = 42
     solver.parameters.num_search_workers = 1
 
-    # Set up and attach the logger callback
-    logger = ObjectiveLogger(results_folder, timestamp, timelimit, min_prefs_per_kid, deviation)
+    # The pool only keeps alternatives of the phase that is solved now
+    if pool is not None:
+        pool.clear()
+
+    # A resumed phase gets what is left of its time limit and starts from the checkpointed assignment
+    resumed_from = None
+    if resume is not None:
+        resumed_from = resume.elapsed
+        solver.parameters.max_time_in_seconds = max(timelimit - resume.elapsed, 0)
+        model.ClearHints()
+        for key, value in resume.hint(x).items():
+            model.AddHint(x[key], value)
+
+    # Set up the logger callback, the solver log goes through it as well
+    logger = ObjectiveLogger(results_folder, timestamp, timelimit, min_prefs_per_kid, deviation, pool, x, solver_log, None,
+                             checkpointer, resumed_from)
+    solver.parameters.log_to_stdout = False
+    solver.log_callback = logger.log_line
+
+    # Feasibility first: any valid assignment is found first and hints the optimization in the remaining time.
+    # A stage that ends UNKNOWN leaves the normal search without a hint, not without time
+    if priority is not None and resume is None:
+        first, first_status = find_first_solution(model, x, priority, timelimit * FEASIBILITY_SHARE,
+                                                  logger.log_line if solver_log > 0 else None)
+        elapsed = logger.log_first_feasible(first_status)
+        if first_status == "INFEASIBLE":
+            logger.EndSearch(first_status)
+            return None, first_status
+        model.ClearHints()
+        if first is not None:
+            for key, var in x.items():
+                model.AddHint(var, first[key])
+        solver.parameters.max_time_in_seconds = max(timelimit - elapsed, 0)
+
+    # Early stop rules are checked on every new best solution and bound, the plateau by a watch thread
+    monitor = None
+    if stop_rules is not None and stop_rules.any():
+        monitor = StopMonitor(stop_rules, solver.StopSearch)
+        if stop_rules.gap is not None:
+            solver.best_bound_callback = monitor.best_bound
+    logger.monitor = monitor
+
+    # New best solutions are checkpointed from the callback
+    if checkpointer is not None:
+        checkpointer.start(min_prefs_per_kid, deviation)
     status = solver.SolveWithSolutionCallback(model, logger)
-    logger.EndSearch(solver.StatusName(status))
+    if monitor is not None:
+        monitor.close()
+    logger.update_statistics(solver.BestObjectiveBound(), solver.NumConflicts(), solver.NumBranches())
 
     # Check if a solution was found
+    solution = None
     if status in (cp_model.FEASIBLE, cp_model.OPTIMAL):
         solution = {key: solver.Value(var) for key, var in x.items()}
-        return solution
+
+        # A search stopped by the time limit is polished with local moves before the log is closed
+        if status == cp_model.FEASIBLE and polisher is not None:
+            solution = polisher.polish(solution, min_prefs_per_kid, deviation, logger.log_polished)
+            if pool is not None:
+                pool.add(solution, logger.best_objective)
+            if checkpointer is not None:
+                checkpointer.update(solution, logger.best_objective, time.time() - logger.start_time)
+
+    upper_bound = bounds.upper_bound(min_prefs_per_kid, deviation) if solution and bounds is not None else None
+    logger.EndSearch(solver.StatusName(status), solver.BestObjectiveBound(), upper_bound, monitor.reason if monitor is not None else None)
+    if checkpointer is not None:
+        checkpointer.close()
+    return solution, solver.StatusName(status)
 
 def format_solution(solution):
     assignments = [(student, teacher) for (student, teacher), assigned in solution.items() if assigned == 1]
@@ -332,28 +396,100 @@ def format_solution(solution):
     df = df.sort_values(by='Teacher')
     return df
 
-def run_cp(school, processed_data_folder, timelimit, min_prefs_start, deviation):
+def diagnose(ir, school, processed_data_folder, min_prefs, deviation, timelimit):
+    # The IR is not built when every phase so far came from the model cache
+    if ir is None:
+        ir = create_model_ir(school, processed_data_folder)
+    diagnosis = diagnose_infeasibility(ir, lower_model, min_prefs, deviation, min(timelimit, 60))
+    diagnosis.print()
+    return diagnosis, ir
+
+def run_cp(school, processed_data_folder, timelimit, min_prefs_start, deviation, use_cache=True, polish_time=0, tabu=False, pool_size=0,
+           solver_log=SOLVER_LOG, stop_rules=None, feasibility_first=False, checkpoint_interval=0, resume=None, upper_bounds=False):
     folder = 'data/results'
-    timestamp = datetime.now().strftime("%d-%m_%H:%M")
+    # A resumed run keeps the timestamp, and so the log and checkpoint, of the interrupted run
+    timestamp = resume.timestamp if resume is not None else datetime.now().strftime("%d-%m_%H:%M")
     results_folder = os.path.join(folder, school, "CP")
+    data = read_dfs(school, processed_data_folder)
+    balance_attributes = get_balance_attributes(data)
+    polisher = Polisher(school, processed_data_folder, balance_attributes, polish_time, tabu) if polish_time > 0 else None
+    pool = SolutionPool(school, processed_data_folder, balance_attributes, pool_size) if pool_size > 0 else None
+    priority = priority_students(encode_instance(data, read_variables(data))) if feasibility_first else None
+    checkpointer = None
+    if checkpoint_interval > 0:
+        run_config = {"timelimit": timelimit, "min_prefs_start": min_prefs_start, "deviation": deviation}
+        checkpointer = Checkpointer(results_folder, "CP", timestamp, run_config, checkpoint_interval)
+
+    # Build the model representation once, every phase only changes its limits
+    # With the cache, the IR is only built once a phase misses the cache
+    ir = None if use_cache else create_model_ir(school, processed_data_folder)
+    digest = instance_digest(school, processed_data_folder) if use_cache else None
+
+    # Upper bounds only with --bounds, they reuse the IR when it was built anyway
+    bounds = ObjectiveBounds(school, processed_data_folder, balance_attributes, LP_TIMELIMIT, ir) if upper_bounds else None
+    diagnosis = None
 
     # 1. Try decreasing min_prefs from 5 to 0 with normal deviation
     for min_prefs in reversed(range(min_prefs_start + 1)):
+        # A resumed run skips the phases the interrupted run had already finished
+        if resume is not None and resume.skips(min_prefs, deviation):
+            continue
         print(f"Phase 1: Trying min_prefs_per_kid={min_prefs}, deviation={deviation}")
-        model, x = create_model(school, processed_data_folder, min_prefs, deviation)
-        solution = solve_model(model, x, results_folder, timestamp, timelimit, min_prefs, deviation)
+        if use_cache:
+            model, x, ir = load_model(school, processed_data_folder, min_prefs, deviation, digest, ir)
+        else:
+            model, x = lower_model(ir.set_limits(min_prefs, deviation))
+        solution, status = solve_model(model, x, results_folder, timestamp, timelimit, min_prefs, deviation, polisher, pool, bounds, solver_log, stop_rules, priority,
+                                       checkpointer, resume)
+        resume = None
         if solution:
             df = format_solution(solution)
-            return df, timestamp
+            if checkpointer is not None:
+                checkpointer.discard()
+            if pool is not None:
+                pool.export(results_folder, "CP", timestamp, min_prefs, deviation)
+            return df, timestamp, (min_prefs, deviation)
+
+        # A proven infeasible model is explained, lowering min_prefs only helps if the explanation needs it.
+        # Any other status proves nothing, so an older explanation no longer applies
+        diagnosis = None
+        if status == "INFEASIBLE":
+            diagnosis, ir = diagnose(ir, school, processed_data_folder, min_prefs, deviation, timelimit)
+            if diagnosis.status == "INFEASIBLE" and not diagnosis.involves_fairness():
+                break
+
+    # Only when the last phase 1 attempt is explained without fairness and balance rows, dropping the balance
+    # constraint can not help either
+    if (diagnosis is not None and diagnosis.status == "INFEASIBLE" and not diagnosis.involves_fairness()
+            and not diagnosis.involves_balance()):
+        print("The constraints above can not be met by relaxing min_prefs_per_kid or deviation.")
+        print("No solution found in any configuration.")
+        return None, timestamp, None
 
     # 2. Try again with no balance constraint (deviation = 1.0)
     for min_prefs in reversed(range(min_prefs_start + 1)):
+        if resume is not None and resume.skips(min_prefs, 1.0):
+            continue
         print(f"Phase 2: Trying min_prefs_per_kid={min_prefs}, deviation=1.0 (no balance constraint)")
-        model, x = create_model(school, processed_data_folder, min_prefs, 1.0)
-        solution = solve_model(model, x, results_folder, timestamp, timelimit, min_prefs, 1.0)
+        if use_cache:
+            model, x, ir = load_model(school, processed_data_folder, min_prefs, 1.0, digest, ir)
+        else:
+            model, x = lower_model(ir.set_limits(min_prefs, 1.0))
+        solution, status = solve_model(model, x, results_folder, timestamp, timelimit, min_prefs, 1.0, polisher, pool, bounds, solver_log, stop_rules, priority,
+                                       checkpointer, resume)
+        resume = None
         if solution:
             df = format_solution(solution)
-            return df, timestamp
+            if checkpointer is not None:
+                checkpointer.discard()
+            if pool is not None:
+                pool.export(results_folder, "CP", timestamp, min_prefs, 1.0)
+            return df, timestamp, (min_prefs, 1.0)
+
+        if status == "INFEASIBLE":
+            diagnosis, ir = diagnose(ir, school, processed_data_folder, min_prefs, 1.0, timelimit)
+            if diagnosis.status == "INFEASIBLE" and not diagnosis.involves_fairness():
+                break
 
     print("No solution found in any configuration.")
-    return None, timestamp
+    return None, timestamp, None
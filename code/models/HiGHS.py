@@ -0,0 +1,185 @@
+from scipy.optimize import milp, LinearConstraint, Bounds
+import numpy as np
+import pandas as pd
+import time
+import csv
+import os
+from datetime import datetime
+from helpers import read_dfs, read_variables
+from instance import encode_instance
+from code.models.IR import build_model_ir, linearize
+from code.models.bounds import LP_TIMELIMIT, ObjectiveBounds
+from code.models.search_log import SOLVER_LOG, relative_gap, summary_row
+
+MILP_STATUS = {0: "OPTIMAL", 1: "TIME_LIMIT", 2: "INFEASIBLE", 3: "UNBOUNDED", 4: "OTHER"}
+
+def get_balance_attributes(data):
+    # Same hard balance attributes as the SCIP model so both MIP backends can be compared
+    attributes = ['Gender', 'Grade', 'Extra Care']
+    if 'Behavior' in data.info_students.columns:
+        attributes.append('Behavior')
+    return attributes
+
+def lower_model(ir):
+    # HiGHS only takes linear rows, so indicators and reifications are linearized
+    linear = linearize(ir)
+
+    # milp minimizes, the IR objective is maximized
+    return {
+        "c": -linear.objective,
+        "constraints": LinearConstraint(linear.A, linear.row_lo, linear.row_hi),
+        "integrality": np.ones(linear.n_vars),
+        "bounds": Bounds(linear.lb, linear.ub),
+    }
+
+# FINAL MODEL CREATION
+def create_model_ir(school, processed_data_folder, debug_names=False):
+    data = read_dfs(school, processed_data_folder)
+    instance = encode_instance(data, read_variables(data))
+
+    # Built once per instance, min_prefs and deviation are set with ModelIR.set_limits
+    return build_model_ir(instance, get_balance_attributes(data), debug_names)
+
+def create_model(school, processed_data_folder, min_prefs_per_kid, deviation, debug_names=False):
+    ir = create_model_ir(school, processed_data_folder, debug_names)
+    return lower_model(ir.set_limits(min_prefs_per_kid, deviation)), ir
+
+# RUNNING THE MODEL
+class HighsObjectiveLogger:
+    def __init__(self, results_folder, timestamp, timelimit, min_prefs_per_kid, deviation):
+        self.start_time = time.time()
+        self.best_objective = None
+        self.best_bound = None
+        self.solution_count = 0
+        self.timestamp = timestamp
+        self.school = os.path.basename(os.path.dirname(results_folder))
+
+        # Setup paths
+        log_folder = os.path.join(results_folder, "logs")
+        os.makedirs(log_folder, exist_ok=True)
+        self.log_file_path = os.path.join(log_folder, f"HIGHS_{self.timestamp}.csv")
+
+        # Same layout as the CP and ILP logs so the evaluation and plots can read it
+        with open(self.log_file_path, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(["Run Config"])
+            writer.writerow(["School", self.school])
+            writer.writerow(["Method", "HIGHS"])
+            writer.writerow(["Min Prefs Per Kid", min_prefs_per_kid])
+            writer.writerow(["Deviation", deviation])
+            writer.writerow(["Time Limit (s)", timelimit])
+            writer.writerow([])
+            writer.writerow(["Timestamp", "Solution #", "Elapsed Time (s)", "Objective Value", "Best Bound", "Gap"])
+
+    def log_solution(self, current_objective, best_bound=None):
+        # scipy's milp has no incumbent callback, so only the final solution is reported
+        elapsed = time.time() - self.start_time
+        self.solution_count += 1
+        self.best_bound = best_bound
+
+        if self.best_objective is None or current_objective >= self.best_objective:
+            self.best_objective = current_objective
+            print(f"[{elapsed:.1f}s] New best solution #{self.solution_count}, objective = {current_objective}")
+            self.save_to_csv(elapsed, current_objective)
+
+    def save_to_csv(self, elapsed, current_objective):
+        timestamp = datetime.now().strftime("%d-%m_%H:%M:%S")
+        with open(self.log_file_path, mode='a', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow([timestamp, self.solution_count, round(elapsed, 3), current_objective, self.best_bound,
+                             relative_gap(current_objective, self.best_bound)])
+
+    def end_search(self, status_str, best_bound=None, upper_bound=None, stop_reason=None):
+        elapsed = time.time() - self.start_time
+        if self.best_objective is not None:
+            print(f"[{elapsed:.1f}s] Search ended. Best solution #{self.solution_count}, objective = {self.best_objective}")
+            self.save_to_csv(elapsed, self.best_objective)
+
+            # Solver bound and relaxation bound before the final status, the evaluation reports the gap to the tighter one
+            with open(self.log_file_path, mode='a', newline='') as file:
+                writer = csv.writer(file)
+                if best_bound is not None:
+                    writer.writerow(["Best Bound", best_bound])
+                if upper_bound is not None:
+                    writer.writerow(["Upper Bound", upper_bound])
+                # The stop rule that ended the search, if any, follows the status
+                writer.writerow(["Status", status_str] + ([stop_reason] if stop_reason else []))
+
+        # HiGHS only logs once the solve is over, so there is no need for a background writer here
+        with open(self.log_file_path, mode='a', newline='') as file:
+            csv.writer(file).writerow(summary_row())
+
+def solve_model(model, results_folder, timestamp, timelimit, min_prefs_per_kid, deviation, bounds=None, solver_log=SOLVER_LOG,
+                stop_rules=None):
+    logger = HighsObjectiveLogger(results_folder, timestamp, timelimit, min_prefs_per_kid, deviation)
+
+    # HiGHS runs single-threaded through scipy, like the other backends.
+    # scipy can not send the HiGHS log to a file, it is only shown at the highest verbosity
+    options = {"time_limit": timelimit, "disp": solver_log > 1}
+
+    # scipy has no callbacks, so only the gap rule can stop HiGHS early
+    if stop_rules is not None and stop_rules.gap is not None:
+        options["mip_rel_gap"] = stop_rules.gap
+    if stop_rules is not None and (stop_rules.plateau is not None or stop_rules.target is not None):
+        print("HiGHS only supports the gap stop rule, the plateau and target rules are ignored")
+    result = milp(**model, options=options)
+
+    # milp minimizes the negated objective, so its dual bound is negated as well
+    best_bound = -result.mip_dual_bound if result.get("mip_dual_bound") is not None else None
+
+    upper_bound = None
+    stop_reason = None
+    if result.x is not None:
+        logger.log_solution(-result.fun, best_bound)
+        if bounds is not None:
+            upper_bound = bounds.upper_bound(min_prefs_per_kid, deviation)
+
+        # HiGHS reports a search ended by the gap rule as optimal, the open gap shows it stopped early
+        gap = relative_gap(-result.fun, best_bound)
+        if stop_rules is not None and stop_rules.gap is not None and result.status == 0 and gap is not None and gap > 1e-6:
+            stop_reason = "gap"
+
+    logger.end_search(MILP_STATUS.get(result.status, "OTHER"), best_bound, upper_bound, stop_reason)
+    return result
+
+def format_solution(result, ir):
+    values = np.round(result.x[ir.x]).astype(int)
+    assignments = [(ir.students[s], ir.teachers[t]) for s, t in zip(*np.nonzero(values))]
+
+    df = pd.DataFrame(assignments, columns=["Student", "Teacher"])
+    df = df.sort_values(by="Teacher")
+
+    return df
+
+def run_highs(school, processed_data_folder, timelimit, min_prefs_start, deviation, solver_log=SOLVER_LOG, stop_rules=None, upper_bounds=False):
+    folder = 'data/results'
+    timestamp = datetime.now().strftime("%d-%m_%H:%M")
+    results_folder = os.path.join(folder, school, "HIGHS")
+
+    # Build the model representation once, every phase only changes its limits
+    ir = create_model_ir(school, processed_data_folder)
+    # Upper bounds only with --bounds, they reuse the IR
+    bounds = None
+    if upper_bounds:
+        bounds = ObjectiveBounds(school, processed_data_folder, get_balance_attributes(read_dfs(school, processed_data_folder)), LP_TIMELIMIT, ir)
+
+    # 1. Try decreasing min_prefs from 5 to 0 with normal deviation
+    for min_prefs in reversed(range(min_prefs_start + 1)):
+        print(f"Phase 1: Trying min_prefs_per_kid={min_prefs}, deviation={deviation}")
+        model = lower_model(ir.set_limits(min_prefs, deviation))
+        result = solve_model(model, results_folder, timestamp, timelimit, min_prefs, deviation, bounds, solver_log, stop_rules)
+        if result.x is not None:
+            df = format_solution(result, ir)
+            return df, timestamp, (min_prefs, deviation)
+
+    # 2. Try again with no balance constraint (deviation=1.0)
+    for min_prefs in reversed(range(min_prefs_start + 1)):
+        print(f"Phase 2: Trying min_prefs_per_kid={min_prefs}, deviation=1.0")
+        model = lower_model(ir.set_limits(min_prefs, 1.0))
+        result = solve_model(model, results_folder, timestamp, timelimit, min_prefs, 1.0, bounds, solver_log, stop_rules)
+        if result.x is not None:
+            df = format_solution(result, ir)
+            return df, timestamp, (min_prefs, 1.0)
+
+    print("No solution found in any configuration.")
+    return None, timestamp, None
@@ -1,323 +1,261 @@
 from pyscipopt import Model
 from pyscipopt import quicksum
-from pyscipopt import Eventhdlr, SCIP_EVENTTYPE
+from pyscipopt import Eventhdlr, SCIP_EVENTTYPE, SCIP_STAGE
+import numpy as np
 import pandas as pd
 import time
 import csv
 import os
-import math
 from datetime import datetime
-from helpers import create_preference_matrix, read_dfs, read_variables, estimated_max_balance_penalty, estimated_max_fairness
+from helpers import read_dfs, read_variables
+from instance import encode_instance
+from code.models.IR import build_model_ir, linearize
+from code.models.cache import instance_digest, model_key, get_cached_model, put_cached_model
+from code.models.polish import Polisher
+from code.models.pool import SolutionPool
+from code.models.bounds import LP_TIMELIMIT, ObjectiveBounds
+from code.models.search_log import SOLVER_LOG, LogWriter, finite_bound, relative_gap, summary_row
+from code.models.stopping import StopMonitor
+from code.models.checkpoint import Checkpointer
+
+def get_balance_attributes(data):
+    # Attributes that are balanced as hard constraints
+    attributes = ['Gender', 'Grade', 'Extra Care']
 
-def create_initial_model(students, teachers, data, variables):
-    model = Model("ilp")
-
-    # Decision variables
-    # x[s][t] = 1 if student s assigned to teacher t
-    x = {}
-    for s in students:
-        for t in teachers:
-            x[s, t] = model.addVar(vtype="BINARY", name=f"x_{s}_{t}")
-
-    model = add_objective(model, students, teachers, x, data, variables)
-
-    return model, x
-
-def add_objective(model, students, teachers, x, data, variables):
-    attributes_to_balance = ['Gender', 'Grade', 'Extra Care']
+    # Add balance constraints for behavior if specified
     if 'Behavior' in data.info_students.columns:
-        attributes_to_balance.append('Behavior')
-
-    balance_penalty_terms = add_balance(model, x, attributes_to_balance, teachers, data)
-
-    preferences = create_preference_matrix(data, variables)
-    fairness_layers = add_fairness_layers(model, x, students, teachers, preferences)
-    fairness_terms = []
-    # Get highest number of preferences given by any student
-    max_k = max(k for k, _ in fairness_layers) if fairness_layers else 1
-    for k, met_k in fairness_layers:
-        # Each layer is weighted exponentially based on how many preferences are met
-        # Higher k means more preferences met, so weight is lower to focus more on
-        # improving fairness for students with fewer preferences met first
-        weight = 10 ** (max_k - k)
-        fairness_terms.append(weight * met_k)
-
-    print("Fairness terms (ILP):", fairness_terms[:5])
+        attributes.append('Behavior')
+    else:
+        print("No 'Behavior' attribute found in the data. Skipping balancing constraints for behavior.")
 
-    # Scale each objective by its estimated max value to normalize
-    balance_scale = 1 / max(1, estimated_max_balance_penalty(data, attributes_to_balance, teachers))
-    fairness_scale = 1 / max(1, estimated_max_fairness(fairness_layers))
+    return attributes
 
-    # Apply scaling to weights
-    balance_weight = 2 * balance_scale
-    fairness_weight = 1 * fairness_scale
+def lower_model(ir):
+    model = Model("ilp")
+    names = ir.var_names if ir.var_names is not None else [""] * ir.n_vars
+
+    # Indicator rows are replaced by big-M rows, AND/OR reifications use SCIP's own constraints
+    linear = linearize(ir, reifications=False)
+
+    # Variables are created in IR order, so model.getVars()[i] is IR variable i
+    variables = []
+    for i, (lb, ub) in enumerate(zip(linear.lb.tolist(), linear.ub.tolist())):
+        vtype = "BINARY" if lb == 0 and ub == 1 else "INTEGER"
+        variables.append(model.addVar(vtype=vtype, lb=lb, ub=ub, name=names[i]))
+
+    A = linear.A
+    for r in range(linear.n_rows):
+        start, end = A.indptr[r], A.indptr[r + 1]
+        expr = quicksum(coef * variables[c] for c, coef in zip(A.indices[start:end].tolist(), A.data[start:end].tolist()))
+        lo, hi = linear.row_lo[r], linear.row_hi[r]
+        if lo == hi:
+            model.addCons(expr == lo)
+        elif np.isfinite(lo) and np.isfinite(hi):
+            model.addCons((expr >= lo) <= hi)
+        elif np.isfinite(lo):
+            model.addCons(expr >= lo)
+        elif np.isfinite(hi):
+            model.addCons(expr <= hi)
+
+    # res == a AND b
+    for res, a, b in zip(linear.and_res.tolist(), linear.and_a.tolist(), linear.and_b.tolist()):
+        model.addConsAnd([variables[a], variables[b]], variables[res])
+
+    # res == OR(ops)
+    for i, res in enumerate(linear.or_res.tolist()):
+        model.addConsOr([variables[op] for op in linear.or_ops[linear.or_ptr[i]:linear.or_ptr[i + 1]].tolist()], variables[res])
 
     # Set objective
-    model.setObjective(
-        fairness_weight * quicksum(fairness_terms)
-        - balance_weight * quicksum(balance_penalty_terms),
-        "maximize"
-    )
-
-    return model
-
-# SOFT CONSTRAINTS
-def add_balance(model, x, attributes, teachers, data):
-    balance_penalty_terms = []
-    max_students = len(data.info_students)
-
-    for attribute in attributes:
-        # Get unique values for the attribute
-        categories = data.info_students[attribute].unique()
-        # Get target per teacher for each category
-        category_students = {cat: data.info_students[data.info_students[attribute] == cat]['Student'].tolist() for cat in categories}
-        target_per_teacher = {cat: len(category_students[cat]) / len(teachers) for cat in categories}
-
-        for t in teachers:
-            for cat in categories:
-                # Get the list of students in this category
-                assigned_count = sum(x[s, t] for s in category_students[cat])
-                target = target_per_teacher[cat]
-
-                # Calculate over and under deviation
-                over_dev = model.addVar(vtype="INTEGER", lb=0, ub=max_students, name=f"over_dev_{cat}_{t}")
-                under_dev = model.addVar(vtype="INTEGER", lb=0, ub=max_students, name=f"under_dev_{cat}_{t}")
-
-                # Measures deviation from target by splitting into over- and under-assignment penalties
-                model.addCons(assigned_count - int(target) == over_dev - under_dev)
-                balance_penalty_terms.append(over_dev)
-                balance_penalty_terms.append(under_dev)
-
-    return balance_penalty_terms
-
-def add_fairness_layers(model, x, students, teachers, preferences):
-    all_layer_vars = []
-
-    for s1 in students:
-        preferred_students = [s2 for s2 in students if s1 != s2 and preferences.loc[s1, s2] == 1]
-        num_prefs = len(preferred_students)
-
-        # Skip students with no preferences
-        if num_prefs == 0:
-            continue
+    objective = np.flatnonzero(linear.objective)
+    model.setObjective(quicksum(coef * variables[i] for i, coef in zip(objective.tolist(), linear.objective[objective].tolist())), "maximize")
 
-        satisfied_bools = []
-        for s2 in preferred_students:
-            # Create var that is 1 if s1 and s2 assigned to same teacher
-            together = model.addVar(vtype="BINARY", name=f"together_{s1}_{s2}")
-            model.addCons(together <= quicksum(x[s1, t] * x[s2, t] for t in teachers))
-            model.addCons(together >= quicksum(x[s1, t] + x[s2, t] - 1 for t in teachers))
-            satisfied_bools.append(together)
-
-        # Count the number of satisfied preferences for this student
-        num_satisfied = model.addVar(vtype="INTEGER", lb=0, ub=num_prefs, name=f"satisfied_count_{s1}")
-        model.addCons(num_satisfied == quicksum(satisfied_bools))
-
-        for k in range(1, num_prefs + 1):
-            # Create var for each possible k to track if at least k preferences are met
-            met_k = model.addVar(vtype="BINARY", name=f"{s1}_at_least_{k}_prefs")
-            # If met_k is 1 then at least k preferences should be met
-            model.addCons(num_satisfied >= k - (1 - met_k) * num_prefs)
-            # If met_k is 0 then less than k preferences should be met
-            model.addCons(num_satisfied <= num_prefs - (1 - met_k))
-            all_layer_vars.append((k, met_k))
-
-    return all_layer_vars
-
-# HARD CONSTRAINTS
-def add_balance_constraints(model, attribute, deviation, x, teachers, data):
-    # Get unique categories for the attribute
-    categories = data.info_students[attribute].unique()
-    # Get target per teacher for each category
-    category_students = {cat: data.info_students[data.info_students[attribute] == cat]['Student'].tolist() for cat in categories}
-    target_per_teacher = {cat: len(category_students[cat]) / len(teachers) for cat in categories}
-
-    for t in teachers:
-        for cat in categories:
-            # Calculate the lower and upper bounds for the number of students in this category
-            lower_bound = math.floor((1 - deviation) * target_per_teacher[cat])
-            upper_bound = math.ceil((1 + deviation) * target_per_teacher[cat])
-
-            # Get the list of students in this category
-            students_in_cat = category_students[cat]
-
-            # Add the balancing constraints for this category and teacher
-            model.addCons(quicksum(x[s, t] for s in students_in_cat) >= lower_bound,
-                name=f"{attribute}_{cat}_{t}_min")
-            model.addCons(quicksum(x[s, t] for s in students_in_cat) <= upper_bound,
-                name=f"{attribute}_{cat}_{t}_max")
-
-    return model
-
-def add_fairness_constraints(model, x, students, teachers, preferences, min_prefs_per_kid):
-    for s1 in students:
-        # Only add constraints if the minimum preference is set greater than 0
-        if min_prefs_per_kid > 0:
-            preferred_students = [s2 for s2 in students if s1 != s2 and preferences.loc[s1, s2] == 1]
-
-            # Continue if s1 has any preferred students
-            if preferred_students:
-                together_vars = []
-
-                for s2 in preferred_students:
-                    # Add var together = 1 if both students are assigned to the same teacher
-                    together = model.addVar(vtype="BINARY", name=f"together_{s1}_{s2}")
-                    model.addCons(together <= quicksum(x[s1, t] * x[s2, t] for t in teachers))
-                    model.addCons(together >= quicksum(x[s1, t] + x[s2, t] - 1 for t in teachers))
-                    together_vars.append(together)
-
-                # Require that the sum of 'together' variables is at least min_prefs_per_kid for student s1
-                model.addCons(quicksum(together_vars) >= min_prefs_per_kid, name=f"{s1}_at_least_one_pref")
-
-    return model
-
-def add_hard_constraints(model, x, students, teachers, data, variables, preferences, min_prefs_per_kid, deviation):
-    for s1 in students:
-        # Each student is assigned to exactly one teacher
-        model.addCons(quicksum(x[s1, t] for t in teachers) == 1, name=f"Student_{s1}_assigned_once")
-
-    # Assignment constraints
-    for _, (s1, s2, together) in data.constraints_students.iterrows():
-        for t in teachers:
-            if together == "Yes":
-                # Students must be together
-                model.addCons(x[s1, t] == x[s2, t])
-            elif together == "No":
-                # Students must not be together
-                model.addCons(x[s1, t] + x[s2, t] <= 1)
-
-    for _, (s, t, together) in data.constraints_teachers.iterrows():
-        if together == "Yes":
-            # Student must be with the teacher
-            model.addCons(x[s, t] == 1)
-        elif together == "No":
-            # Student must not be with the teacher
-            model.addCons(x[s, t] == 0)
-
-    for t in teachers:
-        # Group size constraints
-        model.addCons(quicksum(x[s, t] for s in students) >= variables.min_group_size, name=f"Teacher_{t}_min_size")
-        model.addCons(quicksum(x[s, t] for s in students) <= variables.max_group_size, name=f"Teacher_{t}_max_size")
-
-    # Max extra care constraints
-    extra_care_values = dict(zip(data.info_students['Student'], data.info_students['Extra Care'].map({'Yes': 1, 'No': 0})))
-    for t in teachers:
-        model.addCons(quicksum(x[s, t] * extra_care_values[s] for s in students) <= variables.max_extra_care,
-            name=f"max_extra_care_{t}")
-
-    # Add fairness constraints
-    model = add_fairness_constraints(model, x, students, teachers, preferences, min_prefs_per_kid)
-
-    # Balancing constraints
-    model = add_balance_constraints(model, 'Gender', deviation, x, teachers, data)
-    model = add_balance_constraints(model, 'Grade', deviation, x, teachers, data)
-    model = add_balance_constraints(model, 'Extra Care', deviation, x, teachers, data)
+    # Map variables back to (student, teacher) names
+    x = {(s, t): variables[ir.x[i, j]] for i, s in enumerate(ir.students) for j, t in enumerate(ir.teachers)}
 
-    # Add balance constraints for behavior if specified
-    if 'Behavior' in data.info_students.columns:
-        model = add_balance_constraints(model, 'Behavior', deviation, x, teachers, data)
-    else:
-        print("No 'Behavior' attribute found in the data. Skipping balancing constraints for behavior.")
-
-    return model
+    return model, x
 
 # FINAL MODEL CREATION
-def create_model(school, processed_data_folder, min_prefs_per_kid, deviation):
+def create_model_ir(school, processed_data_folder, debug_names=False):
     data = read_dfs(school, processed_data_folder)
-    variables = read_variables(data)
+    instance = encode_instance(data, read_variables(data))
 
-    students = data.info_students['Student'].tolist()
-    teachers = data.info_teachers['Teacher'].tolist()
+    # Built once per instance, min_prefs and deviation are set with ModelIR.set_limits
+    return build_model_ir(instance, get_balance_attributes(data), debug_names)
 
-    # Initialize model
-    model, x = create_initial_model(students, teachers, data, variables)
+def create_model(school, processed_data_folder, min_prefs_per_kid, deviation, debug_names=False):
+    ir = create_model_ir(school, processed_data_folder, debug_names)
+    return lower_model(ir.set_limits(min_prefs_per_kid, deviation))
 
-    # Hard constraints
-    preference_matrix = create_preference_matrix(data, variables)
-    model = add_hard_constraints(model, x, students, teachers, data, variables, preference_matrix, min_prefs_per_kid, deviation)
+def read_model(path, meta):
+    model = Model("ilp")
+    model.readProblem(path)
 
+    # SCIP keeps the variable order of the written problem, so IR indices still apply
+    variables = model.getVars()
+    x = {}
+    for s, row in zip(meta["students"], meta["x"]):
+        for t, index in zip(meta["teachers"], row):
+            x[(s, t)] = variables[index]
     return model, x
 
+def load_model(school, processed_data_folder, min_prefs_per_kid, deviation, digest, ir=None):
+    # Returns the model from the cache when possible, the IR is only built on a cache miss
+    key = model_key(digest, method="ILP", min_prefs=min_prefs_per_kid, deviation=deviation, debug_names=False)
+    cached = get_cached_model(school, key, "cip")
+    if cached:
+        model, x = read_model(*cached)
+        return model, x, ir
+
+    if ir is None:
+        ir = create_model_ir(school, processed_data_folder)
+    model, x = lower_model(ir.set_limits(min_prefs_per_kid, deviation))
+    meta = {"students": np.asarray(ir.students).tolist(), "teachers": np.asarray(ir.teachers).tolist(), "x": ir.x.tolist()}
+    put_cached_model(school, key, "cip", lambda path: model.writeProblem(path, verbose=False), meta)
+    return model, x, ir
+
 # RUNNING THE MODEL
 class ILPObjectiveLogger:
-    def __init__(self, results_folder, timestamp, timelimit, min_prefs_per_kid, deviation):
-        # (model, results_folder, timestamp, timelimit, min_prefs_per_kid, deviation
-        self.start_time = time.time()
+    def __init__(self, results_folder, timestamp, timelimit, min_prefs_per_kid, deviation, pool=None, x=None, monitor=None,
+                 checkpointer=None, resumed_from=None):
+        # A resumed search continues the elapsed time of its checkpoint
+        self.start_time = time.time() - (resumed_from or 0)
         self.best_objective = None
         self.solution_count = 0
+        self.pool = pool
+        self.x = x
+        self.monitor = monitor
+        self.checkpointer = checkpointer
         self.results_folder = results_folder
         self.timestamp = timestamp
         self.school =  os.path.basename(os.path.dirname(results_folder))
 
+        # Search statistics of the latest solution, written next to its objective
+        self.best_bound = None
+        self.nodes = 0
+        self.lp_iterations = 0
+
         # Setup paths
         log_folder = os.path.join(results_folder, "logs")
         os.makedirs(log_folder, exist_ok=True)
         self.log_file_path = os.path.join(log_folder, f"ILP_{self.timestamp}.csv")
 
-        # Open the CSV file and write headers if it doesn't exist
-        with open(self.log_file_path, mode='w', newline='') as file:
-            writer = csv.writer(file)
-            # Add metadata to the CSV file
-            writer.writerow(["Run Config"])
-            writer.writerow(["School", self.school])
-            writer.writerow(["Method", "CP"])
-            writer.writerow(["Min Prefs Per Kid", min_prefs_per_kid])
-            writer.writerow(["Deviation", deviation])
-            writer.writerow(["Time Limit (s)", timelimit])
-            writer.writerow([])
-            writer.writerow(["Timestamp", "Solution #", "Elapsed Time (s)", "Objective Value"])
+        # Open the CSV file and write headers, a resumed search keeps appending to the log of its run
+        if resumed_from is not None:
+            with open(self.log_file_path, mode='a', newline='') as file:
+                csv.writer(file).writerow(["Resumed", round(resumed_from, 3)])
+        else:
+            with open(self.log_file_path, mode='w', newline='') as file:
+                writer = csv.writer(file)
+                # Add metadata to the CSV file
+                writer.writerow(["Run Config"])
+                writer.writerow(["School", self.school])
+                writer.writerow(["Method", "ILP"])
+                writer.writerow(["Min Prefs Per Kid", min_prefs_per_kid])
+                writer.writerow(["Deviation", deviation])
+                writer.writerow(["Time Limit (s)", timelimit])
+                writer.writerow([])
+                writer.writerow(["Timestamp", "Solution #", "Elapsed Time (s)", "Objective Value", "Best Bound", "Gap", "Nodes", "LP Iterations"])
+
+        # Rows are appended by a background thread
+        self.writer = LogWriter(self.log_file_path)
+        self.solver_log_path = os.path.join(log_folder, f"ILP_{self.timestamp}.log")
 
     def log_solution(self, model):
         if model.getNSols() == 0:
             return  # No solution to log
 
         try:
-            current_objective = model.getSolObjVal(model.getBestSol())
+            best = model.getBestSol()
+            current_objective = model.getSolObjVal(best)
         except Exception as e:
             print(f"Warning: Unable to retrieve objective value: {e}")
             return
 
+        # SCIP only reports new best solutions, each of them is offered to the pool and checkpointed
         elapsed = time.time() - self.start_time
+        if self.pool is not None or self.checkpointer is not None:
+            solution = {key: int(model.getSolVal(best, var) > 0.5) for key, var in self.x.items()}
+            if self.pool is not None:
+                self.pool.add(solution, current_objective)
+            if self.checkpointer is not None:
+                self.checkpointer.update(solution, current_objective, elapsed)
+
         self.solution_count += 1
 
+        # Heuristics already find solutions in INITSOLVE, where SCIP has no bound or search statistics yet
+        if model.getStage() >= SCIP_STAGE.SOLVING:
+            self.best_bound = finite_bound(model.getDualbound())
+            self.nodes = model.getNNodes()
+            self.lp_iterations = model.getNLPIterations()
+
         if self.best_objective is None or current_objective >= self.best_objective:
             self.best_objective = current_objective
             print(f"[{elapsed:.1f}s] New best solution #{self.solution_count}, objective = {current_objective}")
             self.save_to_csv(elapsed, current_objective)
+            if self.monitor is not None:
+                self.monitor.solution(current_objective, self.best_bound)
+
+    def log_polished(self, current_objective):
+        # Improvements found by polishing are logged like solver solutions
+        elapsed = time.time() - self.start_time
+        self.solution_count += 1
+        self.best_objective = current_objective
+        print(f"[{elapsed:.1f}s] Polished solution #{self.solution_count}, objective = {current_objective}")
+        self.save_to_csv(elapsed, current_objective)
 
     def save_to_csv(self, elapsed, current_objective):
         timestamp = datetime.now().strftime("%d-%m_%H:%M:%S")
-        with open(self.log_file_path, mode='a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([timestamp, self.solution_count, round(elapsed, 3), current_objective])
+        self.writer.write([timestamp, self.solution_count, round(elapsed, 3), current_objective, self.best_bound,
+                           relative_gap(current_objective, self.best_bound), self.nodes, self.lp_iterations])
 
-    def end_search(self, status_str):
+    def end_search(self, status_str, best_bound=None, upper_bound=None, presolve_time=None, stop_reason=None):
         elapsed = time.time() - self.start_time
         if self.best_objective is not None:
             print(f"[{elapsed:.1f}s] Search ended. Best solution #{self.solution_count}, objective = {self.best_objective}")
             self.save_to_csv(elapsed, self.best_objective)
 
-            # Write final status to logging
-            with open(self.log_file_path, mode='a', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow(["Status", status_str])
+            # Solver bound and relaxation bound before the final status, the evaluation reports the gap to the tighter one
+            if finite_bound(best_bound) is not None:
+                self.writer.write(["Best Bound", best_bound])
+            if upper_bound is not None:
+                self.writer.write(["Upper Bound", upper_bound])
+            # The stop rule that ended the search, if any, follows the status
+            self.writer.write(["Status", status_str] + ([stop_reason] if stop_reason else []))
+        self.writer.write(summary_row(presolve_time))
+
+        # Everything queued is on disk once the search has ended
+        self.writer.close()
 
 class BestSolutionLogger(Eventhdlr):
-    def __init__(self, logger):
+    def __init__(self, logger, monitor=None):
         self.logger = logger
+        self.monitor = monitor
+
+    def watches_nodes(self):
+        # Plateau and gap rules are checked after every solved node, the target only needs new solutions
+        return self.monitor is not None and (self.monitor.rules.plateau is not None or self.monitor.rules.gap is not None)
 
     def eventinit(self):
         # Catch events when a new best solution is found
         self.model.catchEvent(SCIP_EVENTTYPE.BESTSOLFOUND, self)
+        if self.watches_nodes():
+            self.model.catchEvent(SCIP_EVENTTYPE.NODESOLVED, self)
 
     def eventexit(self):
         self.model.dropEvent(SCIP_EVENTTYPE.BESTSOLFOUND, self)
+        if self.watches_nodes():
+            self.model.dropEvent(SCIP_EVENTTYPE.NODESOLVED, self)
 
     def eventexec(self, event):
-        self.logger.log_solution(self.model)
+        if event.getType() == SCIP_EVENTTYPE.BESTSOLFOUND:
+            self.logger.log_solution(self.model)
+        else:
+            self.monitor.check_plateau()
+            self.monitor.best_bound(self.model.getDualbound())
         return {"result": None}
 
-def solve_model(model, results_folder, timestamp, timelimit, min_prefs_per_kid, deviation):
+def solve_model(model, x, results_folder, timestamp, timelimit, min_prefs_per_kid, deviation, polisher=None, pool=None, bounds=None,
+                solver_log=SOLVER_LOG, stop_rules=None, checkpointer=None, resume=None):
     model.setParam("limits/time", timelimit)
 
     # Set seed and settings to ensure reproducibility and enable single-threaded search
@@ -326,56 +264,137 @@ def solve_model(model, results_folder, timestamp, timelimit, min_prefs_per_kid,
     model.setParam("randomization/permutevars", False)
     model.setParam("parallel/maxnthreads", 1)
 
-    # Set up and attach the logger callback
-    logger = ILPObjectiveLogger(results_folder, timestamp, timelimit, min_prefs_per_kid, deviation)
-    model.includeEventhdlr(BestSolutionLogger(logger), "BestSolutionLogger", "Logs when a better solution is found")
-
-    # Solve the model
-    model.optimize()
+    # The pool only keeps alternatives of the phase that is solved now
+    if pool is not None:
+        pool.clear()
+
+    # Early stop rules interrupt SCIP from its events, there is no watch thread since nodes are solved all the time
+    monitor = None
+    if stop_rules is not None and stop_rules.any():
+        monitor = StopMonitor(stop_rules, model.interruptSolve, watch=False)
+
+    # A resumed phase gets what is left of its time limit and starts from the checkpointed assignment
+    resumed_from = None
+    if resume is not None:
+        resumed_from = resume.elapsed
+        model.setParam("limits/time", max(timelimit - resume.elapsed, 0))
+        hint = model.createPartialSol()
+        for key, value in resume.hint(x).items():
+            model.setSolVal(hint, x[key], value)
+        model.addSol(hint)
+
+    # Set up and attach the logger callback, new best solutions are checkpointed from it
+    logger = ILPObjectiveLogger(results_folder, timestamp, timelimit, min_prefs_per_kid, deviation, pool, x, monitor,
+                                checkpointer, resumed_from)
+    if checkpointer is not None:
+        checkpointer.start(min_prefs_per_kid, deviation)
+    model.includeEventhdlr(BestSolutionLogger(logger, monitor), "BestSolutionLogger", "Logs when a better solution is found")
+
+    # SCIP writes its own log file, stdout only shows it at the highest verbosity
+    if solver_log > 0:
+        model.setLogfile(logger.solver_log_path)
+    model.hideOutput(solver_log < 2)
+
+    # Solve the model, without holding the GIL so the log and checkpoint threads can write during the search
+    model.optimizeNogil()
+    if monitor is not None:
+        monitor.close()
 
     # Log best solution
     logger.log_solution(model)
+    status_str = model.getStatus()
+
+    solution = None
+    if model.getNSols() > 0:
+        solution = {key: int(model.getVal(var) > 0.5) for key, var in x.items()}
+
+        # A search stopped by the time limit or a stop rule is polished with local moves before the log is closed
+        if status_str in ("timelimit", "userinterrupt") and polisher is not None:
+            solution = polisher.polish(solution, min_prefs_per_kid, deviation, logger.log_polished)
+            if pool is not None:
+                pool.add(solution, logger.best_objective)
+            if checkpointer is not None:
+                checkpointer.update(solution, logger.best_objective, time.time() - logger.start_time)
 
     # Final log at the end
-    status_str = model.getStatus()
-    logger.end_search(status_str)
-    return model
+    upper_bound = bounds.upper_bound(min_prefs_per_kid, deviation) if solution and bounds is not None else None
+    logger.end_search(status_str, model.getDualbound(), upper_bound, model.getPresolvingTime(),
+                      monitor.reason if monitor is not None else None)
+    if checkpointer is not None:
+        checkpointer.close()
+    return solution, status_str
 
-def format_solution(model, x):
-    assignments = []
-    for (s, t), var in x.items():
-        val = model.getVal(var)
-        if val > 0.5:
-            assignments.append((s, t))
+def format_solution(solution):
+    assignments = [(s, t) for (s, t), assigned in solution.items() if assigned == 1]
 
     df = pd.DataFrame(assignments, columns=["Student", "Teacher"])
     df = df.sort_values(by="Teacher")
 
     return df
 
-def run_ilp(school, processed_data_folder, timelimit, min_prefs_start, deviation):
+def run_ilp(school, processed_data_folder, timelimit, min_prefs_start, deviation, use_cache=True, polish_time=0, tabu=False, pool_size=0,
+            solver_log=SOLVER_LOG, stop_rules=None, checkpoint_interval=0, resume=None, upper_bounds=False):
     folder = 'data/results'
-    timestamp = datetime.now().strftime("%d-%m_%H:%M")
+    # A resumed run keeps the timestamp, and so the log and checkpoint, of the interrupted run
+    timestamp = resume.timestamp if resume is not None else datetime.now().strftime("%d-%m_%H:%M")
     results_folder = os.path.join(folder, school, "ILP")
+    balance_attributes = get_balance_attributes(read_dfs(school, processed_data_folder))
+    polisher = Polisher(school, processed_data_folder, balance_attributes, polish_time, tabu) if polish_time > 0 else None
+    pool = SolutionPool(school, processed_data_folder, balance_attributes, pool_size) if pool_size > 0 else None
+    checkpointer = None
+    if checkpoint_interval > 0:
+        run_config = {"timelimit": timelimit, "min_prefs_start": min_prefs_start, "deviation": deviation}
+        checkpointer = Checkpointer(results_folder, "ILP", timestamp, run_config, checkpoint_interval)
+
+    # Build the model representation once, every phase only changes its limits
+    # With the cache, the IR is only built once a phase misses the cache
+    ir = None if use_cache else create_model_ir(school, processed_data_folder)
+    digest = instance_digest(school, processed_data_folder) if use_cache else None
+
+    # Upper bounds only with --bounds, they reuse the IR when it was built anyway
+    bounds = ObjectiveBounds(school, processed_data_folder, balance_attributes, LP_TIMELIMIT, ir) if upper_bounds else None
 
     # 1. Try decreasing min_prefs from 5 to 0 with normal deviation
     for min_prefs in reversed(range(min_prefs_start +1)):
+        # A resumed run skips the phases the interrupted run had already finished
+        if resume is not None and resume.skips(min_prefs, deviation):
+            continue
         print(f"Phase 1: Trying min_prefs_per_kid={min_prefs}, deviation={deviation}")
-        model, x = create_model(school, processed_data_folder, min_prefs, deviation)
-        model = solve_model(model, results_folder, timestamp, timelimit, min_prefs, deviation)
-
-        if model.getNSols() > 0:
-            df = format_solution(model, x)
-            return df, timestamp
+        if use_cache:
+            model, x, ir = load_model(school, processed_data_folder, min_prefs, deviation, digest, ir)
+        else:
+            model, x = lower_model(ir.set_limits(min_prefs, deviation))
+        solution, status = solve_model(model, x, results_folder, timestamp, timelimit, min_prefs, deviation, polisher, pool, bounds, solver_log, stop_rules,
+                                       checkpointer, resume)
+        resume = None
+
+        if solution:
+            df = format_solution(solution)
+            if checkpointer is not None:
+                checkpointer.discard()
+            if pool is not None:
+                pool.export(results_folder, "ILP", timestamp, min_prefs, deviation)
+            return df, timestamp, (min_prefs, deviation)
 
     # 2. Try again with no balance constraint (deviation=1.0)
     for min_prefs in reversed(range(min_prefs_start + 1)):
+        if resume is not None and resume.skips(min_prefs, 1.0):
+            continue
         print(f"Phase 2: Trying min_prefs_per_kid={min_prefs}, deviation=1.0")
-        model, x = create_model(school, processed_data_folder, min_prefs, 1.0)
-        model = solve_model(model, results_folder, timestamp, timelimit, min_prefs, 1.0)
-        if model.getNSols() > 0:
-            df = format_solution(model, x)
-            return df, timestamp
+        if use_cache:
+            model, x, ir = load_model(school, processed_data_folder, min_prefs, 1.0, digest, ir)
+        else:
+            model, x = lower_model(ir.set_limits(min_prefs, 1.0))
+        solution, status = solve_model(model, x, results_folder, timestamp, timelimit, min_prefs, 1.0, polisher, pool, bounds, solver_log, stop_rules,
+                                       checkpointer, resume)
+        resume = None
+        if solution:
+            df = format_solution(solution)
+            if checkpointer is not None:
+                checkpointer.discard()
+            if pool is not None:
+                pool.export(results_folder, "ILP", timestamp, min_prefs, 1.0)
+            return df, timestamp, (min_prefs, 1.0)
 
     print("No solution found in any configuration.")
-    return None, timestamp
+    return None, timestamp, None
@@ -0,0 +1,567 @@
+import os
+import re
+import sys
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix, vstack
+
+# Attributes that are balanced softly through the objective
+OBJECTIVE_ATTRIBUTES = ['Gender', 'Grade', 'Extra Care', 'Behavior']
+
+class ModelIR:
+    def __init__(self, instance):
+        self.instance = instance
+        self.students = instance.students
+        self.teachers = instance.teachers
+
+        # Variables: integer bounds and optional readable names
+        self.lb = np.zeros(0, dtype=np.int64)
+        self.ub = np.zeros(0, dtype=np.int64)
+        self.var_names = None
+
+        # Linear rows lo <= A x <= hi, tagged with a constraint family and the input row they come from
+        self.A = csr_matrix((0, 0), dtype=np.int64)
+        self.row_lo = np.zeros(0)
+        self.row_hi = np.zeros(0)
+        self.row_family = np.zeros(0, dtype=np.int64)
+        self.row_source = np.zeros(0, dtype=np.int64)
+        self.families = []
+
+        # Indicator metadata: row ind_row is only enforced if variable ind_var == ind_value
+        self.ind_row = np.zeros(0, dtype=np.int64)
+        self.ind_var = np.zeros(0, dtype=np.int64)
+        self.ind_value = np.zeros(0, dtype=np.int64)
+
+        # Reifications: and_res == (and_a AND and_b), or_res == OR(or_ops[or_ptr[i]:or_ptr[i + 1]])
+        self.and_res = np.zeros(0, dtype=np.int64)
+        self.and_a = np.zeros(0, dtype=np.int64)
+        self.and_b = np.zeros(0, dtype=np.int64)
+        self.or_res = np.zeros(0, dtype=np.int64)
+        self.or_ptr = np.zeros(1, dtype=np.int64)
+        self.or_ops = np.zeros(0, dtype=np.int64)
+
+        # Objective vector, always maximized
+        self.objective = np.zeros(0)
+
+        # Variable blocks used by the backends and the evaluation
+        self.x = None
+        self.together = None
+        self.layer_var = None
+        self.layer_k = None
+        self.layer_student = None
+        self.dev_var = None
+
+        # Per-row data needed to change min_prefs and deviation without rebuilding
+        self.balance_target = np.zeros(0)
+        self.fairness_weight = 0.0
+        self.balance_weight = 0.0
+        self.max_k = 1
+        self.balance_attributes = []
+        self.objective_attributes = []
+
+    @property
+    def n_vars(self):
+        return len(self.lb)
+
+    @property
+    def n_rows(self):
+        return self.A.shape[0]
+
+    def family_rows(self, family):
+        if family not in self.families:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(self.row_family == self.families.index(family))
+
+    def set_limits(self, min_prefs_per_kid, deviation):
+        # Minimum number of satisfied preferences per student with preferences
+        self.row_lo[self.family_rows('min_prefs')] = min_prefs_per_kid
+
+        # Balance bounds around the target per teacher
+        for attribute in self.balance_attributes:
+            rows = self.family_rows(f'balance:{attribute}')
+            target = self.balance_target[rows]
+            self.row_lo[rows] = np.floor((1 - deviation) * target)
+            self.row_hi[rows] = np.ceil((1 + deviation) * target)
+        return self
+
+    def copy(self):
+        ir = ModelIR(self.instance)
+        ir.__dict__.update({key: value.copy() if isinstance(value, (np.ndarray, list)) else value
+                            for key, value in self.__dict__.items()})
+        ir.A = self.A.copy()
+        return ir
+
+class IRBuilder:
+    def __init__(self, instance, debug_names=False):
+        self.instance = instance
+        self.debug_names = debug_names
+        self.n_vars = 0
+        self.var_blocks = []
+        self.name_blocks = []
+        self.row_blocks = []
+        self.n_rows = 0
+        self.families = []
+        self.indicators = []
+
+    def add_vars(self, count, lb, ub, names=None):
+        start = self.n_vars
+        self.var_blocks.append((np.broadcast_to(np.asarray(lb, dtype=np.int64), (count,)),
+                                np.broadcast_to(np.asarray(ub, dtype=np.int64), (count,))))
+        if self.debug_names:
+            self.name_blocks.append(names() if names is not None else [f"v{i}" for i in range(start, start + count)])
+        self.n_vars += count
+        return np.arange(start, start + count)
+
+    def add_rows(self, n_rows, rows, cols, coefs, lo, hi, family, source=-1, target=np.nan):
+        # rows are local indices 0..n_rows-1 of the new block
+        if family not in self.families:
+            self.families.append(family)
+        start = self.n_rows
+        block = {
+            'rows': np.asarray(rows, dtype=np.int64) + start,
+            'cols': np.asarray(cols, dtype=np.int64),
+            'coefs': np.broadcast_to(np.asarray(coefs, dtype=np.int64), (len(cols),)),
+            'lo': np.broadcast_to(np.asarray(lo, dtype=float), (n_rows,)),
+            'hi': np.broadcast_to(np.asarray(hi, dtype=float), (n_rows,)),
+            'family': np.full(n_rows, self.families.index(family), dtype=np.int64),
+            'source': np.broadcast_to(np.asarray(source, dtype=np.int64), (n_rows,)),
+            'target': np.broadcast_to(np.asarray(target, dtype=float), (n_rows,)),
+        }
+        self.row_blocks.append(block)
+        self.n_rows += n_rows
+        return np.arange(start, start + n_rows)
+
+    def add_indicator(self, rows, var, value):
+        self.indicators.append((np.asarray(rows, dtype=np.int64),
+                                np.broadcast_to(np.asarray(var, dtype=np.int64), (len(rows),)),
+                                np.full(len(rows), value, dtype=np.int64)))
+
+    def build(self, ir):
+        ir.lb = np.concatenate([lb for lb, _ in self.var_blocks])
+        ir.ub = np.concatenate([ub for _, ub in self.var_blocks])
+        ir.var_names = [name for block in self.name_blocks for name in block] if self.debug_names else None
+
+        def concat(key, dtype):
+            return np.concatenate([block[key] for block in self.row_blocks]).astype(dtype)
+
+        ir.A = coo_matrix((concat('coefs', np.int64), (concat('rows', np.int64), concat('cols', np.int64))),
+                          shape=(self.n_rows, self.n_vars)).tocsr()
+        ir.row_lo = concat('lo', float)
+        ir.row_hi = concat('hi', float)
+        ir.row_family = concat('family', np.int64)
+        ir.row_source = concat('source', np.int64)
+        ir.balance_target = concat('target', float)
+        ir.families = list(self.families)
+
+        ir.ind_row = np.concatenate([rows for rows, _, _ in self.indicators])
+        ir.ind_var = np.concatenate([var for _, var, _ in self.indicators])
+        ir.ind_value = np.concatenate([value for _, _, value in self.indicators])
+        return ir
+
+def objective_balance_attributes(instance):
+    return [attribute for attribute in OBJECTIVE_ATTRIBUTES if attribute in instance.attributes]
+
+def category_members(instance, attribute):
+    codes, categories = instance.attributes[attribute]
+    return [np.flatnonzero(codes == c) for c in range(len(categories))], categories
+
+def add_assignment(builder, ir):
+    instance = ir.instance
+    S, T = instance.n_students, instance.n_teachers
+    names = lambda: [f"x_{s}_{t}" for s in instance.students for t in instance.teachers]
+
+    # x[s, t] = 1 if student s assigned to teacher t
+    ir.x = builder.add_vars(S * T, 0, 1, names).reshape(S, T)
+
+    # Each student must be assigned to exactly one teacher
+    builder.add_rows(S, np.repeat(np.arange(S), T), ir.x.ravel(), 1, 1, 1, 'assignment', source=np.arange(S))
+
+def add_pair_constraints(builder, ir):
+    instance = ir.instance
+    T = instance.n_teachers
+    teachers = np.arange(T)
+
+    for together in (True, False):
+        pairs = np.flatnonzero(instance.pair_together == together)
+        if len(pairs) == 0:
+            continue
+
+        # One row per pair and teacher: x[s1, t] - x[s2, t] == 0 or x[s1, t] + x[s2, t] <= 1
+        s1 = np.repeat(instance.pair_s1[pairs], T)
+        s2 = np.repeat(instance.pair_s2[pairs], T)
+        t = np.tile(teachers, len(pairs))
+        n_rows = len(pairs) * T
+        rows = np.repeat(np.arange(n_rows), 2)
+        cols = np.column_stack([ir.x[s1, t], ir.x[s2, t]]).ravel()
+        coefs = np.tile([1, -1] if together else [1, 1], n_rows)
+        lo, hi = (0, 0) if together else (-np.inf, 1)
+        builder.add_rows(n_rows, rows, cols, coefs, lo, hi, 'student_pair', source=np.repeat(pairs, T))
+
+    # Student must (not) be with the teacher
+    n_rows = len(instance.teacher_student)
+    if n_rows:
+        value = instance.teacher_together.astype(np.int64)
+        builder.add_rows(n_rows, np.arange(n_rows), ir.x[instance.teacher_student, instance.teacher_teacher],
+                         1, value, value, 'student_teacher', source=np.arange(n_rows))
+
+def add_group_constraints(builder, ir):
+    instance = ir.instance
+    variables = instance.variables
+    S, T = instance.n_students, instance.n_teachers
+
+    # Group size between min_group_size and max_group_size
+    builder.add_rows(T, np.tile(np.arange(T), S), ir.x.ravel(), 1,
+                     variables.min_group_size, variables.max_group_size, 'group_size', source=np.arange(T))
+
+    # Maximum extra care students per group
+    extra_care = np.flatnonzero(instance.extra_care)
+    builder.add_rows(T, np.tile(np.arange(T), len(extra_care)), ir.x[extra_care].ravel(), 1,
+                     -np.inf, variables.max_extra_care, 'extra_care', source=np.arange(T))
+
+def add_balance_constraints(builder, ir, attribute):
+    instance = ir.instance
+    T = instance.n_teachers
+    members, categories = category_members(instance, attribute)
+
+    # One row per category and teacher, bounds are set by ModelIR.set_limits
+    for c, students in enumerate(members):
+        builder.add_rows(T, np.tile(np.arange(T), len(students)), ir.x[students].ravel(), 1,
+                         -np.inf, np.inf, f'balance:{attribute}', source=c, target=len(students) / T)
+
+def add_together(builder, ir):
+    instance = ir.instance
+    S, T = instance.n_students, instance.n_teachers
+    src, dst = instance.pref_src, instance.pref_dst
+    E = len(src)
+
+    # b[p, t] = 1 if both students of preference pair p are assigned to teacher t
+    names = lambda: [f"{instance.students[s1]}_{instance.students[s2]}_with_{t}" for s1, s2 in zip(src, dst) for t in instance.teachers]
+    per_teacher = builder.add_vars(E * T, 0, 1, names).reshape(E, T)
+    names = lambda: [f"satisfied_{instance.students[s1]}_{instance.students[s2]}" for s1, s2 in zip(src, dst)]
+    ir.together = builder.add_vars(E, 0, 1, names)
+
+    ir.and_res = per_teacher.ravel()
+    ir.and_a = ir.x[src].ravel()
+    ir.and_b = ir.x[dst].ravel()
+
+    # together[p] is 1 if at least one of the per-teacher vars is 1
+    ir.or_res = ir.together
+    ir.or_ptr = np.arange(E + 1) * T
+    ir.or_ops = per_teacher.ravel()
+
+def add_fairness(builder, ir):
+    instance = ir.instance
+    starts, ends = instance.preference_ranges()
+    num_prefs = ends - starts
+    with_prefs = np.flatnonzero(num_prefs > 0)
+
+    # num_satisfied[s] == sum of together vars of s
+    names = lambda: [f"num_satisfied_{instance.students[s]}" for s in with_prefs]
+    num_satisfied = builder.add_vars(len(with_prefs), 0, num_prefs[with_prefs], names)
+    local = np.repeat(np.arange(len(with_prefs)), num_prefs[with_prefs])
+    builder.add_rows(len(with_prefs),
+                     np.concatenate([np.arange(len(with_prefs)), local]),
+                     np.concatenate([num_satisfied, ir.together]),
+                     np.concatenate([np.ones(len(with_prefs), dtype=np.int64), -np.ones(len(local), dtype=np.int64)]),
+                     0, 0, 'preference_count', source=with_prefs)
+
+    # Require at least min_prefs_per_kid satisfied preferences, set by ModelIR.set_limits
+    builder.add_rows(len(with_prefs), local, ir.together, 1, 0, np.inf, 'min_prefs', source=with_prefs)
+
+    # Preference layers: met_k is 1 iff at least k preferences are satisfied
+    layer_owner = np.repeat(np.arange(len(with_prefs)), num_prefs[with_prefs])
+    layer_k = np.arange(len(layer_owner)) - np.repeat(np.cumsum(num_prefs[with_prefs]) - num_prefs[with_prefs], num_prefs[with_prefs]) + 1
+    names = lambda: [f"{instance.students[with_prefs[o]]}_at_least_{k}_prefs" for o, k in zip(layer_owner, layer_k)]
+    ir.layer_var = builder.add_vars(len(layer_owner), 0, 1, names)
+    ir.layer_k = layer_k
+    ir.layer_student = with_prefs[layer_owner]
+
+    n_layers = len(layer_owner)
+    cols = num_satisfied[layer_owner]
+    at_least = builder.add_rows(n_layers, np.arange(n_layers), cols, 1, layer_k, np.inf, 'preference_layer', source=ir.layer_student)
+    less_than = builder.add_rows(n_layers, np.arange(n_layers), cols, 1, -np.inf, layer_k - 1, 'preference_layer', source=ir.layer_student)
+    builder.add_indicator(at_least, ir.layer_var, 1)
+    builder.add_indicator(less_than, ir.layer_var, 0)
+
+def add_balance_penalty(builder, ir):
+    instance = ir.instance
+    S, T = instance.n_students, instance.n_teachers
+    dev_vars = []
+
+    for attribute in ir.objective_attributes:
+        members, categories = category_members(instance, attribute)
+        for c, students in enumerate(members):
+            target = int(len(students) / T)
+
+            # assigned - int(target) == over - under for every teacher
+            names = lambda: [f"{kind}_dev_{t}_{attribute}_{categories[c]}" for t in instance.teachers for kind in ("over", "under")]
+            dev = builder.add_vars(2 * T, 0, S, names).reshape(T, 2)
+            rows = np.concatenate([np.tile(np.arange(T), len(students)), np.arange(T), np.arange(T)])
+            cols = np.concatenate([ir.x[students].ravel(), dev[:, 0], dev[:, 1]])
+            coefs = np.concatenate([np.ones(len(students) * T, dtype=np.int64), -np.ones(T, dtype=np.int64), np.ones(T, dtype=np.int64)])
+            builder.add_rows(T, rows, cols, coefs, target, target, 'balance_penalty', source=c)
+            dev_vars.append(dev.ravel())
+
+    ir.dev_var = np.concatenate(dev_vars) if dev_vars else np.zeros(0, dtype=np.int64)
+
+def objective_scales(instance, layer_k, objective_attributes):
+    # Weight per preference layer and the normalizing weights of the fairness and balance terms
+    T = instance.n_teachers
+
+    # Each layer is weighted exponentially based on how many preferences are met
+    # Higher k means more preferences met, so weight is lower to focus more on
+    # improving fairness for students with fewer preferences met first
+    max_k = int(layer_k.max()) if len(layer_k) else 1
+    layer_weight = 10.0 ** (max_k - layer_k)
+
+    # Scale each objective by its estimated max value to normalize
+    max_balance_penalty = 0
+    for attribute in objective_attributes:
+        # Maximum possible deviation if all students of a type go to one teacher
+        counts = np.bincount(instance.attributes[attribute][0][instance.attributes[attribute][0] >= 0])
+        counts = counts[counts > 0]
+        max_balance_penalty += np.sum(np.abs(counts - counts / T))
+    max_fairness = layer_weight.sum() or 1
+
+    # Apply scaling to weights
+    balance_weight = 2 / max(1, max_balance_penalty or 1)
+    fairness_weight = 1 / max(1, max_fairness)
+    return layer_weight, fairness_weight, balance_weight, max_k
+
+def set_objective(ir):
+    layer_weight, ir.fairness_weight, ir.balance_weight, ir.max_k = objective_scales(ir.instance, ir.layer_k, ir.objective_attributes)
+
+    ir.objective = np.zeros(ir.n_vars)
+    ir.objective[ir.layer_var] = ir.fairness_weight * layer_weight
+    ir.objective[ir.dev_var] = -ir.balance_weight
+
+def build_model_ir(instance, balance_attributes, debug_names=False):
+    ir = ModelIR(instance)
+    ir.balance_attributes = [a for a in dict.fromkeys(balance_attributes) if a in instance.attributes]
+    ir.objective_attributes = objective_balance_attributes(instance)
+    builder = IRBuilder(instance, debug_names)
+
+    # Variables and rows are created in blocks over index arrays
+    add_assignment(builder, ir)
+    add_together(builder, ir)
+    add_fairness(builder, ir)
+    add_balance_penalty(builder, ir)
+
+    add_pair_constraints(builder, ir)
+    add_group_constraints(builder, ir)
+    for attribute in ir.balance_attributes:
+        add_balance_constraints(builder, ir, attribute)
+
+    builder.build(ir)
+    set_objective(ir)
+    return ir
+
+# LINEARIZATION
+def activity_bounds(A, lb, ub):
+    # Smallest and largest value every row can take given the variable bounds
+    positive = A.maximum(0)
+    negative = A.minimum(0)
+    return positive @ lb + negative @ ub, positive @ ub + negative @ lb
+
+def linearize(ir, reifications=True):
+    # Replaces indicators (and optionally reifications) with big-M and product linearizations
+    n_vars = ir.n_vars
+    always = np.ones(ir.n_rows, dtype=bool)
+    always[ir.ind_row] = False
+
+    blocks = [ir.A[always]]
+    lo = [ir.row_lo[always]]
+    hi = [ir.row_hi[always]]
+    family = [ir.row_family[always]]
+    families = list(ir.families)
+
+    def add_family(name):
+        if name not in families:
+            families.append(name)
+        return families.index(name)
+
+    # Indicator rows: each finite side gets a big-M term on the indicator variable
+    A_ind = ir.A[ir.ind_row]
+    min_act, max_act = activity_bounds(A_ind, ir.lb, ir.ub)
+    n_ind = len(ir.ind_row)
+    sign = np.where(ir.ind_value == 1, 1, -1)
+    for side in ('lo', 'hi'):
+        bound = ir.row_lo[ir.ind_row] if side == 'lo' else ir.row_hi[ir.ind_row]
+        finite = np.flatnonzero(np.isfinite(bound))
+        if side == 'lo':
+            # a x >= lo - M (1 - w) with M = lo - min activity
+            big_m = bound[finite] - min_act[finite]
+            new_lo = np.where(ir.ind_value[finite] == 1, bound[finite] - big_m, bound[finite])
+            coef = -big_m * sign[finite]
+            new_hi = np.full(len(finite), np.inf)
+        else:
+            # a x <= hi + M (1 - w) with M = max activity - hi
+            big_m = max_act[finite] - bound[finite]
+            new_hi = np.where(ir.ind_value[finite] == 1, bound[finite] + big_m, bound[finite])
+            coef = big_m * sign[finite]
+            new_lo = np.full(len(finite), -np.inf)
+        extra = csr_matrix((coef, (np.arange(len(finite)), ir.ind_var[finite])), shape=(len(finite), n_vars))
+        blocks.append(A_ind[finite] + extra)
+        lo.append(new_lo)
+        hi.append(new_hi)
+        family.append(ir.row_family[ir.ind_row[finite]])
+
+    # res = a AND b: res <= a, res <= b, a + b - res <= 1
+    n_and = len(ir.and_res) if reifications else 0
+    if n_and:
+        rows = np.concatenate([np.arange(n_and), np.arange(n_and), np.arange(n_and, 2 * n_and), np.arange(n_and, 2 * n_and),
+                               np.repeat(np.arange(2 * n_and, 3 * n_and), 3)])
+        cols = np.concatenate([ir.and_res, ir.and_a, ir.and_res, ir.and_b,
+                               np.column_stack([ir.and_a, ir.and_b, ir.and_res]).ravel()])
+        coefs = np.concatenate([np.ones(n_and), -np.ones(n_and), np.ones(n_and), -np.ones(n_and),
+                                np.tile([1, 1, -1], n_and)])
+        blocks.append(csr_matrix((coefs, (rows, cols)), shape=(3 * n_and, n_vars)))
+        lo.append(np.full(3 * n_and, -np.inf))
+        hi.append(np.concatenate([np.zeros(2 * n_and), np.ones(n_and)]))
+        family.append(np.full(3 * n_and, add_family('preference_link')))
+
+    # res = OR(ops): op <= res for every operand, res <= sum(ops)
+    n_or = len(ir.or_res) if reifications else 0
+    if n_or:
+        counts = np.diff(ir.or_ptr)
+        n_ops = len(ir.or_ops)
+        owner = np.repeat(np.arange(n_or), counts)
+        rows = np.concatenate([np.arange(n_ops), np.arange(n_ops), n_ops + np.arange(n_or), n_ops + owner])
+        cols = np.concatenate([ir.or_ops, ir.or_res[owner], ir.or_res, ir.or_ops])
+        coefs = np.concatenate([np.ones(n_ops), -np.ones(n_ops), np.ones(n_or), -np.ones(n_ops)])
+        blocks.append(csr_matrix((coefs, (rows, cols)), shape=(n_ops + n_or, n_vars)))
+        lo.append(np.full(n_ops + n_or, -np.inf))
+        hi.append(np.zeros(n_ops + n_or))
+        family.append(np.full(n_ops + n_or, add_family('preference_link')))
+
+    linear = ModelIR(ir.instance)
+    linear.__dict__.update(ir.__dict__)
+    linear.A = vstack(blocks, format='csr')
+    linear.row_lo = np.concatenate(lo)
+    linear.row_hi = np.concatenate(hi)
+    linear.row_family = np.concatenate(family)
+    linear.row_source = np.full(linear.n_rows, -1, dtype=np.int64)
+    linear.families = families
+    linear.ind_row = linear.ind_var = linear.ind_value = np.zeros(0, dtype=np.int64)
+    if reifications:
+        linear.and_res = linear.and_a = linear.and_b = linear.or_res = linear.or_ops = np.zeros(0, dtype=np.int64)
+        linear.or_ptr = np.zeros(1, dtype=np.int64)
+    return linear
+
+# FILE EXPORT
+def clean_label(name):
+    # LP and MPS names cannot contain spaces or operators
+    return re.sub(r'[^A-Za-z0-9_.]', '_', name)
+
+def var_labels(ir):
+    if ir.var_names is None:
+        return [f"v{i}" for i in range(ir.n_vars)]
+    return [clean_label(name) for name in ir.var_names]
+
+def format_terms(cols, coefs, labels, per_line=8):
+    terms = []
+    for i, (col, coef) in enumerate(zip(cols, coefs)):
+        # Break long expressions over several lines
+        if i > 0 and i % per_line == 0:
+            terms.append("\n   ")
+        terms.append(f"{'-' if coef < 0 else '+'} {abs(coef):.12g} {labels[col]}")
+    return " ".join(terms) if terms else "0 " + labels[0]
+
+def write_lp(ir, path):
+    linear = linearize(ir)
+    labels = var_labels(linear)
+    A = linear.A
+
+    with open(path, 'w') as file:
+        file.write("\\ Student grouping model\nMaximize\n")
+        objective = np.flatnonzero(linear.objective)
+        file.write(f" obj: {format_terms(objective, linear.objective[objective], labels)}\n")
+
+        file.write("Subject To\n")
+        for r in range(linear.n_rows):
+            cols = A.indices[A.indptr[r]:A.indptr[r + 1]]
+            coefs = A.data[A.indptr[r]:A.indptr[r + 1]]
+            lhs = format_terms(cols, coefs, labels)
+            family = clean_label(linear.families[linear.row_family[r]])
+            lo, hi = linear.row_lo[r], linear.row_hi[r]
+            if lo == hi:
+                file.write(f" {family}_{r}: {lhs} = {lo:.12g}\n")
+                continue
+            if np.isfinite(lo):
+                file.write(f" {family}_{r}_lo: {lhs} >= {lo:.12g}\n")
+            if np.isfinite(hi):
+                file.write(f" {family}_{r}_hi: {lhs} <= {hi:.12g}\n")
+
+        file.write("Bounds\n")
+        for i in range(linear.n_vars):
+            file.write(f" {linear.lb[i]} <= {labels[i]} <= {linear.ub[i]}\n")
+
+        file.write("General\n")
+        for i in range(linear.n_vars):
+            file.write(f" {labels[i]}\n")
+        file.write("End\n")
+
+def write_mps(ir, path):
+    linear = linearize(ir)
+    labels = var_labels(linear)
+    A = linear.A.tocsc()
+    row_names = [f"r{r}" for r in range(linear.n_rows)]
+
+    # Every row becomes an E, L or G row, ranged rows get a RANGES entry
+    lo, hi = linear.row_lo, linear.row_hi
+    kinds = np.where(lo == hi, 'E', np.where(np.isfinite(lo), 'G', 'L'))
+    ranged = np.isfinite(lo) & np.isfinite(hi) & (lo != hi)
+    rhs = np.where(kinds == 'L', hi, lo)
+
+    with open(path, 'w') as file:
+        file.write("NAME grouping\nOBJSENSE\n    MAX\nROWS\n N obj\n")
+        for r in range(linear.n_rows):
+            file.write(f" {kinds[r]} {row_names[r]}\n")
+
+        file.write("COLUMNS\n    MARKER INTORG 'MARKER' 'INTORG'\n")
+        for i in range(linear.n_vars):
+            if linear.objective[i] != 0:
+                file.write(f"    {labels[i]} obj {linear.objective[i]:.12g}\n")
+            for r, coef in zip(A.indices[A.indptr[i]:A.indptr[i + 1]], A.data[A.indptr[i]:A.indptr[i + 1]]):
+                file.write(f"    {labels[i]} {row_names[r]} {coef:.12g}\n")
+        file.write("    MARKER INTEND 'MARKER' 'INTEND'\n")
+
+        file.write("RHS\n")
+        for r in np.flatnonzero(rhs != 0):
+            file.write(f"    rhs {row_names[r]} {rhs[r]:.12g}\n")
+
+        if ranged.any():
+            file.write("RANGES\n")
+            for r in np.flatnonzero(ranged):
+                file.write(f"    rng {row_names[r]} {hi[r] - lo[r]:.12g}\n")
+
+        file.write("BOUNDS\n")
+        for i in range(linear.n_vars):
+            file.write(f" LO bnd {labels[i]} {linear.lb[i]}\n UP bnd {labels[i]} {linear.ub[i]}\n")
+        file.write("ENDATA\n")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print("Usage: python3 code/models/IR.py <school> <method: cp|ilp> <output.lp|output.mps> [min_prefs_per_kid] [deviation]")
+        sys.exit(1)
+
+    # Add the project root to sys.path
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+    school = sys.argv[1]
+    method = sys.argv[2].upper()
+    output_path = sys.argv[3]
+    min_prefs_per_kid = int(sys.argv[4]) if len(sys.argv) > 4 else 5
+    deviation = float(sys.argv[5]) if len(sys.argv) > 5 else 0.1
+
+    if method == "CP":
+        from code.models.CP import create_model_ir
+    else:
+        from code.models.ILP import create_model_ir
+
+    ir = create_model_ir(school, 'data/processed_data', debug_names=True).set_limits(min_prefs_per_kid, deviation)
+    if output_path.endswith('.mps'):
+        write_mps(ir, output_path)
+    else:
+        write_lp(ir, output_path)
+    print(f"Model for {school} written to {output_path}")
@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import resource
+import tempfile
+import tracemalloc
+
+# Add the project root and the synthetic data generator to sys.path
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, root)
+sys.path.append(os.path.join(root, 'code'))
+sys.path.append(os.path.join(root, 'code', 'syntheticData'))
+from sample import generate_synthetic_school
+
+# Fixed generation parameters so every benchmark builds the same instance
+BENCHMARK_STATS = {
+    "grades": {"mean": 2, "min": 1, "max": 3},
+    "perc_extra_care": {"mean": 12, "min": 5, "max": 20},
+    "avg_prefs": {"mean": 3.5, "min": 2, "max": 5},
+    "perc_boys": {"mean": 50, "min": 45, "max": 55},
+    "perc_with_prefs": {"mean": 90, "min": 80, "max": 100},
+    "peer_incl": {"mean": 20, "min": 10, "max": 30},
+    "peer_excl": {"mean": 20, "min": 10, "max": 30},
+    "num_groups_ratio": {"mean": 0.04, "min": 0.035, "max": 0.045},
+    "min_group_size_ratio": {"mean": 0.5, "min": 0.4, "max": 0.6},
+    "max_extra_care_ratio": {"mean": 0.15, "min": 0.1, "max": 0.2},
+}
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def benchmark_build(method, n_students, debug_names, seed=42):
+    if method == "CP":
+        from code.models.CP import create_model_ir, lower_model
+    elif method == "HIGHS":
+        from code.models.HiGHS import create_model_ir, lower_model
+    else:
+        from code.models.ILP import create_model_ir, lower_model
+
+    with tempfile.TemporaryDirectory() as processed_data_folder:
+        school = f"benchmark_{n_students}"
+        generate_synthetic_school(dict(BENCHMARK_STATS), n_students, os.path.join(processed_data_folder, school), seed)
+
+        rss_before = peak_rss_mb()
+        tracemalloc.start()
+        start = time.perf_counter()
+        ir = create_model_ir(school, processed_data_folder, debug_names).set_limits(1, 0.1)
+        ir_elapsed = time.perf_counter() - start
+        lower_model(ir)
+        elapsed = time.perf_counter() - start
+        _, python_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "build_time_s": round(elapsed, 2),
+        "ir_build_time_s": round(ir_elapsed, 2),
+        "python_peak_mb": round(python_peak / 1024 / 1024, 1),
+        "rss_growth_mb": round(peak_rss_mb() - rss_before, 1),
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python3 code/models/benchmark_build.py <method: cp|ilp|highs> [n_students] [--debug]")
+        sys.exit(1)
+
+    os.chdir(root)
+    method = sys.argv[1].upper()
+    n_students = int(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[2] != "--debug" else 1000
+    debug_names = "--debug" in sys.argv
+
+    results = benchmark_build(method, n_students, debug_names)
+    print(f"{method} build for {n_students} students (debug_names={debug_names}): {results}")
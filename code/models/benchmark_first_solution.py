@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+from ortools.sat.python import cp_model
+
+# Add the project root to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from helpers import read_dfs, read_variables
+from instance import encode_instance
+from code.models.CP import create_model_ir, lower_model, priority_students, find_first_solution
+
+def single_shot_first_solution(model, timelimit):
+    # Today's solve_model settings, stopped at the first solution it finds
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = timelimit
+    solver.parameters.random_seed = 42
+    solver.parameters.num_search_workers = 1
+    solver.parameters.stop_after_first_solution = True
+    status = solver.Solve(model)
+    return solver.StatusName(status)
+
+def benchmark_first_solution(school, processed_data_folder, timelimit, min_prefs, deviation):
+    data = read_dfs(school, processed_data_folder)
+    priority = priority_students(encode_instance(data, read_variables(data)))
+    ir = create_model_ir(school, processed_data_folder).set_limits(min_prefs, deviation)
+
+    # Both searches get a freshly lowered model, so neither profits from the other
+    model, _ = lower_model(ir)
+    start = time.perf_counter()
+    single_status = single_shot_first_solution(model, timelimit)
+    single_elapsed = time.perf_counter() - start
+
+    model, x = lower_model(ir)
+    start = time.perf_counter()
+    _, feasibility_status = find_first_solution(model, x, priority, timelimit)
+    feasibility_elapsed = time.perf_counter() - start
+
+    return {
+        "single_shot_s": round(single_elapsed, 2),
+        "single_shot_status": single_status,
+        "feasibility_first_s": round(feasibility_elapsed, 2),
+        "feasibility_first_status": feasibility_status,
+        "priority_students": len(priority),
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python3 code/models/benchmark_first_solution.py <school> [timelimit] [min_prefs_per_kid] [deviation]")
+        sys.exit(1)
+
+    school = sys.argv[1]
+    timelimit = float(sys.argv[2]) if len(sys.argv) > 2 else 60
+    min_prefs_per_kid = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    deviation = float(sys.argv[4]) if len(sys.argv) > 4 else 0.1
+
+    results = benchmark_first_solution(school, 'data/processed_data', timelimit, min_prefs_per_kid, deviation)
+    print(f"Time to first solution for {school} (min_prefs_per_kid={min_prefs_per_kid}, deviation={deviation}): {results}")
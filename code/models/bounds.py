@@ -0,0 +1,111 @@
+import sys
+import time
+import numpy as np
+from scipy.optimize import milp, LinearConstraint, Bounds
+from helpers import read_dfs, read_variables
+from instance import encode_instance
+from code.models.IR import build_model_ir, linearize, objective_balance_attributes
+from code.evaluation.batch_score import objective_weights
+
+# Seconds the LP relaxation may take, larger schools fall back to the combinatorial bound
+LP_TIMELIMIT = 10
+
+def allowed_teachers(instance):
+    # allowed[s, t] is False when a teacher constraint keeps student s out of group t
+    allowed = np.ones((instance.n_students, instance.n_teachers), dtype=bool)
+    together = instance.teacher_together.astype(bool)
+    allowed[instance.teacher_student[~together], instance.teacher_teacher[~together]] = False
+    forced = np.zeros_like(allowed)
+    forced[instance.teacher_student[together], instance.teacher_teacher[together]] = True
+    pinned = forced.any(axis=1)
+    allowed[pinned] &= forced[pinned]
+    return allowed
+
+def satisfiable_preferences(instance):
+    # Per student, the preferences that can hold at all: the two students may share a group,
+    # and a group has room for at most max_group_size - 1 others
+    allowed = allowed_teachers(instance)
+    src, dst = instance.pref_src, instance.pref_dst
+    possible = (allowed[src] & allowed[dst]).any(axis=1)
+
+    apart = instance.pair_together == 0
+    separated = set(zip(instance.pair_s1[apart].tolist(), instance.pair_s2[apart].tolist()))
+    separated |= {(b, a) for a, b in separated}
+    possible &= np.array([(a, b) not in separated for a, b in zip(src.tolist(), dst.tolist())], dtype=bool)
+
+    counts = np.bincount(src[possible], minlength=instance.n_students)
+    return np.minimum(counts, instance.variables.max_group_size - 1)
+
+def balance_lower_bound(instance):
+    # The deviations of a category add up to at least its size minus T times its target
+    T = instance.n_teachers
+    total = 0
+    for attribute in objective_balance_attributes(instance):
+        codes, categories = instance.attributes[attribute]
+        sizes = np.bincount(codes[codes >= 0], minlength=len(categories))
+        total += int((sizes - T * (sizes / T).astype(np.int64)).sum())
+    return total
+
+def combinatorial_bound(instance):
+    # Every student gets all its satisfiable preferences and balance only pays its unavoidable deviation
+    layer_weight, fairness_weight, balance_weight = objective_weights(instance)
+    layer_value = np.concatenate([[0.0], np.cumsum(layer_weight)])
+    num_prefs = np.bincount(instance.pref_src, minlength=instance.n_students)
+    fairness = layer_value[np.minimum(satisfiable_preferences(instance), num_prefs)].sum()
+    return float(fairness_weight * fairness - balance_weight * balance_lower_bound(instance))
+
+def lp_bound(ir, timelimit=LP_TIMELIMIT):
+    # LP relaxation of the linearized model, only a bound once HiGHS proves it optimal
+    linear = linearize(ir)
+    result = milp(-linear.objective, constraints=LinearConstraint(linear.A, linear.row_lo, linear.row_hi),
+                  integrality=np.zeros(linear.n_vars), bounds=Bounds(linear.lb, linear.ub),
+                  options={"time_limit": timelimit})
+    if result.status == 0:
+        return float(-result.fun), "OPTIMAL"
+    return None, "INFEASIBLE" if result.status == 2 else "TIME_LIMIT"
+
+class ObjectiveBounds:
+    # Valid upper bounds on the objective of one school. Nothing is built until the first upper_bound call,
+    # and the backend's model IR is reused when it has one, so cached models stay cheap to load
+    def __init__(self, school, processed_data_folder, balance_attributes, lp_timelimit=LP_TIMELIMIT, ir=None):
+        self.school = school
+        self.processed_data_folder = processed_data_folder
+        self.balance_attributes = balance_attributes
+        self.lp_timelimit = lp_timelimit
+        self.ir = ir
+        self.combinatorial = None
+
+    def build(self):
+        if self.ir is None:
+            data = read_dfs(self.school, self.processed_data_folder)
+            self.ir = build_model_ir(encode_instance(data, read_variables(data)), self.balance_attributes)
+        if self.combinatorial is None:
+            self.combinatorial = combinatorial_bound(self.ir.instance)
+
+    def upper_bound(self, min_prefs, deviation):
+        # The tightest bound for these limits
+        start = time.time()
+        self.build()
+        lp, status = lp_bound(self.ir.set_limits(min_prefs, deviation), self.lp_timelimit)
+        print(f"Combinatorial bound {self.combinatorial:.5f}, LP bound {status if lp is None else f'{lp:.5f}'} ({time.time() - start:.1f}s)")
+        return self.combinatorial if lp is None else min(lp, self.combinatorial)
+
+
+# Run as a module from the project root, so helpers and code.models import like they do for main.py
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python3 -m code.models.bounds <school> <method: cp|ilp|highs> [min_prefs_per_kid] [deviation] [lp_timelimit]")
+        sys.exit(1)
+
+    from code.models import ILP, CP, HiGHS
+
+    school = sys.argv[1]
+    method = sys.argv[2].upper()
+    min_prefs_per_kid = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    deviation = float(sys.argv[4]) if len(sys.argv) > 4 else 0.1
+    lp_timelimit = float(sys.argv[5]) if len(sys.argv) > 5 else LP_TIMELIMIT
+
+    data = read_dfs(school, 'data/processed_data')
+    backend = {"ILP": ILP, "CP": CP, "HIGHS": HiGHS}[method]
+    bounds = ObjectiveBounds(school, 'data/processed_data', backend.get_balance_attributes(data), lp_timelimit)
+    print(f"Upper bound: {bounds.upper_bound(min_prefs_per_kid, deviation):.5f}")
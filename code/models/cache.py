@@ -0,0 +1,89 @@
+import os
+import json
+import hashlib
+
+CACHE_FOLDER = 'data/cache'
+
+# Total size of all cached models before the least recently used ones are removed
+MAX_CACHE_SIZE = 2 * 1024 ** 3
+
+# Bump when the model formulation changes so old cached models are not reused.
+# Version 2 drops patched models that incremental.py used to store
+CACHE_VERSION = 2
+
+PROCESSED_FILES = ['group_preferences.csv', 'info_students.csv', 'info_teachers.csv',
+                   'constraints_students.csv', 'constraints_teachers.csv', 'current_groups.csv']
+
+def instance_digest(school, processed_data_folder):
+    # Hash of the six processed CSVs of a school
+    digest = hashlib.sha256()
+    for filename in PROCESSED_FILES:
+        with open(os.path.join(processed_data_folder, school, filename), 'rb') as file:
+            digest.update(filename.encode())
+            digest.update(file.read())
+    return digest.hexdigest()
+
+def model_key(digest, **options):
+    # Combine the instance hash with everything else that changes the built model
+    options = dict(options, version=CACHE_VERSION)
+    encoded = json.dumps(options, sort_keys=True, default=str)
+    return hashlib.sha256((digest + encoded).encode()).hexdigest()[:32]
+
+def cache_paths(school, key, extension):
+    school_folder = os.path.join(CACHE_FOLDER, school)
+    return os.path.join(school_folder, f"{key}.{extension}"), os.path.join(school_folder, f"{key}.json")
+
+def get_cached_model(school, key, extension):
+    model_path, meta_path = cache_paths(school, key, extension)
+    if not (os.path.exists(model_path) and os.path.exists(meta_path)):
+        return None
+
+    # Touch the entry so eviction sees it as recently used
+    os.utime(model_path)
+    os.utime(meta_path)
+    with open(meta_path, 'r') as file:
+        meta = json.load(file)
+    print(f"Loaded cached model {model_path}")
+    return model_path, meta
+
+def put_cached_model(school, key, extension, write_model, meta, max_size=MAX_CACHE_SIZE):
+    model_path, meta_path = cache_paths(school, key, extension)
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+
+    # Write to temporary files first so an interrupted run never leaves a half written entry
+    # (the extension is kept last, SCIP picks the file format from it)
+    tmp_model_path, tmp_meta_path = cache_paths(school, key + ".tmp", extension)
+    write_model(tmp_model_path)
+    with open(tmp_meta_path, 'w') as file:
+        json.dump(meta, file)
+    os.replace(tmp_model_path, model_path)
+    os.replace(tmp_meta_path, meta_path)
+
+    evict_cache(max_size)
+
+def evict_cache(max_size=MAX_CACHE_SIZE):
+    # Group files per entry (school folder + key) and remove least recently used entries first
+    entries = {}
+    if not os.path.isdir(CACHE_FOLDER):
+        return
+    for school in os.listdir(CACHE_FOLDER):
+        school_folder = os.path.join(CACHE_FOLDER, school)
+        if not os.path.isdir(school_folder):
+            continue
+        for filename in os.listdir(school_folder):
+            if ".tmp." in filename:
+                continue
+            path = os.path.join(school_folder, filename)
+            entry = entries.setdefault(os.path.join(school_folder, filename.split('.')[0]), {"paths": [], "size": 0, "used": 0})
+            entry["paths"].append(path)
+            entry["size"] += os.path.getsize(path)
+            entry["used"] = max(entry["used"], os.path.getmtime(path))
+
+    total = sum(entry["size"] for entry in entries.values())
+    for name, entry in sorted(entries.items(), key=lambda item: item[1]["used"]):
+        if total <= max_size:
+            break
+        for path in entry["paths"]:
+            os.remove(path)
+        total -= entry["size"]
+        print(f"Evicted cached model {name}")
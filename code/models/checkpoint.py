@@ -0,0 +1,110 @@
+import os
+import glob
+import json
+import atexit
+import tempfile
+import threading
+
+# Seconds between checkpoints when --checkpoint is given without a value
+CHECKPOINT_INTERVAL = 30
+
+def write_atomic(path, content):
+    # Write a temporary file next to the checkpoint and rename it over it, a crash leaves the previous one intact
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as file:
+        file.write(content)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+def to_json(value):
+    # Student and teacher names can be numpy scalars
+    return value.item() if hasattr(value, "item") else value
+
+class Checkpointer:
+    # Keeps the incumbent of one run on disk. Solution callbacks only hand over the latest solution,
+    # a background thread writes it at most every interval seconds and close() writes what is left
+    def __init__(self, results_folder, method, timestamp, run_config, interval=CHECKPOINT_INTERVAL):
+        folder = os.path.join(results_folder, "checkpoints")
+        os.makedirs(folder, exist_ok=True)
+        self.path = os.path.join(folder, f"{method}_{timestamp}.json")
+        self.method = method
+        self.timestamp = timestamp
+        self.run_config = run_config
+        self.interval = interval
+        self.phase = None
+        self.pending = None
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.thread = None
+
+    def start(self, min_prefs, deviation):
+        # Called by solve_model, the checkpoint records the limits of the phase to resume
+        self.phase = {"min_prefs": min_prefs, "deviation": deviation}
+        self.closed.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        # Only a running phase is written at exit, close() unregisters it again
+        atexit.register(self.close)
+
+    def update(self, solution, objective, elapsed):
+        # Called for every new best solution, the solution is only converted when it is written
+        with self.lock:
+            self.pending = (dict(self.phase), solution, objective, elapsed)
+
+    def run(self):
+        while not self.closed.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, None
+        if pending is None:
+            return
+        phase, solution, objective, elapsed = pending
+        assignments = [[to_json(s), to_json(t)] for (s, t), assigned in solution.items() if assigned == 1]
+        write_atomic(self.path, json.dumps({"method": self.method, "timestamp": self.timestamp, "run": self.run_config,
+                                            **phase, "elapsed": round(elapsed, 3), "objective": objective,
+                                            "assignments": assignments}))
+
+    def close(self):
+        self.closed.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+        atexit.unregister(self.close)
+
+    def discard(self):
+        # A run that ended normally has nothing to resume
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class Checkpoint:
+    # A checkpoint read back for --resume
+    def __init__(self, path):
+        with open(path) as file:
+            data = json.load(file)
+        self.path = path
+        self.method = data["method"]
+        self.timestamp = data["timestamp"]
+        self.run = data["run"]
+        self.min_prefs = data["min_prefs"]
+        self.deviation = data["deviation"]
+        self.elapsed = data["elapsed"]
+        self.objective = data["objective"]
+        self.assigned = {tuple(pair) for pair in data["assignments"]}
+
+    def skips(self, min_prefs, deviation):
+        # Phases before the checkpointed one were already tried by the interrupted run
+        return (min_prefs, deviation) != (self.min_prefs, self.deviation)
+
+    def hint(self, x):
+        return {key: int(key in self.assigned) for key in x}
+
+def latest_checkpoint(results_folder, method):
+    paths = glob.glob(os.path.join(results_folder, "checkpoints", f"{method}_*.json"))
+    if not paths:
+        return None
+    return Checkpoint(max(paths, key=os.path.getmtime))
@@ -0,0 +1,151 @@
+import os
+import sys
+import time
+import numpy as np
+from ortools.sat.python import cp_model
+
+# Families that can be switched off during diagnosis, one assumption per (family, input row).
+# Assignment, preference counting and balance penalty rows only define variables and are always on
+GUARDED_FAMILIES = ['student_pair', 'student_teacher', 'group_size', 'extra_care', 'min_prefs']
+
+def is_guarded(family):
+    return family in GUARDED_FAMILIES or family.startswith('balance:')
+
+def guard_groups(ir):
+    # Returns the guard index of every row (-1 if always enforced) and the (family, source) of every guard
+    row_guard = np.full(ir.n_rows, -1, dtype=np.int64)
+    groups = []
+    for f, family in enumerate(ir.families):
+        if not is_guarded(family):
+            continue
+        rows = np.flatnonzero(ir.row_family == f)
+        sources, inverse = np.unique(ir.row_source[rows], return_inverse=True)
+        row_guard[rows] = len(groups) + inverse
+        groups.extend((family, int(source)) for source in sources)
+    return row_guard, groups
+
+def describe_group(ir, family, source):
+    # Readable description of the input row behind a guard
+    instance = ir.instance
+    variables = instance.variables
+    rows = ir.family_rows(family)
+    rows = rows[ir.row_source[rows] == source]
+
+    if family == 'student_pair':
+        s1, s2 = instance.students[instance.pair_s1[source]], instance.students[instance.pair_s2[source]]
+        verdict = "together" if instance.pair_together[source] else "not together"
+        return f"constraints_students row {source}: {s1} and {s2} {verdict}"
+    if family == 'student_teacher':
+        student = instance.students[instance.teacher_student[source]]
+        teacher = instance.teachers[instance.teacher_teacher[source]]
+        verdict = "with" if instance.teacher_together[source] else "not with"
+        return f"constraints_teachers row {source}: {student} {verdict} {teacher}"
+    if family == 'group_size':
+        return f"group size of {instance.teachers[source]} between {variables.min_group_size} and {variables.max_group_size}"
+    if family == 'extra_care':
+        return f"at most {variables.max_extra_care} extra care students with {instance.teachers[source]}"
+    if family == 'min_prefs':
+        return f"{instance.students[source]} needs at least {int(ir.row_lo[rows[0]])} satisfied preferences"
+
+    # Balance rows: one per teacher for this category
+    attribute = family.split(':', 1)[1]
+    category = instance.attributes[attribute][1][source]
+    return f"{attribute} = {category} balanced between {int(ir.row_lo[rows].min())} and {int(ir.row_hi[rows].max())} students per group"
+
+def solve_with_assumptions(model, literals, timelimit):
+    # Returns "FEASIBLE", "INFEASIBLE" with the indices of a sufficient subset of literals, or "UNKNOWN"
+    model.ClearAssumptions()
+    model.AddAssumptions(literals)
+
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = max(timelimit, 0.1)
+    solver.parameters.num_workers = 1
+    solver.parameters.random_seed = 42
+    status = solver.Solve(model)
+
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        return "FEASIBLE", None
+    if status == cp_model.INFEASIBLE:
+        core = set(solver.SufficientAssumptionsForInfeasibility())
+        return "INFEASIBLE", [i for i, lit in enumerate(literals) if lit.Index() in core]
+    return "UNKNOWN", None
+
+def find_core(model, literals, timelimit):
+    # Sufficient assumptions from CP-SAT, then shrunk by dropping one assumption at a time
+    deadline = time.time() + timelimit
+    status, core = solve_with_assumptions(model, literals, timelimit)
+    if status != "INFEASIBLE":
+        return status, None
+
+    core = list(core)
+    i = 0
+    while i < len(core) and time.time() < deadline:
+        rest = core[:i] + core[i + 1:]
+        status, subset = solve_with_assumptions(model, [literals[j] for j in rest], deadline - time.time())
+        if status == "INFEASIBLE":
+            # The new core is a subset of rest, so everything before i stays necessary
+            core = [rest[j] for j in subset]
+        else:
+            i += 1
+    return "INFEASIBLE", core
+
+class Diagnosis:
+    def __init__(self, status, groups, descriptions, min_prefs_per_kid, deviation):
+        self.status = status
+        self.groups = groups
+        self.descriptions = descriptions
+        self.min_prefs_per_kid = min_prefs_per_kid
+        self.deviation = deviation
+
+    @property
+    def families(self):
+        return {family for family, _ in self.groups}
+
+    def involves_fairness(self):
+        return 'min_prefs' in self.families
+
+    def involves_balance(self):
+        return any(family.startswith('balance:') for family in self.families)
+
+    def print(self):
+        if self.status != "INFEASIBLE":
+            print(f"Diagnosis for min_prefs_per_kid={self.min_prefs_per_kid}, deviation={self.deviation}: {self.status}")
+            return
+        print(f"The model with min_prefs_per_kid={self.min_prefs_per_kid}, deviation={self.deviation} is infeasible because of these {len(self.groups)} constraints together:")
+        for description in self.descriptions:
+            print(f"  - {description}")
+
+def diagnose_infeasibility(ir, lower_model, min_prefs_per_kid, deviation, timelimit=60):
+    # lower_model is the CP-SAT lowering, which enforces row r only while guard row_guard[r] is true
+    ir.set_limits(min_prefs_per_kid, deviation)
+    row_guard, groups = guard_groups(ir)
+    model, _ = lower_model(ir, row_guard)
+    model.ClearObjective()
+
+    # Guard literals are created after the IR variables
+    literals = [model.GetBoolVarFromProtoIndex(ir.n_vars + g) for g in range(len(groups))]
+    status, core = find_core(model, literals, timelimit)
+    if status != "INFEASIBLE":
+        return Diagnosis(status, [], [], min_prefs_per_kid, deviation)
+
+    core_groups = [groups[g] for g in core]
+    descriptions = [describe_group(ir, family, source) for family, source in core_groups]
+    return Diagnosis(status, core_groups, descriptions, min_prefs_per_kid, deviation)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python3 code/models/diagnose.py <school> [min_prefs_per_kid] [deviation] [timelimit]")
+        sys.exit(1)
+
+    # Add the project root to sys.path
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+    from code.models.CP import create_model_ir, lower_model
+
+    school = sys.argv[1]
+    min_prefs_per_kid = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    deviation = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+    timelimit = int(sys.argv[4]) if len(sys.argv) > 4 else 60
+
+    ir = create_model_ir(school, 'data/processed_data')
+    diagnose_infeasibility(ir, lower_model, min_prefs_per_kid, deviation, timelimit).print()
@@ -0,0 +1,232 @@
+import os
+import sys
+import json
+import time
+import shutil
+import numpy as np
+import pandas as pd
+from collections import Counter
+from datetime import datetime
+
+# Add the project root to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from helpers import read_dfs, read_variables
+from instance import encode_instance
+from code.models import CP
+from code.models.cache import PROCESSED_FILES, instance_digest, model_key, get_cached_model
+from code.models.neighbourhood import student_graph, neighbourhood, solve_growing
+from code.models.repair import BACKENDS, LIMITS_FILE, read_run_config, load_backend_model
+from code.evaluation.check_constraints import assignment_groups
+from code.evaluation.batch_score import score_batch
+from code.evaluation.evaluate_results import run_evaluate
+
+# Neighbourhood radius around the changed students, grown one step at a time when it is too tight
+MAX_RADIUS = 3
+
+def snapshot_folder(school, method):
+    return os.path.join("data/results", school, method, "instances")
+
+def save_instance_snapshot(school, processed_data_folder, method, timestamp, limits):
+    # Copy of the processed CSVs a run was solved on, read back like any other school folder,
+    # with the min_prefs and deviation the solution was solved with
+    folder = os.path.join(snapshot_folder(school, method), f"{method}_{timestamp}")
+    os.makedirs(folder, exist_ok=True)
+    for filename in PROCESSED_FILES:
+        shutil.copy2(os.path.join(processed_data_folder, school, filename), os.path.join(folder, filename))
+    if limits is not None:
+        min_prefs, deviation = limits
+        with open(os.path.join(folder, LIMITS_FILE), 'w') as file:
+            json.dump({"min_prefs": int(min_prefs), "deviation": float(deviation)}, file)
+
+def new_timestamp(school, method):
+    # Same minute format as main.py, with seconds added when a run of this minute already exists
+    timestamp = datetime.now().strftime("%d-%m_%H:%M")
+    if os.path.exists(os.path.join("data/results", school, method, "solutions", f"{method}_{timestamp}.csv")):
+        timestamp = datetime.now().strftime("%d-%m_%H:%M:%S")
+    return timestamp
+
+def row_counts(df, columns):
+    return Counter(df[columns].fillna('').astype(str).itertuples(index=False, name=None))
+
+class InstanceDiff:
+    def __init__(self, old, new):
+        old_students = old.info_students.set_index('Student')
+        new_students = new.info_students.set_index('Student')
+        self.added_students = sorted(set(new_students.index) - set(old_students.index))
+        self.removed_students = sorted(set(old_students.index) - set(new_students.index))
+
+        # Students whose attributes or preferences changed
+        common = new_students.index.intersection(old_students.index)
+        columns = [c for c in new_students.columns if c in old_students.columns]
+        old_rows = old_students.loc[common, columns].fillna('').astype(str)
+        new_rows = new_students.loc[common, columns].fillna('').astype(str)
+        self.changed_students = sorted(common[(old_rows != new_rows).any(axis=1).to_numpy()].tolist())
+        self.columns_changed = list(old_students.columns) != list(new_students.columns)
+
+        # Constraint rows as multisets, so reordering the CSVs is not a change
+        pair_columns = ['Student 1', 'Student 2', 'Together']
+        teacher_columns = ['Student', 'Teacher', 'Together']
+        old_pairs, new_pairs = row_counts(old.constraints_students, pair_columns), row_counts(new.constraints_students, pair_columns)
+        old_rows, new_rows = row_counts(old.constraints_teachers, teacher_columns), row_counts(new.constraints_teachers, teacher_columns)
+        self.added_pairs = list((new_pairs - old_pairs).elements())
+        self.removed_pairs = list((old_pairs - new_pairs).elements())
+        self.added_teacher_rows = list((new_rows - old_rows).elements())
+        self.removed_teacher_rows = list((old_rows - new_rows).elements())
+
+        # Group settings and teachers change the whole model
+        self.settings_changed = not (old.group_preferences.equals(new.group_preferences) and old.info_teachers.equals(new.info_teachers))
+
+    def is_empty(self):
+        return not (self.added_students or self.removed_students or self.changed_students or self.columns_changed
+                    or self.added_pairs or self.removed_pairs or self.added_teacher_rows or self.removed_teacher_rows
+                    or self.settings_changed)
+
+    def constraints_only(self):
+        # Only pair and teacher rows changed, so the old model can be patched
+        return not (self.added_students or self.removed_students or self.changed_students or self.columns_changed or self.settings_changed)
+
+    def affected_students(self):
+        students = set(self.added_students) | set(self.changed_students)
+        for s1, s2, _ in self.added_pairs + self.removed_pairs:
+            students.update((s1, s2))
+        for student, _, _ in self.added_teacher_rows + self.removed_teacher_rows:
+            students.add(student)
+        return students
+
+    def print(self):
+        print(f"Students: {len(self.added_students)} added, {len(self.removed_students)} removed, {len(self.changed_students)} changed")
+        print(f"Student constraints: {len(self.added_pairs)} added, {len(self.removed_pairs)} removed")
+        print(f"Teacher constraints: {len(self.added_teacher_rows)} added, {len(self.removed_teacher_rows)} removed")
+        if self.settings_changed:
+            print("Group settings or teachers changed")
+
+def patch_model(model, x, old_ir, old_data, diff):
+    # Proto constraint r is IR row r (see CP.lower_model), removed rows are cleared and new rows appended
+    instance = old_ir.instance
+    pairs = old_data.constraints_students[['Student 1', 'Student 2', 'Together']].fillna('').astype(str)
+    teacher_rows = old_data.constraints_teachers[['Student', 'Teacher', 'Together']].fillna('').astype(str)
+
+    removed = []
+    for values, family, table in ((diff.removed_pairs, 'student_pair', pairs), (diff.removed_teacher_rows, 'student_teacher', teacher_rows)):
+        rows = old_ir.family_rows(family)
+        used = set()
+        for value in values:
+            source = next(i for i, row in enumerate(table.itertuples(index=False, name=None)) if row == value and i not in used)
+            used.add(source)
+            removed.extend(rows[old_ir.row_source[rows] == source].tolist())
+    for r in removed:
+        model.Proto().constraints[r].Clear()
+
+    for s1, s2, together in diff.added_pairs:
+        for teacher in instance.teachers:
+            if together == 'Yes':
+                model.Add(x[(s1, teacher)] == x[(s2, teacher)])
+            else:
+                model.Add(x[(s1, teacher)] + x[(s2, teacher)] <= 1)
+    for student, teacher, together in diff.added_teacher_rows:
+        model.Add(x[(student, teacher)] == int(together == 'Yes'))
+    return model
+
+def load_patched_model(school, processed_data_folder, old_name, old_folder, old_data, diff, min_prefs, deviation):
+    # The model of the previous instance from the cache, patched in memory only. patch_model maps IR rows onto
+    # proto constraints by position, so a patched model must never be cached as if it were lowered from its IR
+    old_key = model_key(instance_digest(old_name, old_folder), method="CP", min_prefs=min_prefs, deviation=deviation, debug_names=False)
+    cached = get_cached_model(school, old_key, "pb")
+    if cached is None:
+        return None
+
+    model, x = CP.read_model(*cached)
+    old_ir = CP.create_model_ir(old_name, old_folder)
+    return patch_model(model, x, old_ir, old_data, diff), x
+
+def resolve(school, processed_data_folder, method, timestamp, timelimit=30, radius=1):
+    method = method.upper()
+    old_name = f"{method}_{timestamp}"
+    old_folder = snapshot_folder(school, method)
+    if not os.path.isdir(os.path.join(old_folder, old_name)):
+        print(f"No instance snapshot for {old_name}, run main.py first")
+        return None
+
+    old_data = read_dfs(old_name, old_folder)
+    data = read_dfs(school, processed_data_folder)
+    diff = InstanceDiff(old_data, data)
+    diff.print()
+    if diff.is_empty():
+        print("Nothing changed since this run.")
+        return None
+
+    limits = read_run_config(school, method, timestamp)
+    if limits is None:
+        print(f"No min_prefs and deviation stored for {old_name}, can not re-solve it with the limits it was solved with")
+        return None
+    min_prefs, deviation = limits
+    instance = encode_instance(data, read_variables(data))
+    balance_attributes = BACKENDS[method].get_balance_attributes(data)
+
+    # The previous solution is the hint, new students start unassigned
+    solution_path = os.path.join("data/results", school, method, "solutions", f"{old_name}.csv")
+    group, _, _ = assignment_groups(instance, pd.read_csv(solution_path))
+    before = score_batch(instance, group, balance_attributes, min_prefs, deviation)
+    print(f"Previous assignment on the new instance: objective {before.objective[0]:.5f}, {int(before.n_violations[0])} hard constraint violations")
+
+    start = time.time()
+    loaded = None
+    if method == "CP" and diff.constraints_only():
+        loaded = load_patched_model(school, processed_data_folder, old_name, old_folder, old_data, diff, min_prefs, deviation)
+        if loaded is not None:
+            print(f"Patched the cached model in {time.time() - start:.1f}s")
+    if loaded is None:
+        loaded = load_backend_model(school, processed_data_folder, method, data, instance, min_prefs, deviation)
+        print(f"Model loaded in {time.time() - start:.1f}s")
+    model, x = loaded
+
+    # Start from the changed students, and the students that preferred or were paired with removed ones
+    if diff.settings_changed or diff.columns_changed:
+        seeds = np.arange(instance.n_students)
+    else:
+        seeds = [instance.student_index[s] for s in diff.affected_students() if s in instance.student_index]
+        if diff.removed_students:
+            old_instance = encode_instance(old_data, read_variables(old_data))
+            removed = [old_instance.student_index[s] for s in diff.removed_students]
+            near = neighbourhood(student_graph(old_instance), removed, 1)
+            seeds += [instance.student_index[old_instance.students[s]] for s in np.flatnonzero(near)
+                      if old_instance.students[s] in instance.student_index]
+        seeds = np.unique(np.asarray(seeds, dtype=np.int64))
+
+    solution, _ = solve_growing(model, x, instance, group, seeds, timelimit, None, radius, MAX_RADIUS)
+    if solution is None:
+        print("No solution found for the changed instance, run main.py for a full solve.")
+        return None
+
+    df = CP.format_solution(solution)
+    new_group, _, _ = assignment_groups(instance, df)
+    after = score_batch(instance, new_group, balance_attributes, min_prefs, deviation)
+    moved = np.flatnonzero((new_group != group) & (group >= 0))
+    print(f"Re-solved in {time.time() - start:.1f}s: objective {after.objective[0]:.5f}, "
+          f"{int(after.n_violations[0])} hard constraint violations, {len(moved)} students moved")
+    return df, limits
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print("Usage: python3 code/models/incremental.py <school> <method: cp|ilp|highs> <timestamp of the previous run> [timelimit]")
+        sys.exit(1)
+
+    school = sys.argv[1]
+    method = sys.argv[2].upper()
+    timestamp = sys.argv[3]
+    timelimit = int(sys.argv[4]) if len(sys.argv) > 4 else 30
+
+    processed_data_folder = 'data/processed_data'
+    result = resolve(school, processed_data_folder, method, timestamp, timelimit)
+    if result is not None:
+        df, limits = result
+
+        # Saved as a new run of the same method, with its own snapshot for the next change
+        timestamp = new_timestamp(school, method)
+        solution_folder = os.path.join("data/results", school, method, "solutions")
+        os.makedirs(solution_folder, exist_ok=True)
+        df.to_csv(os.path.join(solution_folder, f"{method}_{timestamp}.csv"), index=False)
+        save_instance_snapshot(school, processed_data_folder, method, timestamp, limits)
+        run_evaluate(school, processed_data_folder, method, df, timestamp)
+        print(f"Saved to {os.path.join(solution_folder, f'{method}_{timestamp}.xlsx')}")
@@ -0,0 +1,91 @@
+import time
+import numpy as np
+from scipy.sparse import coo_matrix
+from ortools.sat.python import cp_model
+
+# A free student that leaves its group costs this share of the largest objective coefficient,
+# so students outside the edits only move when that buys a satisfied preference
+DISRUPTION_SHARE = 0.5
+
+def student_graph(instance):
+    # Symmetric adjacency of students that share a preference or a pair constraint
+    n = instance.n_students
+    rows = np.concatenate([instance.pref_src, instance.pair_s1])
+    cols = np.concatenate([instance.pref_dst, instance.pair_s2])
+    graph = coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n, n)).tocsr()
+    return ((graph + graph.T) > 0).astype(np.int8)
+
+def neighbourhood(graph, seeds, radius):
+    # Boolean mask of the students within radius steps of the seed students
+    reached = np.zeros(graph.shape[0], dtype=bool)
+    reached[seeds] = True
+    frontier = reached.copy()
+    for _ in range(radius):
+        frontier = (graph @ frontier.astype(np.int8) > 0) & ~reached
+        if not frontier.any():
+            break
+        reached |= frontier
+    return reached
+
+def add_disruption_penalty(model, stay, share=DISRUPTION_SHARE):
+    # The models maximize, so leaving a group is penalized as a reward for every stay literal that holds
+    objective = model.Proto().floating_point_objective
+    weight = share * max(abs(c) for c in objective.coeffs)
+    for var in stay:
+        objective.vars.append(var.Index())
+        objective.coeffs.append(weight)
+
+def solve_neighbourhood(model, x, students, teachers, group, free, timelimit, fixed=None):
+    # Students outside free keep their group, students in fixed (index -> group) are pinned there,
+    # and free students pay a penalty for leaving their group.
+    # The whole assignment is passed as a hint, the model itself is left unchanged
+    model = model.Clone()
+    fixed = fixed or {}
+    stay = []
+    for s, student in enumerate(students):
+        if s in fixed:
+            model.Add(x[(student, teachers[fixed[s]])] == 1)
+        elif not free[s] and group[s] >= 0:
+            model.Add(x[(student, teachers[group[s]])] == 1)
+        elif group[s] >= 0:
+            stay.append(x[(student, teachers[group[s]])])
+        for t, teacher in enumerate(teachers):
+            model.AddHint(x[(student, teacher)], int(group[s] == t))
+    add_disruption_penalty(model, stay)
+
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = timelimit
+    solver.parameters.random_seed = 42
+    solver.parameters.num_search_workers = 1
+    status = solver.Solve(model)
+
+    if status in (cp_model.FEASIBLE, cp_model.OPTIMAL):
+        solution = {key: solver.Value(var) for key, var in x.items()}
+        return solution, solver.StatusName(status)
+    return None, solver.StatusName(status)
+
+def solve_growing(model, x, instance, group, seeds, timelimit, fixed=None, radius=1, max_radius=3):
+    # Re-optimize the students within radius of the seeds, growing the radius while that is infeasible.
+    # The last round frees every student that is not fixed. All rounds share timelimit
+    graph = student_graph(instance)
+    fixed = fixed or {}
+    deadline = time.time() + timelimit
+    status = None
+    for r in range(radius, max_radius + 2):
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        if r <= max_radius:
+            free = neighbourhood(graph, seeds, r)
+        else:
+            free = np.ones(instance.n_students, dtype=bool)
+        print(f"Re-optimizing {int(free.sum()) - len(fixed)} students (radius {r if r <= max_radius else 'all'})")
+        solution, status = solve_neighbourhood(model, x, instance.students, instance.teachers, group, free, remaining, fixed)
+        if solution is not None:
+            return solution, status
+        print(f"  {status}")
+
+        # Growing the radius does not help once everybody is free already
+        if free.all():
+            break
+    return None, status
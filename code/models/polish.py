@@ -0,0 +1,126 @@
+import time
+import numpy as np
+from helpers import read_dfs, read_variables
+from instance import encode_instance
+from code.evaluation.assignment_state import AssignmentState
+from code.evaluation.check_constraints import solution_groups
+
+# Seconds spent polishing a timed out phase when --polish is given without a value
+POLISH_TIME = 30
+
+# Iterations a student may not move back to the group it just left
+TABU_TENURE = 20
+
+# Objective changes below this are rounding noise
+EPSILON = 1e-9
+
+def candidate_groups(state, s):
+    # Groups of the students s prefers and of the students that prefer s, other than its own group
+    instance = state.instance
+    preferred = instance.pref_dst[state.out_edges[state.out_ptr[s]:state.out_ptr[s + 1]]]
+    preferring = instance.pref_src[state.in_edges[state.in_ptr[s]:state.in_ptr[s + 1]]]
+    groups = np.unique(state.group[np.concatenate([preferred, preferring])])
+    return groups[(groups >= 0) & (groups != state.group[s])]
+
+def neighbours(state, s):
+    # Moving s to a candidate group, or swapping it with a member of that group
+    own = int(state.group[s])
+    for t in candidate_groups(state, s).tolist():
+        yield [(s, t)]
+        for u in np.flatnonzero(state.group == t).tolist():
+            yield [(s, t), (u, own)]
+
+def apply_moves(state, moves):
+    # Applies (student, group) moves in order and returns the moves that undo them
+    undo = [(s, int(state.group[s])) for s, _ in moves]
+    for s, t in moves:
+        state.move_index(s, t)
+    return undo[::-1]
+
+def unsatisfied_students(state):
+    # Students with preferences left to satisfy, the only ones a move can help directly
+    return np.flatnonzero(state.satisfied < state.num_prefs)
+
+def hill_climb(state, deadline, rng, log):
+    # First improving valid move or swap per student, until a full pass finds none
+    improved = True
+    while improved and time.time() < deadline:
+        improved = False
+        for s in rng.permutation(unsatisfied_students(state)).tolist():
+            if time.time() > deadline:
+                break
+            for moves in neighbours(state, s):
+                before = state.objective()
+                undo = apply_moves(state, moves)
+                if state.is_valid() and state.objective() > before + EPSILON:
+                    improved = True
+                    log(float(state.objective()))
+                    break
+                apply_moves(state, undo)
+    return state.group.copy()
+
+def tabu_search(state, deadline, rng, log, tenure=TABU_TENURE):
+    # Takes the best valid neighbour of a random unsatisfied student even when it is worse.
+    # Moving back to a group left less than tenure iterations ago is only allowed when it beats the best assignment
+    best_objective = state.objective()
+    best_group = state.group.copy()
+    tabu = {}
+    iteration = 0
+    while time.time() < deadline:
+        iteration += 1
+        students = unsatisfied_students(state)
+        if len(students) == 0:
+            break
+        s = int(rng.choice(students))
+
+        chosen, chosen_objective = None, None
+        for moves in neighbours(state, s):
+            undo = apply_moves(state, moves)
+            objective, valid = state.objective(), state.is_valid()
+            apply_moves(state, undo)
+            if not valid:
+                continue
+            allowed = all(tabu.get(move, 0) < iteration for move in moves) or objective > best_objective + EPSILON
+            if allowed and (chosen is None or objective > chosen_objective):
+                chosen, chosen_objective = moves, objective
+        if chosen is None:
+            continue
+
+        for student, group in apply_moves(state, chosen):
+            tabu[(student, group)] = iteration + tenure
+        if state.objective() > best_objective + EPSILON:
+            best_objective = state.objective()
+            best_group = state.group.copy()
+            log(float(best_objective))
+    return best_group
+
+class Polisher:
+    # Local search on the incumbent of a phase that stopped at the time limit.
+    # Built once per run, every phase passes its own min_prefs and deviation
+    def __init__(self, school, processed_data_folder, balance_attributes, timelimit=POLISH_TIME, tabu=False):
+        data = read_dfs(school, processed_data_folder)
+        self.instance = encode_instance(data, read_variables(data))
+        self.balance_attributes = balance_attributes
+        self.timelimit = timelimit
+        self.tabu = tabu
+
+    def polish(self, solution, min_prefs, deviation, log):
+        # solution and the result are {(student, teacher): 0/1} like the solver output,
+        # log(objective) is called for every improvement
+        instance = self.instance
+        state = AssignmentState(instance, solution_groups(instance, solution), self.balance_attributes, min_prefs, deviation)
+        if not state.is_valid():
+            print(f"Not polishing, the solution violates {state.n_violated} hard constraint rows")
+            return solution
+
+        start_objective = state.objective()
+        deadline = time.time() + self.timelimit
+        rng = np.random.default_rng(42)
+        group = hill_climb(state, deadline, rng, log)
+        if self.tabu:
+            group = tabu_search(state, deadline, rng, log)
+        print(f"Polishing improved the objective from {start_objective:.5f} to "
+              f"{AssignmentState(instance, group, self.balance_attributes, min_prefs, deviation).objective():.5f}")
+
+        return {(student, teacher): int(group[instance.student_index[student]] == instance.teacher_index[teacher])
+                for student, teacher in solution}
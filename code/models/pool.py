@@ -0,0 +1,64 @@
+import os
+import numpy as np
+from helpers import read_dfs, read_variables
+from instance import encode_instance
+from code.evaluation.check_constraints import solution_groups, assignment_frame
+from code.evaluation.batch_score import score_batch
+
+# Number of alternatives kept when --pool is given without a value
+POOL_SIZE = 5
+
+# Students that must be in a different group before two assignments count as alternatives
+MIN_DISTANCE = 10
+
+class SolutionPool:
+    # The best assignments of one phase that differ from each other in at least min_distance students.
+    # Built once per run, solve_model clears it at the start of every phase
+    def __init__(self, school, processed_data_folder, balance_attributes, size=POOL_SIZE, min_distance=MIN_DISTANCE):
+        data = read_dfs(school, processed_data_folder)
+        self.instance = encode_instance(data, read_variables(data))
+        self.balance_attributes = balance_attributes
+        self.size = size
+        self.min_distance = min_distance
+        self.clear()
+
+    def clear(self):
+        self.groups = np.zeros((0, self.instance.n_students), dtype=np.int64)
+        self.objectives = np.zeros(0)
+        self.seen = set()
+
+    def add(self, solution, objective):
+        # Returns True if the assignment entered the pool
+        group = solution_groups(self.instance, solution)
+        key = hash(group.tobytes())
+        if key in self.seen:
+            return False
+        self.seen.add(key)
+
+        # A close entry that is at least as good keeps its place, worse close entries are replaced
+        close = (self.groups != group).sum(axis=1) < self.min_distance
+        if (self.objectives[close] >= objective).any():
+            return False
+        groups = np.vstack([self.groups[~close], group])
+        objectives = np.append(self.objectives[~close], objective)
+
+        order = np.argsort(-objectives, kind='stable')[:self.size]
+        self.groups, self.objectives = groups[order], objectives[order]
+        return bool((order == len(objectives) - 1).any())
+
+    def export(self, results_folder, method, timestamp, min_prefs, deviation):
+        # One Student/Teacher CSV per alternative and a summary with the objective components of each
+        folder = os.path.join(results_folder, "pool", f"{method}_{timestamp}")
+        os.makedirs(folder, exist_ok=True)
+
+        labels = [f"{rank + 1}" for rank in range(len(self.groups))]
+        scores = score_batch(self.instance, self.groups, self.balance_attributes, min_prefs, deviation)
+        summary = scores.to_frame(labels)
+        summary.insert(0, "Solver Objective", self.objectives)
+        summary["Students Moved From Best"] = (self.groups != self.groups[:1]).sum(axis=1)
+        summary.to_csv(os.path.join(folder, "summary.csv"), index_label="Rank")
+
+        for label, group in zip(labels, self.groups):
+            assignment_frame(self.instance, group).to_csv(os.path.join(folder, f"{method}_{timestamp}_{label}.csv"), index=False)
+        print(f"Saved {len(self.groups)} alternative assignments to {folder}")
+        return summary
@@ -0,0 +1,156 @@
+import os
+import sys
+import json
+import time
+import numpy as np
+import pandas as pd
+
+# Add the project root to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from helpers import read_dfs, read_variables
+from instance import encode_instance
+from code.models import CP, ILP, HiGHS
+from code.models.IR import build_model_ir
+from code.models.cache import instance_digest
+from code.models.neighbourhood import solve_growing
+from code.evaluation.check_constraints import assignment_groups, run_check_constraints
+from code.evaluation.batch_score import score_batch
+from code.evaluation.evaluate_results import run_evaluate
+
+BACKENDS = {"CP": CP, "ILP": ILP, "HIGHS": HiGHS}
+
+# Neighbourhood radius around the edited students, grown one step at a time when it is too tight
+MAX_RADIUS = 3
+
+def read_groups_sheet(path):
+    # 'Groups' has one column per teacher with its students, padded with empty cells
+    groups = pd.read_excel(path, sheet_name='Groups', dtype=str)
+    df = groups.melt(var_name='Teacher', value_name='Student').dropna(subset=['Student'])
+    df['Student'] = df['Student'].str.strip()
+    df = df[df['Student'] != '']
+    return df[['Student', 'Teacher']].reset_index(drop=True)
+
+def read_stored_solution(path):
+    # 'Student info' is written from the solution itself and is not edited by hand
+    info = pd.read_excel(path, sheet_name='Student info')
+    return info[['Student', 'Assigned Group']].rename(columns={'Assigned Group': 'Teacher'})
+
+# Limits a run was solved with, written next to its instance snapshot
+LIMITS_FILE = "limits.json"
+
+def read_run_config(school, method, timestamp):
+    # min_prefs and deviation of the phase that produced the solution, from the snapshot or else from the solver log.
+    # None when neither has them, a re-solve with other limits than the run would score and patch the wrong model
+    limits_path = os.path.join("data/results", school, method, "instances", f"{method}_{timestamp}", LIMITS_FILE)
+    if os.path.exists(limits_path):
+        with open(limits_path, 'r') as file:
+            limits = json.load(file)
+        return int(limits["min_prefs"]), float(limits["deviation"])
+
+    log_path = os.path.join("data/results", school, method, "logs", f"{method}_{timestamp}.csv")
+    config = {}
+    if os.path.exists(log_path):
+        with open(log_path, 'r') as file:
+            for line in file:
+                key, _, value = line.strip().partition(',')
+                if key in ("Min Prefs Per Kid", "Deviation"):
+                    config[key] = value
+    if "Min Prefs Per Kid" not in config or "Deviation" not in config:
+        return None
+    return int(config["Min Prefs Per Kid"]), float(config["Deviation"])
+
+def load_backend_model(school, processed_data_folder, method, data, instance, min_prefs, deviation):
+    # CP models come from the model cache, the hard constraints of the other methods are rebuilt for CP-SAT
+    if method == "CP":
+        model, x, _ = CP.load_model(school, processed_data_folder, min_prefs, deviation, instance_digest(school, processed_data_folder))
+        return model, x
+    ir = build_model_ir(instance, BACKENDS[method].get_balance_attributes(data))
+    return CP.lower_model(ir.set_limits(min_prefs, deviation))
+
+def repair(school, processed_data_folder, excel_path, timelimit=30, min_prefs=None, deviation=None, radius=1):
+    stem = os.path.splitext(os.path.basename(excel_path))[0]
+    method, timestamp = stem.split('_', 1)
+    method = method.upper()
+
+    # Limits given on the command line win over the stored ones
+    if min_prefs is None or deviation is None:
+        stored = read_run_config(school, method, timestamp)
+        if stored is None:
+            print(f"No limits stored for {method}_{timestamp}, pass min_prefs_per_kid and deviation")
+            return None
+        min_prefs = stored[0] if min_prefs is None else min_prefs
+        deviation = stored[1] if deviation is None else deviation
+
+    data = read_dfs(school, processed_data_folder)
+    variables = read_variables(data)
+    instance = encode_instance(data, variables)
+    balance_attributes = BACKENDS[method].get_balance_attributes(data)
+
+    stored, _, _ = assignment_groups(instance, read_stored_solution(excel_path))
+    edited, unknown, duplicated = assignment_groups(instance, read_groups_sheet(excel_path))
+    if len(unknown) or duplicated:
+        run_check_constraints(read_groups_sheet(excel_path), data, variables, balance_attributes, min_prefs, deviation)
+        print("Fix the names in the 'Groups' sheet first.")
+        return None
+
+    # Teacher made moves are locked, students that disappeared from the sheet are placed freely
+    moved = np.flatnonzero((edited != stored) & (edited >= 0))
+    missing = np.flatnonzero(edited < 0)
+    print(f"{len(moved)} students were moved by hand, {len(missing)} are missing from the 'Groups' sheet")
+    if len(moved) == 0 and len(missing) == 0:
+        print("Nothing to repair.")
+        return None
+
+    before = score_batch(instance, edited, balance_attributes, min_prefs, deviation)
+    print(f"Edited assignment: objective {before.objective[0]:.5f}, {int(before.n_violations[0])} hard constraint violations")
+
+    start = time.time()
+    model, x = load_backend_model(school, processed_data_folder, method, data, instance, min_prefs, deviation)
+    print(f"Model loaded in {time.time() - start:.1f}s")
+
+    # Only students close to the edits in the preference and constraint graph are re-optimized
+    seeds = np.concatenate([moved, missing])
+    fixed = {int(s): int(edited[s]) for s in moved}
+    solution, _ = solve_growing(model, x, instance, edited, seeds, timelimit, fixed, radius, MAX_RADIUS)
+
+    if solution is None:
+        print("The locked moves can not be completed to a valid assignment:")
+        run_check_constraints(read_groups_sheet(excel_path), data, variables, balance_attributes, min_prefs, deviation)
+        return None
+
+    df = CP.format_solution(solution)
+    repaired, _, _ = assignment_groups(instance, df)
+    after = score_batch(instance, repaired, balance_attributes, min_prefs, deviation)
+    changed = np.flatnonzero((repaired != edited) & (edited >= 0))
+    print(f"Repaired assignment in {time.time() - start:.1f}s: objective {after.objective[0]:.5f}, "
+          f"{int(after.n_violations[0])} hard constraint violations, {len(changed)} more students moved")
+    for s in changed:
+        print(f"  {instance.students[s]}: {instance.teachers[edited[s]]} -> {instance.teachers[repaired[s]]}")
+    return df, method, (min_prefs, deviation)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python3 code/models/repair.py <school> <edited.xlsx> [timelimit] [min_prefs_per_kid] [deviation]")
+        sys.exit(1)
+
+    school = sys.argv[1]
+    excel_path = sys.argv[2]
+    timelimit = int(sys.argv[3]) if len(sys.argv) > 3 else 30
+    min_prefs_per_kid = int(sys.argv[4]) if len(sys.argv) > 4 else None
+    deviation = float(sys.argv[5]) if len(sys.argv) > 5 else None
+
+    processed_data_folder = 'data/processed_data'
+    from code.models.incremental import save_instance_snapshot, new_timestamp
+    result = repair(school, processed_data_folder, excel_path, timelimit, min_prefs_per_kid, deviation)
+    if result is not None:
+        df, method, limits = result
+
+        # Saved as a new run of the same method with the limits it was repaired with, so the evaluation and Excel output
+        # are written as usual and the repaired run can be repaired or re-solved again
+        timestamp = new_timestamp(school, method)
+        solution_folder = os.path.join("data/results", school, method, "solutions")
+        os.makedirs(solution_folder, exist_ok=True)
+        df.to_csv(os.path.join(solution_folder, f"{method}_{timestamp}.csv"), index=False)
+        save_instance_snapshot(school, processed_data_folder, method, timestamp, limits)
+        run_evaluate(school, processed_data_folder, method, df, timestamp)
+        print(f"Saved to {os.path.join(solution_folder, f'{method}_{timestamp}.xlsx')}")
@@ -0,0 +1,83 @@
+import csv
+import math
+import queue
+import atexit
+import resource
+import threading
+
+# Seconds the writer thread waits between batches, rows queued meanwhile are written together
+FLUSH_INTERVAL = 0.5
+
+# Bounds at least this large are SCIP's infinity, there is no bound yet
+INFINITE_BOUND = 1e20
+
+# Solver log verbosity: 0 no solver log, 1 solver log to a file next to the CSV log, 2 to the file and stdout
+SOLVER_LOG = 1
+
+def finite_bound(bound):
+    # None while the solver has no bound yet
+    if bound is None or not math.isfinite(bound) or abs(bound) >= INFINITE_BOUND:
+        return None
+    return bound
+
+def relative_gap(objective, bound):
+    # Gap of the incumbent to the best bound, relative to the incumbent like CP-SAT and SCIP report it
+    bound = finite_bound(bound)
+    if objective is None or bound is None:
+        return None
+    return abs(bound - objective) / max(abs(objective), 1e-9)
+
+def peak_memory_mb():
+    # Peak resident memory of this process, ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def summary_row(presolve_time=None):
+    # Last row of a log, read back by add_efficiency
+    row = ["Summary"]
+    if presolve_time is not None:
+        row += ["Presolve Time (s)", round(presolve_time, 3)]
+    return row + ["Peak Memory (MB)", peak_memory_mb()]
+
+class LogWriter:
+    # Appends to a log file from a background thread, so a solver callback only puts a row on a queue.
+    # CSV rows, or plain lines with text=True. close() writes what is left and waits for the thread,
+    # it also runs at exit in case the solve is interrupted. A closed writer is unregistered again, so
+    # long processes with many phases do not keep every writer alive until exit
+    def __init__(self, path, text=False, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.text = text
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def write(self, row):
+        self.queue.put(row)
+
+    def run(self):
+        with open(self.path, mode='a', newline='') as file:
+            writer = csv.writer(file)
+            while True:
+                # Everything queued since the last batch goes out in one write
+                rows = []
+                while True:
+                    try:
+                        rows.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if self.text:
+                    file.writelines(line + "\n" for line in rows)
+                else:
+                    writer.writerows(rows)
+                file.flush()
+
+                if self.closed.is_set() and self.queue.empty():
+                    return
+                self.closed.wait(self.flush_interval)
+
+    def close(self):
+        self.closed.set()
+        self.thread.join()
+        atexit.unregister(self.close)
@@ -0,0 +1,75 @@
+import time
+import threading
+from code.models.search_log import relative_gap
+
+# Seconds between plateau checks of the watch thread
+PLATEAU_CHECK = 0.5
+
+class StopRules:
+    # Optional early stops: no new best solution for plateau seconds, a relative gap of at most gap,
+    # or an objective of at least target
+    def __init__(self, plateau=None, gap=None, target=None):
+        self.plateau = plateau
+        self.gap = gap
+        self.target = target
+
+    def any(self):
+        return self.plateau is not None or self.gap is not None or self.target is not None
+
+class StopMonitor:
+    # Follows one search and calls stop() once, when the first rule holds. reason is the rule that stopped it.
+    # With watch=True a thread checks the plateau, since no callback runs while the solver finds nothing new;
+    # otherwise the backend calls check_plateau() from its own events
+    def __init__(self, rules, stop, watch=True):
+        self.rules = rules
+        self.stop = stop
+        self.reason = None
+        self.objective = None
+        self.bound = None
+        self.last_improvement = None
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.thread = None
+        if watch and rules.plateau is not None:
+            self.thread = threading.Thread(target=self.watch, daemon=True)
+            self.thread.start()
+
+    def solution(self, objective, bound=None):
+        # Called for every new best solution
+        self.objective = objective
+        self.last_improvement = time.time()
+        if self.rules.target is not None and objective >= self.rules.target:
+            self.fire("target")
+        self.best_bound(bound)
+
+    def best_bound(self, bound):
+        if bound is not None:
+            self.bound = bound
+        gap = relative_gap(self.objective, self.bound)
+        if self.rules.gap is not None and gap is not None and gap <= self.rules.gap:
+            self.fire("gap")
+
+    def check_plateau(self):
+        # The plateau only starts counting at the first solution
+        if self.rules.plateau is not None and self.last_improvement is not None:
+            if time.time() - self.last_improvement >= self.rules.plateau:
+                self.fire("plateau")
+
+    def fire(self, reason):
+        # Nothing is stopped once the search has ended
+        with self.lock:
+            if self.reason is None and not self.done.is_set():
+                self.reason = reason
+                print(f"Stopping the search: {reason} rule reached")
+                self.stop()
+
+    def watch(self):
+        while not self.done.wait(PLATEAU_CHECK):
+            self.check_plateau()
+            if self.reason is not None:
+                return
+
+    def close(self):
+        self.done.set()
+        if self.thread is not None:
+            self.thread.join()
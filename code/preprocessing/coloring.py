@@ -0,0 +1,180 @@
+import time
+import heapq
+from collections import deque
+
+# Exact DSATUR search is tried on components up to this size and for this many seconds,
+# larger or harder components go to CP-SAT
+MAX_SEARCH_SIZE = 400
+MAX_SEARCH_TIME = 2
+
+# Conflicting components up to this size are shrunk to a minimal conflicting subgraph
+MAX_CERTIFICATE_SIZE = 60
+
+def connected_components(graph):
+    visited, components = set(), []
+    for start in graph:
+        if start in visited:
+            continue
+        visited.add(start)
+        queue, component = deque([start]), []
+        while queue:
+            student = queue.popleft()
+            component.append(student)
+            for neighbour in graph[student]:
+                if neighbour not in visited:
+                    visited.add(neighbour)
+                    queue.append(neighbour)
+        components.append(component)
+    return components
+
+def greedy_clique(graph, vertices):
+    # Grow a clique from each of the highest degree vertices, always adding the candidate with most neighbours
+    best = []
+    for start in sorted(vertices, key=lambda v: -len(graph[v]))[:20]:
+        clique, candidates = [start], set(graph[start])
+        while candidates:
+            v = max(candidates, key=lambda c: len(graph[c] & candidates))
+            clique.append(v)
+            candidates &= graph[v]
+        if len(clique) > len(best):
+            best = clique
+    return best
+
+def dsatur_greedy(graph, vertices):
+    # Colour the vertex with the most differently coloured neighbours first, using the lowest free colour.
+    # Outdated heap entries are skipped when popped
+    color = {}
+    saturation = {v: set() for v in vertices}
+    heap = [(0, -len(graph[v]), i, v) for i, v in enumerate(vertices)]
+    heapq.heapify(heap)
+    order = len(heap)
+    while heap:
+        negative_saturation, _, _, v = heapq.heappop(heap)
+        if v in color or -negative_saturation != len(saturation[v]):
+            continue
+        c = next(c for c in range(len(vertices)) if c not in saturation[v])
+        color[v] = c
+        for u in graph[v]:
+            if u not in color and c not in saturation[u]:
+                saturation[u].add(c)
+                order += 1
+                heapq.heappush(heap, (-len(saturation[u]), -len(graph[u]), order, u))
+    return color
+
+def dsatur_search(graph, vertices, n_colors, fixed, timelimit=MAX_SEARCH_TIME):
+    # Exact backtracking in DSATUR order, returns a colouring, False if there is none or None if the time ran out
+    vertex_set = set(vertices)
+    color = dict(fixed)
+    deadline = time.time() + timelimit
+
+    def search(n_used):
+        if time.time() > deadline:
+            return None
+
+        uncoloured = [v for v in vertices if v not in color]
+        if not uncoloured:
+            return True
+        v = max(uncoloured, key=lambda v: (len({color[u] for u in graph[v] if u in color}), len(graph[v] & vertex_set)))
+        used = {color[u] for u in graph[v] if u in color}
+
+        # Colours above n_used are interchangeable, so only the first unused one is tried
+        for c in range(min(n_used + 1, n_colors)):
+            if c in used:
+                continue
+            color[v] = c
+            result = search(max(n_used, c + 1))
+            if result is not False:
+                return result
+            del color[v]
+        return False
+
+    result = search(len(set(fixed.values())))
+    if result is None:
+        return None
+    return dict(color) if result else False
+
+def cp_sat_coloring(graph, vertices, n_colors, fixed, timelimit):
+    # Returns a colouring, False if CP-SAT proves there is none or None if it is unknown within the time limit
+    try:
+        from ortools.sat.python import cp_model
+    except ImportError:
+        return None
+
+    model = cp_model.CpModel()
+    color = {v: model.NewIntVar(0, n_colors - 1, "") for v in vertices}
+    for v in vertices:
+        for u in graph[v]:
+            if u in color and str(u) < str(v):
+                model.Add(color[u] != color[v])
+
+    # Fixing the clique removes colour symmetry
+    for v, c in fixed.items():
+        model.Add(color[v] == c)
+
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = timelimit
+    solver.parameters.num_workers = 1
+    status = solver.Solve(model)
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        return {v: solver.Value(color[v]) for v in vertices}
+    if status == cp_model.INFEASIBLE:
+        return False
+    return None
+
+def is_colorable(graph, vertices, n_colors, timelimit):
+    # True, False or None when it could not be decided
+    vertex_set = set(vertices)
+    subgraph = {v: graph[v] & vertex_set for v in vertices}
+
+    clique = greedy_clique(subgraph, vertices)
+    if len(clique) > n_colors:
+        return False
+
+    if len(set(dsatur_greedy(subgraph, vertices).values())) <= n_colors:
+        return True
+
+    fixed = {v: c for c, v in enumerate(clique)}
+    if len(vertices) <= MAX_SEARCH_SIZE:
+        result = dsatur_search(subgraph, vertices, n_colors, fixed)
+        if result is not None:
+            return result is not False
+
+    result = cp_sat_coloring(subgraph, vertices, n_colors, fixed, timelimit)
+    return None if result is None else result is not False
+
+def minimal_conflict(graph, vertices, n_colors, timelimit):
+    # Drop students one by one as long as the rest still can not be coloured
+    core = list(vertices)
+    for v in list(vertices):
+        rest = [u for u in core if u != v]
+        if is_colorable(graph, rest, n_colors, timelimit) is False:
+            core = rest
+    return core
+
+def k_colorability(graph, n_colors, timelimit=10):
+    # Check whether the students can be split over n_colors groups so no two neighbours share a group.
+    # Returns (True, None), (False, certificate) or (None, component) when a component could not be decided
+    undecided = None
+    for component in connected_components(graph):
+        if len(component) <= n_colors:
+            continue
+
+        vertex_set = set(component)
+        subgraph = {v: graph[v] & vertex_set for v in component}
+
+        # A clique with more students than groups is the smallest possible certificate
+        clique = greedy_clique(subgraph, component)
+        if len(clique) > n_colors:
+            return False, set(clique[:n_colors + 1])
+
+        result = is_colorable(graph, component, n_colors, timelimit)
+        if result is False:
+            if len(component) <= MAX_CERTIFICATE_SIZE:
+                return False, set(minimal_conflict(graph, component, n_colors, timelimit))
+            return False, set(component)
+        if result is None:
+            undecided = set(component)
+
+    if undecided is not None:
+        return None, undecided
+    return True, None
@@ -1,35 +1,80 @@
-import pandas as pd
+import numpy as np
 import os
+import io
+import sys
+import json
+import time
+import hashlib
 import warnings
+import contextlib
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
+from pandas.io.parsers import TextParser
 from validate_data import validate_grouping_data
-from helpers import InputData, read_variables
+from helpers import InputData, read_variables, write_sidecar
 
 warnings.filterwarnings('ignore', category=UserWarning, message='.*Data Validation extension is not supported.*')
 
+# Content hashes, timings and validation outcomes of the last preprocessing run per school
+MANIFEST_FILE = 'manifest.json'
+
+def convert_cell(value):
+    # Same conversion as pandas' openpyxl reader, so the parsed tables match pd.read_excel
+    if value is None:
+        return ""
+    if isinstance(value, str) and value in ERROR_CODES:
+        return np.nan
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def sheet_rows(rows):
+    # Drop empty trailing cells and rows, then pad every row to the same width
+    data = []
+    last_row_with_data = -1
+    for row_number, row in enumerate(rows):
+        while row and row[-1] == "":
+            row = row[:-1]
+        if row:
+            last_row_with_data = row_number
+        data.append(row)
+    data = data[:last_row_with_data + 1]
+
+    width = max((len(row) for row in data), default=0)
+    return [row + [""] * (width - len(row)) for row in data]
+
+def parse_table(rows, skiprows, nrows=None, header=0):
+    # Parse a block of rows with the parser pd.read_excel uses, reading only the rows it would read
+    rows_needed = None if nrows is None else skiprows + nrows + 1
+    data = sheet_rows(rows[:rows_needed])
+    return TextParser(data, header=header, skiprows=skiprows, nrows=nrows, skip_blank_lines=False).read(nrows=nrows)
+
 def read_data(excel_path):
-    # Define sheet names
-    sheets = pd.read_excel(excel_path, sheet_name=['Info Docenten', 'Info Leerlingen', 'Groepswensen', 'Eigen Indelingen'], skiprows=1)
-
-    # Read the sheets as dataframes
-    info_teachers = sheets['Info Docenten']
-    info_students = sheets['Info Leerlingen']
-    group_preferences = sheets['Groepswensen']
-    current_groups = sheets['Eigen Indelingen']
-
-    # Find the starting indices for each table
-    start_table_1 = group_preferences.index[0] + 1
-    start_table_2 = group_preferences[group_preferences.iloc[:, 0] == 'Naam Leerling 1'].index[0] + 2
-    start_table_3 = group_preferences[group_preferences.iloc[:, 0] == 'Naam Leerling'].index[0] + 2
-
-    # Find the end indices for each table based on the next table's start
-    end_table_1 = start_table_2  - 2
-    end_table_2 = start_table_3 - 2
-    end_table_3 = len(group_preferences) + 1
-
-    # Read each table into a separate dataframe using skiprows and nrows
-    group_preferences = pd.read_excel(excel_path, sheet_name='Groepswensen', skiprows=start_table_1, nrows=end_table_1 - start_table_1, header=None)
-    constraints_students = pd.read_excel(excel_path, sheet_name='Groepswensen', skiprows=start_table_2, nrows=end_table_2 - start_table_2)
-    constraints_teachers = pd.read_excel(excel_path, sheet_name='Groepswensen', skiprows=start_table_3, nrows=end_table_3 - start_table_3)
+    # Read every sheet in a single pass over the workbook
+    workbook = load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        rows = {sheet: [[convert_cell(value) for value in row] for row in workbook[sheet].iter_rows(values_only=True)]
+                for sheet in ['Info Docenten', 'Info Leerlingen', 'Groepswensen', 'Eigen Indelingen']}
+    finally:
+        workbook.close()
+
+    # Read the sheets as dataframes, the first row of every sheet is a title
+    info_teachers = parse_table(rows['Info Docenten'], skiprows=1)
+    info_students = parse_table(rows['Info Leerlingen'], skiprows=1)
+    current_groups = parse_table(rows['Eigen Indelingen'], skiprows=1)
+
+    # Find the tables in Groepswensen by the first cell of their header rows
+    first_cells = [row[0] if row else "" for row in rows['Groepswensen']]
+    header_table_2 = first_cells.index('Naam Leerling 1', 2)
+    header_table_3 = first_cells.index('Naam Leerling', 2)
+
+    # Same row ranges as before: the settings table starts on the third row and every table stops
+    # above the blank row and title in front of the next header
+    group_preferences = parse_table(rows['Groepswensen'], skiprows=1, nrows=header_table_2 - 3, header=None)
+    constraints_students = parse_table(rows['Groepswensen'], skiprows=header_table_2, nrows=header_table_3 - header_table_2 - 2)
+    constraints_teachers = parse_table(rows['Groepswensen'], skiprows=header_table_3)
 
     # Format the group preferences table
     group_preferences = group_preferences.iloc[1:].reset_index(drop=True).T
@@ -100,12 +145,13 @@ def save_dataframes_to_csv(school, data, processed_data_folder):
         file_path = os.path.join(school_processed_folder, f'{df_name}.csv')
         df.to_csv(file_path, index=False, na_rep='')
 
+    # Write the binary sidecar from the saved CSVs, so both always hold the same data
+    write_sidecar(school, processed_data_folder)
+
 
 def preprocess(school, raw_data_folder, processed_data_folder):
     # Get file path
-    school_path = os.path.join(raw_data_folder, school)
-    excel_file = [f for f in os.listdir(school_path) if f.endswith('.xlsx')][0]
-    excel_path = os.path.join(school_path, excel_file)
+    excel_path = get_excel_path(school, raw_data_folder)
 
     # Read in data
     info_teachers, info_students, group_preferences, constraints_students, constraints_teachers, current_groups = read_data(excel_path)
@@ -134,7 +180,8 @@ def preprocess(school, raw_data_folder, processed_data_folder):
 
     is_valid = validate_grouping_data(data, variables)
     if is_valid == False:
-        exit("Grouping data for {} is invalid. Please check the errors above.".format(school))
+        print("Grouping data for {} is invalid. Please check the errors above.".format(school))
+        return False
     else:
         print("Grouping data for {} is valid.".format(school))
 
@@ -142,23 +189,102 @@ def preprocess(school, raw_data_folder, processed_data_folder):
     # Save the processed data
     save_dataframes_to_csv(school, data, processed_data_folder)
     print("Data preprocessing for {} completed.".format(school))
+    return True
 
+def get_excel_path(school, raw_data_folder):
+    school_path = os.path.join(raw_data_folder, school)
+    excel_file = [f for f in os.listdir(school_path) if f.endswith('.xlsx')][0]
+    return os.path.join(school_path, excel_file)
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_manifest(processed_data_folder):
+    path = os.path.join(processed_data_folder, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as file:
+        return json.load(file)
+
+def write_manifest(manifest, processed_data_folder):
+    # Write to a temporary file first so an interrupted run keeps the previous manifest
+    os.makedirs(processed_data_folder, exist_ok=True)
+    path = os.path.join(processed_data_folder, MANIFEST_FILE)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+def preprocess_worker(school, excel_hash, raw_data_folder, processed_data_folder):
+    # Runs in a worker process, the output is collected so schools do not print through each other
+    start = time.time()
+    output = io.StringIO()
+    error = None
+    with contextlib.redirect_stdout(output):
+        try:
+            is_valid = preprocess(school, raw_data_folder, processed_data_folder)
+        except Exception as e:
+            is_valid = False
+            error = f"{type(e).__name__}: {e}"
+
+    return {
+        "school": school,
+        "hash": excel_hash,
+        "valid": is_valid,
+        "error": error,
+        "duration_s": round(time.time() - start, 3),
+        "processed_at": datetime.now().isoformat(timespec='seconds'),
+        "output": output.getvalue(),
+    }
 
-def run_preprocess(raw_data_folder, processed_data_folder):
-    for school in os.listdir(raw_data_folder):
-        if school == '.DS_Store' or school == 'school_1':
+def run_preprocess(raw_data_folder, processed_data_folder, max_workers=None):
+    manifest = read_manifest(processed_data_folder)
+
+    # Only schools whose workbook changed since the last run are processed again
+    jobs = []
+    for school in sorted(os.listdir(raw_data_folder)):
+        if school == '.DS_Store' or school == 'school_1' or not os.path.isdir(os.path.join(raw_data_folder, school)):
             print("Skipping file: {}".format(school))
             continue
 
-        # Only run preprocessing for school if it is not already processed
+        excel_hash = file_hash(get_excel_path(school, raw_data_folder))
+        entry = manifest.get(school)
         school_processed_folder = os.path.join(processed_data_folder, school)
-        if os.path.exists(school_processed_folder):
-            print("Data for {} already processed.".format(school))
-            continue
-
-        print("Running preprocessing for {}".format(school))
-
-        preprocess(school, raw_data_folder, processed_data_folder)
+        if entry and entry["hash"] == excel_hash:
+            if not entry["valid"]:
+                print("Workbook for {} is unchanged and still invalid.".format(school))
+                continue
+            if os.path.exists(school_processed_folder):
+                print("Data for {} already processed.".format(school))
+                continue
+
+        jobs.append((school, excel_hash))
+
+    if not jobs:
+        return manifest
+
+    print("Running preprocessing for {} schools".format(len(jobs)))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(preprocess_worker, school, excel_hash, raw_data_folder, processed_data_folder) for school, excel_hash in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            print("Running preprocessing for {}".format(result["school"]))
+            print(result.pop("output"), end='')
+            if result["error"]:
+                print("Preprocessing for {} failed: {}".format(result["school"], result["error"]))
+            if not result["valid"] and os.path.exists(os.path.join(processed_data_folder, result["school"])):
+                print("Warning: processed data for {} is from an older version of the workbook.".format(result["school"]))
+
+            # Save the manifest after every school, so finished schools are not redone after a crash
+            manifest[result.pop("school")] = result
+            write_manifest(manifest, processed_data_folder)
+
+    invalid = [school for school, _ in jobs if not manifest[school]["valid"]]
+    print("Preprocessed {} schools, {} invalid{}".format(len(jobs), len(invalid), ": " + ", ".join(invalid) if invalid else ""))
+    return manifest
 
 
 if __name__ == "__main__":
@@ -166,18 +292,8 @@ if __name__ == "__main__":
     raw_data_folder = 'data/raw_data'
     processed_data_folder = 'data/processed_data'
 
-    # Run preprocessing
-    run_preprocess(raw_data_folder, processed_data_folder)
-
-
-
-
-
-
-
-
-
-
-
-
+    # Number of worker processes (default one per CPU)
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
 
+    # Run preprocessing
+    run_preprocess(raw_data_folder, processed_data_folder, max_workers)
@@ -1,208 +1,230 @@
 import pandas as pd
+import numpy as np
 import os
 import sys
-from collections import defaultdict, deque
-import itertools
+from collections import defaultdict
 
 # Add the project root to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
-from helpers import create_preference_matrix
+from instance import PREFERENCE_COLUMNS
+
+try:
+    from .coloring import k_colorability
+except ImportError:
+    from coloring import k_colorability
+
+class Finding:
+    def __init__(self, severity, check, message, subjects=None):
+        self.severity = severity
+        self.check = check
+        self.message = message
+        self.subjects = subjects or []
+
+class ValidationReport:
+    def __init__(self):
+        self.findings = []
+
+    def error(self, check, message, subjects=None):
+        self.findings.append(Finding("Error", check, message, subjects))
+
+    def warning(self, check, message, subjects=None):
+        self.findings.append(Finding("Warning", check, message, subjects))
+
+    @property
+    def errors(self):
+        return [f for f in self.findings if f.severity == "Error"]
+
+    @property
+    def warnings(self):
+        return [f for f in self.findings if f.severity == "Warning"]
+
+    def is_valid(self):
+        return not self.errors
+
+    def print(self):
+        for finding in self.findings:
+            print(f"{finding.severity}: {finding.message}")
+
+    def to_records(self):
+        return [{"severity": f.severity, "check": f.check, "message": f.message, "subjects": [str(s) for s in f.subjects]} for f in self.findings]
 
 def validate_teachers(data, teachers):
     teachers_in_constraints = set(data.constraints_teachers['Teacher'])
+    teachers = set(teachers)
     invalid_teachers = [t for t in teachers_in_constraints if t not in teachers]
     return invalid_teachers
 
 def validate_students(data, students):
     students_in_constraints = set(data.constraints_students['Student 1']).union(set(data.constraints_students['Student 2']))
+    students = set(students)
     invalid_students = [s for s in students_in_constraints if s not in students]
     return invalid_students
 
-def validate_student_preference(data, variables, students):
-    preference_matrix = create_preference_matrix(data, variables)
-
-    for student in students:
-        preferences = preference_matrix.loc[student]
-        preferences = preferences[preferences == 1].index.tolist()
-
-        if len(preferences) != len(set(preferences)):
-            print(f"Error: {student} has duplicate preferences.")
-            return False
-        if student in preferences:
-            print(f"Error: {student} has themselves as a preference.")
-            return False
-    return True
-
-
-def build_together_groups(data):
-    graph = defaultdict(set)
-
-    # Filter to only "Yes"
-    for _, row in data.constraints_students[data.constraints_students["Together"] == "Yes"].iterrows():
-        a, b = row["Student 1"], row["Student 2"]
-        graph[a].add(b)
-        graph[b].add(a)
-
-    visited, groups = set(), []
-    for student in graph:
-        if student in visited:
-            continue
-        queue = deque([student])
-        group = set()
-        while queue:
-            curr = queue.popleft()
-            if curr in visited:
-                continue
-            visited.add(curr)
-            group.add(curr)
-            queue.extend(graph[curr] - visited)
-        groups.append(group)
-
-    return groups
+def duplicate_students(students):
+    counts = pd.Series(students, dtype=object).value_counts()
+    return counts[counts > 1].index.tolist()
+
+def validate_student_preference(data, students, report):
+    # One pass over the int-coded preference columns, -1 is an empty or unknown preference
+    columns = [c for c in PREFERENCE_COLUMNS if c in data.info_students.columns]
+    names = data.info_students[columns].to_numpy(dtype=object)
+    # A duplicated name refers to its first student, the duplicate itself is reported by validation_report
+    first = {}
+    for i, student in enumerate(students):
+        first.setdefault(student, i)
+    codes = np.array([first.get(name, -1) if pd.notna(name) else -1 for name in names.ravel()], dtype=np.int64).reshape(names.shape)
+    filled = pd.notna(names)
+
+    # Self references
+    own = np.arange(len(students))[:, None]
+    for i in np.flatnonzero((codes == own).any(axis=1)):
+        report.warning("preferences", f"{students[i]} has themselves as a preference.", [students[i]])
+
+    # Duplicates: equal neighbours after sorting each row
+    ordered = np.sort(codes, axis=1)
+    duplicate = ((ordered[:, 1:] == ordered[:, :-1]) & (ordered[:, 1:] >= 0)).any(axis=1)
+    for i in np.flatnonzero(duplicate):
+        report.warning("preferences", f"{students[i]} has duplicate preferences.", [students[i]])
+
+    # Preferences for students that do not exist
+    for i in np.flatnonzero((filled & (codes == -1)).any(axis=1)):
+        unknown = [name for name, code in zip(names[i], codes[i]) if pd.notna(name) and code == -1]
+        report.warning("preferences", f"{students[i]} has preferences for unknown students: {unknown}", [students[i]] + unknown)
+
+
+def find(parent, student):
+    # Union-find root lookup with path halving
+    while parent[student] != student:
+        parent[student] = parent[parent[student]]
+        student = parent[student]
+    return student
+
+def union(parent, a, b):
+    root_a, root_b = find(parent, a), find(parent, b)
+    if root_a != root_b:
+        parent[root_b] = root_a
+
+def build_together_components(data):
+    # Students that have to be together end up with the same root
+    parent = {}
+    together = data.constraints_students[data.constraints_students["Together"] == "Yes"]
+    for a, b in zip(together["Student 1"], together["Student 2"]):
+        parent.setdefault(a, a)
+        parent.setdefault(b, b)
+        union(parent, a, b)
+    return parent
+
+def build_together_groups(data, parent=None):
+    if parent is None:
+        parent = build_together_components(data)
+
+    groups = defaultdict(set)
+    for student in parent:
+        groups[find(parent, student)].add(student)
+    return list(groups.values())
 
 def can_separate(graph, n_groups):
-    color = {}
-
-    def is_valid(student, c):
-        return all(color.get(neigh) != c for neigh in graph[student])
+    # Split per connected component, with DSATUR, clique bounds and a time-bounded CP-SAT fallback.
+    # Returns None instead of True or False when a component could not be decided in time
+    return k_colorability(graph, n_groups)
 
-    def backtrack(students, idx):
-        if idx == len(students):
-            return True
-        student = students[idx]
-        for c in range(n_groups):
-            if is_valid(student, c):
-                color[student] = c
-                if backtrack(students, idx + 1):
-                    return True
-                del color[student]
-        return False
-
-    students = list(graph.keys())
-    success = backtrack(students, 0)
-    if success:
-        return True, None
-    else:
-        return False, set(students)
-
-
-
-def check_conflicting_constraints(data, groups):
+def check_conflicting_constraints(data, parent):
     conflicts = []
-    for _, (s1, s2, together) in data.constraints_students.iterrows():
-        teacher1 = data.constraints_teachers[(data.constraints_teachers['Student'] == s1)]
-        teacher2 = data.constraints_teachers[(data.constraints_teachers['Student'] == s2)]
-
-        if together == "Yes":
-            conflict1 = data.constraints_students[
-                ((data.constraints_students['Student 1'] == s1) & (data.constraints_students['Student 2'] == s2) & (data.constraints_students['Together'] == "No"))]
-            conflict2 = data.constraints_students[
-                ((data.constraints_students['Student 1'] == s2) & (data.constraints_students['Student 2'] == s1) & (data.constraints_students['Together'] == "No"))]
-
-            # Check if there isnt another constraint with No for same students
-            if not conflict1.empty or not conflict2.empty:
-                conflicts.append((s1, s2, "Duplicate constraints"))
-
-            # Check if there is a conflict with the teacher
-            if not teacher1.empty and not teacher2.empty:
-                if teacher1['Teacher'].values[0] != teacher2['Teacher'].values[0] and teacher1['Together'].values[0] == 'Yes' and teacher2['Together'].values[0] == 'Yes':
-                    conflicts.append((s1, s2, "Conflicting teachers"))
-
-                if teacher1['Teacher'].values[0] == teacher2['Teacher'].values[0] and teacher1['Together'].values[0] != teacher2['Together'].values[0]:
-                    conflicts.append((s1, s2, "Conflicting teachers"))
-
-        elif together == "No":
-            conflict1 = data.constraints_students[
-                ((data.constraints_students['Student 1'] == s1) & (data.constraints_students['Student 2'] == s2) & (data.constraints_students['Together'] == "Yes"))]
-            conflict2 = data.constraints_students[
-                ((data.constraints_students['Student 1'] == s2) & (data.constraints_students['Student 2'] == s1) & (data.constraints_students['Together'] == "Yes"))]
-
-            # Check if there is another constraint with Yes for same students
-            if not conflict1.empty or not conflict2.empty:
-                conflicts.append((s1, s2, "Duplicate constraints"))
-
-    all_required_pairs = {}
-    for idx, group in enumerate(groups):
-        pairs = list(itertools.combinations(group, 2))
-        all_required_pairs[f"Group_{idx + 1}"] = pairs
-
-    no_constraints = set(
-        tuple(sorted((row['Student 1'], row['Student 2'])))
-        for _, row in data.constraints_students.iterrows()
-        if row['Together'] == 'No'
-    )
-
-    # Check if all pairs in a group have the same teacher
-    for group in all_required_pairs.values():
-        for (s1, s2) in group:
-            if tuple(sorted((s1, s2))) in no_constraints:
-                conflicts.append((s1, s2, "Conflicting constraints: transitivity"))
-
-            teacher1 = data.constraints_teachers[(data.constraints_teachers['Student'] == s1)]
-            teacher2 = data.constraints_teachers[(data.constraints_teachers['Student'] == s2)]
-
-            if not teacher1.empty and not teacher2.empty:
-                if teacher1['Together'].values[0] != teacher2['Together'].values[0]:
-                    conflicts.append((s1, s2, "Conflicting teachers"))
-
-    if conflicts:
-        print(f"Conflicting constraints found: {conflicts}")
-        return False
-    return True
-
-def validate_constraints(data, variables):
-    groups = build_together_groups(data)
-
-    for group in groups:
+    student_pairs = list(zip(data.constraints_students['Student 1'], data.constraints_students['Student 2'], data.constraints_students['Together']))
+    teacher_rows = list(zip(data.constraints_teachers['Student'], data.constraints_teachers['Teacher'], data.constraints_teachers['Together']))
+
+    # Indexes: unordered student pair -> verdicts, together-component -> required teachers with a witness
+    pair_verdicts = defaultdict(set)
+    for s1, s2, together in student_pairs:
+        pair_verdicts[frozenset((s1, s2))].add(together)
+
+    component_teachers = defaultdict(dict)
+    for student, teacher, together in teacher_rows:
+        if together == "Yes" and student in parent:
+            component_teachers[find(parent, student)].setdefault(teacher, student)
+
+    # Check if there isnt another constraint with the opposite answer for the same students
+    for s1, s2, together in student_pairs:
+        if pair_verdicts[frozenset((s1, s2))] >= {"Yes", "No"}:
+            conflicts.append((s1, s2, "Duplicate constraints"))
+
+    # Students that have to be apart can not be in the same together-component
+    for s1, s2, together in student_pairs:
+        if together == "No" and s1 in parent and s2 in parent and find(parent, s1) == find(parent, s2):
+            conflicts.append((s1, s2, "Conflicting constraints: transitivity"))
+
+    # All students of a component have to go to the same teacher
+    # (one student with two teachers is reported by the multiple teachers check)
+    for teachers in component_teachers.values():
+        witnesses = list(teachers.values())
+        for other in witnesses[1:]:
+            if other != witnesses[0]:
+                conflicts.append((witnesses[0], other, "Conflicting teachers"))
+
+    # A student can not be kept away from the teacher their component has to go to
+    for student, teacher, together in teacher_rows:
+        if together == "No" and student in parent:
+            witness = component_teachers[find(parent, student)].get(teacher)
+            if witness is not None and witness != student:
+                conflicts.append((witness, student, "Conflicting teachers"))
+
+    return conflicts
+
+def validate_constraints(data, variables, report):
+    parent = build_together_components(data)
+    students = data.info_students['Student'].tolist()
+
+    # Component label per student, students without together constraints get their own label
+    root_labels = {}
+    labels = np.array([root_labels.setdefault(find(parent, student) if student in parent else student, i)
+                       for i, student in enumerate(students)], dtype=np.int64)
+    sizes = np.bincount(labels, minlength=len(students))
+    extra_care_counts = np.bincount(labels, weights=(data.info_students['Extra Care'] == "Yes").to_numpy(), minlength=len(students))
+
+    for label in np.flatnonzero(sizes > 1):
+        group = [students[i] for i in np.flatnonzero(labels == label)]
+
         # 1. Check if a group has more students than the allowed max group size
-        if len(group) > variables.max_group_size:
-            print(f"Error: Due to the required constraints, a group contains more than the maximum allowed group size ({variables.max_group_size}).")
-            return False
+        if sizes[label] > variables.max_group_size:
+            report.error("together_groups", f"Due to the required constraints, a group of {sizes[label]} students contains more than the maximum allowed group size ({variables.max_group_size}).", group)
 
         # 2. Check if a group has more extra care students than the allowed max extra care students
-        extra_care_count = sum([data.info_students.loc[data.info_students['Student'] == student, 'Extra Care'].values[0] == "Yes" for student in group])
-        if extra_care_count > variables.max_extra_care:
-            print(f"Error: Due to the required constraints, a group contains more than the maximum allowed extra care students ({variables.max_extra_care_students}).")
-            return False
+        if extra_care_counts[label] > variables.max_extra_care:
+            report.error("together_groups", f"Due to the required constraints, a group contains {int(extra_care_counts[label])} extra care students, more than the maximum allowed ({variables.max_extra_care}).", group)
 
     # Check if there are conflicting constraints
-    if not check_conflicting_constraints(data, groups):
-        return False
+    for s1, s2, reason in check_conflicting_constraints(data, parent):
+        report.error("conflicting_constraints", f"Conflicting constraints found: {(s1, s2, reason)}", [s1, s2])
 
     # Check if a student is assigned to multiple teachers
     student_teacher_yes = data.constraints_teachers[data.constraints_teachers['Together'] == 'Yes']
     teacher_counts = student_teacher_yes.groupby('Student')['Teacher'].nunique()
-    multi_teacher_students = teacher_counts[teacher_counts > 1]
-
-    if not multi_teacher_students.empty:
-        print(f'Students assigned to multiple teachers: {multi_teacher_students}')
-        return False
+    for student in teacher_counts[teacher_counts > 1].index:
+        report.error("student_teacher", f"{student} is assigned to multiple teachers.", [student])
 
     # Check if a student has both a "Yes" and a "No" to the same teacher
-    pair_map = data.constraints_teachers.groupby(data.constraints_teachers[['Student', 'Teacher']].apply(lambda x: tuple(sorted(x)), axis=1))['Together'].nunique()
-    conflicts = pair_map[pair_map > 1]
-    if not conflicts.empty:
-        print(f'Conflicting student-teacher constraints found: {conflicts}')
-        return False
+    pair_map = data.constraints_teachers.groupby(['Student', 'Teacher'])['Together'].nunique()
+    for student, teacher in pair_map[pair_map > 1].index:
+        report.error("student_teacher", f"Conflicting student-teacher constraints found for {student} and {teacher}.", [student, teacher])
 
     # Check if the 'Together = No' graph can be separated into the given number of groups
     no_graph = defaultdict(set)
-    for _, row in data.constraints_students.iterrows():
-        if row['Together'] == 'No':
-            s1, s2 = row['Student 1'], row['Student 2']
+    for s1, s2, together in zip(data.constraints_students['Student 1'], data.constraints_students['Student 2'], data.constraints_students['Together']):
+        if together == 'No':
             no_graph[s1].add(s2)
             no_graph[s2].add(s1)
 
     can_sep, problem_group = can_separate(no_graph, variables.n_groups)
-    if not can_sep:
-        print(f"Error: The following students are mutually constrained to not be together, "
-              f"but cannot be split into {variables.n_groups} groups: {sorted(problem_group)}")
-        return False
+    if can_sep is False:
+        report.error("not_together", f"The following students are mutually constrained to not be together, "
+                     f"but cannot be split into {variables.n_groups} groups: {sorted(problem_group)}", sorted(problem_group))
+    elif can_sep is None:
+        report.warning("not_together", f"Could not decide in time whether these students can be split into {variables.n_groups} groups: {sorted(problem_group)}", sorted(problem_group))
 
-    return True
 
-
-def validate_grouping_data(dfs, variables):
+def validation_report(dfs, variables):
+    # Runs every check and collects all findings instead of stopping at the first error
+    report = ValidationReport()
     students = dfs.info_students['Student'].tolist()
     teachers = dfs.info_teachers['Teacher'].tolist()
 
@@ -210,45 +232,47 @@ def validate_grouping_data(dfs, variables):
 
     # Check if number of students is equal to the number of students in the info_students df
     if variables.n_students != len(dfs.info_students):
-        print(f"Error: The number of students in the group preferences ({variables.n_students}) does not match the number of students in the info_students df ({len(dfs.info_students)}).")
-        return False
+        report.error("group_preferences", f"The number of students in the group preferences ({variables.n_students}) does not match the number of students in the info_students df ({len(dfs.info_students)}).")
 
     # Check if minimum group size * number of groups does not exceed number of students
     if variables.min_group_size * variables.n_groups > variables.n_students:
-        print(f"Error: The minimum group size of {variables.min_group_size} requires {variables.min_group_size * variables.n_groups} students for {variables.n_groups} groups, "
-              f"but there are {variables.n_students} students. You need to reduce the minimum group size or number of groups.")
-        return False
+        report.error("group_preferences", f"The minimum group size of {variables.min_group_size} requires {variables.min_group_size * variables.n_groups} students for {variables.n_groups} groups, "
+                     f"but there are {variables.n_students} students. You need to reduce the minimum group size or number of groups.")
 
     # Check if number of teachers is equal to the number of groups
     if len(dfs.info_teachers) != variables.n_groups:
-        print(f"Error: The number of teachers ({len(dfs.info_teachers)}) does not match the number of groups ({variables.n_groups}).")
-        return False
+        report.error("group_preferences", f"The number of teachers ({len(dfs.info_teachers)}) does not match the number of groups ({variables.n_groups}).")
 
     # Check if all appearances of teachers are in the info_teachers df
     invalid_teachers = validate_teachers(dfs, teachers)
     if invalid_teachers != []:
-        print(f"Warning: The following teachers appear in constraints but not in info_teachers: {invalid_teachers}")
-        return False
+        report.error("unknown_names", f"The following teachers appear in constraints but not in info_teachers: {invalid_teachers}", invalid_teachers)
+
+    # Check if every student name appears only once
+    duplicates = duplicate_students(students)
+    if duplicates:
+        report.error("duplicate_names", f"The following students appear more than once in info_students: {duplicates}", duplicates)
 
     # Check if all appearances of students are in the info_students df
     invalid_students = validate_students(dfs, students)
     if invalid_students != []:
-        print(f"Warning: The following students appear in constraints but not in info_students: {invalid_students}")
-        return False
+        report.error("unknown_names", f"The following students appear in constraints but not in info_students: {invalid_students}", invalid_students)
 
     # Check if maximum extra care * number of groups is not less than number of students with extra care
     if n_extra_care > variables.max_extra_care * variables.n_groups:
-        print(f"Error: The maximum number of extra care students per group is {variables.max_extra_care}, "
-              f"but there are {n_extra_care} students with extra care. "
-              f"You need to increase the maximum number of extra care students per group or increase the number of groups.")
-        return False
+        report.error("group_preferences", f"The maximum number of extra care students per group is {variables.max_extra_care}, "
+                     f"but there are {n_extra_care} students with extra care. "
+                     f"You need to increase the maximum number of extra care students per group or increase the number of groups.")
 
     # Check student preferences
-    if not validate_student_preference(dfs, variables, students):
-        return False
+    validate_student_preference(dfs, students, report)
 
     # Check constraint consistency
-    if not validate_constraints(dfs, variables):
-        return False
+    validate_constraints(dfs, variables, report)
 
-    return True
+    return report
+
+def validate_grouping_data(dfs, variables):
+    report = validation_report(dfs, variables)
+    report.print()
+    return report.is_valid()
@@ -9,6 +9,10 @@ def get_school_paths(folder, skip_schools):
         if school in skip_schools or school.startswith("synthetic_school"):
             continue
 
+        # Skip files next to the school folders, like the preprocessing manifest
+        if not os.path.isdir(os.path.join(folder, school)):
+            continue
+
         all_schools.append(os.path.join(folder, school))
     return all_schools
 
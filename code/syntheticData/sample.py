@@ -107,7 +107,7 @@ def constraints_teachers(stats, student_ids, teacher_ids, output_path):
               ["Student", "Teacher", "Together"],
               teacher_constraints)
 
-def group_preferences(num_students, num_groups, student_ids, output_path):
+def group_preferences(stats, num_students, num_groups, student_ids, output_path):
     min_group_size_ratio = sample_param(stats["min_group_size_ratio"])
     min_group_size = math.ceil(num_groups * min_group_size_ratio)
 
@@ -159,7 +159,7 @@ def generate_synthetic_school(stats, num_students, output_path, seed):
     constraints_teachers(stats, student_ids, teacher_ids, output_path)
 
     # group_preferences.csv
-    group_preferences(num_students, num_groups, student_ids, output_path)
+    group_preferences(stats, num_students, num_groups, student_ids, output_path)
 
     # info_teachers.csv
     info_teachers(teacher_ids, output_path)
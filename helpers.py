@@ -1,5 +1,16 @@
 import pandas as pd
+import numpy as np
 import os
+import json
+
+PROCESSED_TABLES = ['group_preferences', 'info_students', 'info_teachers',
+                    'constraints_students', 'constraints_teachers', 'current_groups']
+
+# Binary copy of the processed CSVs, the CSVs stay the source of truth
+SIDECAR_FILE = 'processed_data.npz'
+
+# Parsed instances per school folder, together with the file modification times they were read at
+_loaded_data = {}
 
 class InputData:
     def __init__(self, group_preferences, info_students, info_teachers, constraints_students, constraints_teachers, current_groups):
@@ -32,15 +43,89 @@ def read_group_preferences(school, processed_data_folder):
 
     return n_students, n_groups, min_group_size, max_extra_care
 
+def write_sidecar(school, processed_data_folder):
+    # Encode the tables exactly as read_csv parses them: text columns as int codes into one shared
+    # array of strings, numeric columns as float64 together with their original dtype.
+    # Everything is packed into a few flat arrays, since every array in an .npz has a fixed read cost
+    tables = []
+    codes, numbers = [], []
+    categories = pd.Index([], dtype=object)
+    for table in PROCESSED_TABLES:
+        df = read_df(school, processed_data_folder, f'{table}.csv')
+        columns = []
+        for column in df.columns:
+            text = not (pd.api.types.is_numeric_dtype(df[column]) or pd.api.types.is_bool_dtype(df[column]))
+            if text:
+                values = df[column].dropna().astype(str)
+                categories = categories.append(pd.Index(values.unique()).difference(categories))
+                column_codes = np.full(len(df), -1, dtype=np.int32)
+                column_codes[df[column].notna().to_numpy()] = categories.get_indexer(values)
+                codes.append(column_codes)
+            else:
+                numbers.append(df[column].to_numpy(dtype=np.float64))
+            columns.append([column, str(df[column].dtype), text])
+        tables.append({"table": table, "rows": len(df), "columns": columns})
+
+    arrays = {
+        'tables': np.array(json.dumps(tables)),
+        'categories': np.array(categories, dtype=str),
+        'codes': np.concatenate(codes) if codes else np.zeros(0, dtype=np.int32),
+        'numbers': np.concatenate(numbers) if numbers else np.zeros(0),
+    }
+
+    # Write to a temporary file first so readers never see a half written sidecar
+    path = os.path.join(processed_data_folder, school, SIDECAR_FILE)
+    with open(path + '.tmp', 'wb') as file:
+        np.savez(file, **arrays)
+    os.replace(path + '.tmp', path)
+
+def read_sidecar(path):
+    with np.load(path, allow_pickle=False) as arrays:
+        tables = json.loads(arrays['tables'].item())
+        codes, numbers = arrays['codes'], arrays['numbers']
+        # Code -1 picks the NaN appended at the end
+        categories = np.append(arrays['categories'].astype(object), np.nan)
+
+    dfs = {}
+    code_offset, number_offset = 0, 0
+    for table in tables:
+        rows = table["rows"]
+        columns = {}
+        for column, dtype, text in table["columns"]:
+            if text:
+                columns[column] = pd.array(categories[codes[code_offset:code_offset + rows]], dtype=dtype)
+                code_offset += rows
+            else:
+                columns[column] = numbers[number_offset:number_offset + rows].astype(dtype)
+                number_offset += rows
+        dfs[table["table"]] = pd.DataFrame(columns, columns=[column for column, _, _ in table["columns"]])
+    return dfs
+
+def read_tables(school, processed_data_folder):
+    school_folder = os.path.join(processed_data_folder, school)
+    csv_mtimes = [os.stat(os.path.join(school_folder, f'{table}.csv')).st_mtime_ns for table in PROCESSED_TABLES]
+
+    # The sidecar is only used when it is at least as new as every CSV, so edited CSVs always win
+    sidecar_path = os.path.join(school_folder, SIDECAR_FILE)
+    if os.path.exists(sidecar_path) and os.stat(sidecar_path).st_mtime_ns >= max(csv_mtimes):
+        try:
+            return read_sidecar(sidecar_path), csv_mtimes
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Warning: could not read {sidecar_path}, reading CSVs instead: {e}")
+
+    return {table: read_df(school, processed_data_folder, f'{table}.csv') for table in PROCESSED_TABLES}, csv_mtimes
+
 def read_dfs(school, processed_data_folder):
-    return InputData(
-        read_df(school, processed_data_folder, 'group_preferences.csv'),
-        read_df(school, processed_data_folder, 'info_students.csv'),
-        read_df(school, processed_data_folder, 'info_teachers.csv'),
-        read_df(school, processed_data_folder, 'constraints_students.csv'),
-        read_df(school, processed_data_folder, 'constraints_teachers.csv'),
-        read_df(school, processed_data_folder, 'current_groups.csv')
-    )
+    # Instances are parsed once per process and read again only when one of the CSVs changed
+    key = os.path.abspath(os.path.join(processed_data_folder, school))
+    csv_mtimes = [os.stat(os.path.join(key, f'{table}.csv')).st_mtime_ns for table in PROCESSED_TABLES]
+    if key not in _loaded_data or _loaded_data[key][0] != csv_mtimes:
+        tables, csv_mtimes = read_tables(school, processed_data_folder)
+        _loaded_data[key] = (csv_mtimes, tables)
+
+    # Callers get their own copies, so changing a DataFrame never changes the cached instance
+    tables = _loaded_data[key][1]
+    return InputData(*(tables[table].copy() for table in PROCESSED_TABLES))
 
 def read_variables(data):
     group_preferences = data.group_preferences
@@ -56,53 +141,6 @@ def get_max_group_size(min_group_size, n_students, n_groups):
         max_size += 1
     return max_size
 
-def get_assigned_students(groups):
-    return [student for group in groups.values() for student in group]
-
-def is_assigned(student, groups):
-    if student in get_assigned_students(groups):
-        return True
-    return False
-
 def get_group(student, groups):
     group = [group for group in groups if student in groups[group]]
     return group[0]
-
-def create_preference_matrix(data, variables):
-    students = data.info_students['Student'].tolist()
-    preference_matrix = pd.DataFrame(0, index=students, columns=students)
-
-    for i in range(variables.n_students):
-        preferences_i = data.info_students.loc[data.info_students['Student'] == students[i],
-                                          ['Preference 1', 'Preference 2', 'Preference 3', 'Preference 4', 'Preference 5']].values.flatten().tolist()
-        preferences_i = [p for p in preferences_i if pd.notna(p)]
-
-        for j in range(variables.n_students):
-            if i == j:
-                continue
-
-            if students[j] in preferences_i:
-                preference_matrix.loc[students[i], students[j]] = 1
-
-    return preference_matrix
-
-# MODELS
-def estimated_max_prefs(preferences, students, teachers):
-    # Sum the total number of peer preferences, scaled by how many teachers
-    return sum(preferences.loc[s].sum() * len(teachers) for s in students) or 1
-
-def estimated_max_fairness(fairness_layers):
-    # Exponentially weighted total fairness score across all layers
-    max_k = max((k for k, _ in fairness_layers), default=1)
-    return sum(10 ** (max_k - k) for k, _ in fairness_layers) or 1
-
-def estimated_max_balance_penalty(data, attributes_to_balance, teachers):
-    # Maximum possible deviation if all students of a type go to one teacher
-    total_penalty = 0
-    num_teachers = len(teachers)
-    for attr in attributes_to_balance:
-        counts = data.info_students[attr].value_counts()
-        for value_count in counts.values:
-            ideal = value_count / num_teachers
-            total_penalty += abs(value_count - ideal)
-    return total_penalty or 1
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+from helpers import read_variables
+
+PREFERENCE_COLUMNS = ['Preference 1', 'Preference 2', 'Preference 3', 'Preference 4', 'Preference 5']
+CATEGORICAL_ATTRIBUTES = ['Gender', 'Grade', 'Extra Care', 'Behavior', 'Learning', 'Combination']
+
+class Instance:
+    def __init__(self, students, teachers, attributes, extra_care, pref_src, pref_dst,
+                 pair_s1, pair_s2, pair_together, teacher_student, teacher_teacher, teacher_together, variables):
+        # Names in model order, everything else refers to them by position
+        self.students = students
+        self.teachers = teachers
+        self.student_index = {s: i for i, s in enumerate(students)}
+        self.teacher_index = {t: i for i, t in enumerate(teachers)}
+        self.n_students = len(students)
+        self.n_teachers = len(teachers)
+
+        # attribute -> (codes per student, categories), code -1 means missing
+        self.attributes = attributes
+        self.extra_care = extra_care
+
+        # Preference edges src -> dst, sorted by src and deduplicated
+        self.pref_src = pref_src
+        self.pref_dst = pref_dst
+
+        # Student-student and student-teacher constraints as index arrays
+        self.pair_s1 = pair_s1
+        self.pair_s2 = pair_s2
+        self.pair_together = pair_together
+        self.teacher_student = teacher_student
+        self.teacher_teacher = teacher_teacher
+        self.teacher_together = teacher_together
+
+        self.variables = variables
+
+    def preference_ranges(self):
+        # Start and end offset of every student's edges in pref_src/pref_dst
+        starts = np.searchsorted(self.pref_src, np.arange(self.n_students), side='left')
+        ends = np.searchsorted(self.pref_src, np.arange(self.n_students), side='right')
+        return starts, ends
+
+def to_codes(values, index, label):
+    codes = pd.Series(values, dtype=object).map(index)
+    unknown = pd.Series(values, dtype=object)[codes.isna()]
+    if not unknown.empty:
+        raise ValueError(f"Unknown {label} in constraints: {sorted(set(unknown.astype(str)))}")
+    return codes.to_numpy(dtype=np.int64)
+
+def encode_preferences(info_students, student_index):
+    n_students = len(info_students)
+    src = np.repeat(np.arange(n_students), len(PREFERENCE_COLUMNS))
+    dst = info_students[PREFERENCE_COLUMNS].to_numpy(dtype=object).ravel()
+    dst = pd.Series(dst, dtype=object).map(student_index).to_numpy(dtype=float)
+
+    # Drop empty and unknown preferences and students preferring themselves
+    keep = ~np.isnan(dst)
+    src, dst = src[keep], dst[keep].astype(np.int64)
+    keep = src != dst
+    src, dst = src[keep], dst[keep]
+
+    # Deduplicate and sort edges by (src, dst)
+    keys = np.unique(src * n_students + dst)
+    return keys // n_students, keys % n_students
+
+def encode_attributes(info_students):
+    attributes = {}
+    for attribute in CATEGORICAL_ATTRIBUTES:
+        if attribute in info_students.columns:
+            codes, categories = pd.factorize(info_students[attribute])
+            attributes[attribute] = (codes.astype(np.int64), list(categories))
+    return attributes
+
+def encode_instance(data, variables=None):
+    if variables is None:
+        variables = read_variables(data)
+
+    students = data.info_students['Student'].tolist()
+    teachers = data.info_teachers['Teacher'].tolist()
+    instance_students = {s: i for i, s in enumerate(students)}
+    instance_teachers = {t: i for i, t in enumerate(teachers)}
+
+    pref_src, pref_dst = encode_preferences(data.info_students, instance_students)
+
+    constraints_students = data.constraints_students
+    constraints_teachers = data.constraints_teachers
+
+    return Instance(
+        students,
+        teachers,
+        encode_attributes(data.info_students),
+        (data.info_students['Extra Care'] == 'Yes').to_numpy(dtype=np.int64),
+        pref_src,
+        pref_dst,
+        to_codes(constraints_students['Student 1'], instance_students, 'students'),
+        to_codes(constraints_students['Student 2'], instance_students, 'students'),
+        (constraints_students['Together'] == 'Yes').to_numpy(),
+        to_codes(constraints_teachers['Student'], instance_students, 'students'),
+        to_codes(constraints_teachers['Teacher'], instance_teachers, 'teachers'),
+        (constraints_teachers['Together'] == 'Yes').to_numpy(),
+        variables
+    )
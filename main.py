@@ -2,11 +2,21 @@ import os
 
 from code.models.ILP import run_ilp
 from code.models.CP import run_cp
+from code.models.HiGHS import run_highs
+from code.models import ILP, CP, HiGHS
 from code.evaluation.evaluate_results import run_evaluate
+from code.evaluation.check_constraints import run_check_constraints
+from code.models.incremental import save_instance_snapshot
+from code.models.polish import POLISH_TIME
+from code.models.pool import POOL_SIZE
+from code.models.search_log import SOLVER_LOG
+from code.models.stopping import StopRules
+from code.models.checkpoint import CHECKPOINT_INTERVAL, latest_checkpoint
+from helpers import read_dfs, read_variables
 
 import sys
 
-def save_results(results, timestamp):
+def save_results(results, timestamp, limits):
     folder = 'data/results'
     results_folder = os.path.join(folder, school, method)
 
@@ -17,30 +27,116 @@ def save_results(results, timestamp):
     output_file = os.path.join(solution_folder, f"{method}_{timestamp}.csv")
     results.to_csv(output_file, index=False)
 
+    # Keep the instance this run was solved on, so later input changes can be re-solved incrementally
+    save_instance_snapshot(school, processed_data_folder, method, timestamp, limits)
+
+def save_invalid_results(results, timestamp):
+    # A solution that fails verification is only kept for inspection, it is not saved or evaluated as a run
+    solution_folder = os.path.join('data/results', school, method, "solutions")
+    os.makedirs(solution_folder, exist_ok=True)
+    output_file = os.path.join(solution_folder, f"{method}_{timestamp}_invalid.csv")
+    results.to_csv(output_file, index=False)
+    print(f"The invalid solution is not saved as a run, it is written to {output_file}")
+
+def verify_results(results, limits):
+    data = read_dfs(school, processed_data_folder)
+    backend = {"ILP": ILP, "CP": CP, "HIGHS": HiGHS}[method]
+    min_prefs, solved_deviation = limits
+    violations = run_check_constraints(results, data, read_variables(data), backend.get_balance_attributes(data), min_prefs, solved_deviation)
+    if violations:
+        print(f"WARNING: the {method} solution is not valid, see the violations above.")
+    return violations
+
 def run_pipeline():
     print("Running pipeline for school: {}".format(school))
 
     results = None
     timestamp = None
+    limits = None
 
     # Run ILP algorithm
     if run_baseline_ilp:
-        results, timestamp = run_ilp(school, processed_data_folder, timelimit, min_prefs_per_kid, deviation)
+        results, timestamp, limits = run_ilp(school, processed_data_folder, timelimit, min_prefs_per_kid, deviation, use_cache, polish_time, tabu, pool_size, solver_log, stop_rules,
+                                             checkpoint_interval, resume, upper_bounds)
 
     # Run CP algorithm
     if run_cp_model:
-        results, timestamp = run_cp(school, processed_data_folder, timelimit, min_prefs_per_kid, deviation)
+        results, timestamp, limits = run_cp(school, processed_data_folder, timelimit, min_prefs_per_kid, deviation, use_cache, polish_time, tabu, pool_size, solver_log, stop_rules, feasibility_first,
+                                            checkpoint_interval, resume, upper_bounds)
+
+    # Run HiGHS MIP through scipy
+    if run_highs_model:
+        results, timestamp, limits = run_highs(school, processed_data_folder, timelimit, min_prefs_per_kid, deviation, solver_log, stop_rules, upper_bounds)
 
     if results is not None:
+        # Verify the solution against the hard constraints of the phase that produced it
+        if verify_results(results, limits):
+            save_invalid_results(results, timestamp)
+            return
+
         # Save results
-        save_results(results, timestamp)
+        save_results(results, timestamp, limits)
         # Evaluate results
         run_evaluate(school, processed_data_folder, method, results, timestamp)
 
 
 if __name__ == "__main__":
+    # Built models are cached in data/cache unless --no-cache is given
+    use_cache = "--no-cache" not in sys.argv
+    if not use_cache:
+        sys.argv.remove("--no-cache")
+
+    # Timed out CP and ILP phases are polished with local search for --polish[=seconds], --tabu adds a tabu search
+    polish_time = 0
+    for arg in [a for a in sys.argv if a.startswith("--polish")]:
+        polish_time = int(arg.split("=", 1)[1]) if "=" in arg else POLISH_TIME
+        sys.argv.remove(arg)
+    tabu = "--tabu" in sys.argv
+    if tabu:
+        sys.argv.remove("--tabu")
+
+    # With --pool[=K], CP and ILP also save the best K distinct alternatives found during the search
+    pool_size = 0
+    for arg in [a for a in sys.argv if a.startswith("--pool")]:
+        pool_size = int(arg.split("=", 1)[1]) if "=" in arg else POOL_SIZE
+        sys.argv.remove(arg)
+
+    # Solver log verbosity with --solver-log=N: 0 none, 1 to data/results/<school>/<method>/logs (default), 2 also to stdout
+    solver_log = SOLVER_LOG
+    for arg in [a for a in sys.argv if a.startswith("--solver-log=")]:
+        solver_log = int(arg.split("=", 1)[1])
+        sys.argv.remove(arg)
+
+    # Early stops: --plateau=S seconds without a new best solution, --gap=E relative gap, --target=OBJ objective reached
+    stop_limits = {"plateau": None, "gap": None, "target": None}
+    for name in stop_limits:
+        for arg in [a for a in sys.argv if a.startswith(f"--{name}=")]:
+            stop_limits[name] = float(arg.split("=", 1)[1])
+            sys.argv.remove(arg)
+    stop_rules = StopRules(stop_limits["plateau"], stop_limits["gap"], stop_limits["target"])
+
+    # With --feasibility-first, CP first looks for any valid assignment and then optimizes from it
+    feasibility_first = "--feasibility-first" in sys.argv
+    if feasibility_first:
+        sys.argv.remove("--feasibility-first")
+
+    # With --checkpoint[=seconds], CP and ILP write the incumbent to disk at most every that many seconds.
+    # --resume continues the latest checkpoint of the school and method, which implies --checkpoint
+    checkpoint_interval = 0
+    for arg in [a for a in sys.argv if a.startswith("--checkpoint")]:
+        checkpoint_interval = int(arg.split("=", 1)[1]) if "=" in arg else CHECKPOINT_INTERVAL
+        sys.argv.remove(arg)
+    resume_run = "--resume" in sys.argv
+    if resume_run:
+        sys.argv.remove("--resume")
+
+    # With --bounds, a solved phase also gets the combinatorial and LP relaxation upper bounds
+    upper_bounds = "--bounds" in sys.argv
+    if upper_bounds:
+        sys.argv.remove("--bounds")
+
     if len(sys.argv) < 3:
-        print("Usage: python3 main.py <school> <method: cp|ilp> [timelimit] [min_prefs_per_kid] [deviation]")
+        print("Usage: python3 main.py <school> <method: cp|ilp|highs> [timelimit] [min_prefs_per_kid] [deviation] [--no-cache] [--polish[=seconds]] [--tabu] [--pool[=K]] [--solver-log=0|1|2] [--plateau=seconds] [--gap=epsilon] [--target=objective] [--feasibility-first] [--checkpoint[=seconds]] [--resume] [--bounds]")
         sys.exit(1)
 
     school = sys.argv[1]
@@ -50,6 +146,7 @@ if __name__ == "__main__":
     # Set which model to run
     run_baseline_ilp = method == "ILP"
     run_cp_model = method == "CP"
+    run_highs_model = method == "HIGHS"
 
     # Set time limit for the solver (default 10 minutes)
     timelimit = 30 * 60
@@ -65,6 +162,17 @@ if __name__ == "__main__":
     # Define paths
     processed_data_folder = 'data/processed_data'
 
+    # A resumed run takes its time limit, min_prefs and deviation from the checkpoint
+    resume = None
+    if resume_run:
+        resume = latest_checkpoint(os.path.join('data/results', school, method), method)
+        if resume is None:
+            print(f"No checkpoint to resume for school {school}, method {method}")
+            sys.exit(1)
+        timelimit, min_prefs_per_kid, deviation = resume.run["timelimit"], resume.run["min_prefs_start"], resume.run["deviation"]
+        checkpoint_interval = checkpoint_interval or CHECKPOINT_INTERVAL
+        print(f"Resuming {resume.path} at {resume.elapsed:.1f}s of {timelimit}s, objective = {resume.objective}")
+
     # Run pipeline
     print(f"school {school}, method {method}")
     run_pipeline()
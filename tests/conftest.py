@@ -0,0 +1,61 @@
+import os
+import sys
+import pytest
+
+# Add the project root to sys.path, benchmark_build adds the synthetic data generator
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from code.models.benchmark_build import BENCHMARK_STATS, generate_synthetic_school
+from helpers import read_dfs, read_variables
+from instance import encode_instance
+from code.models import CP
+
+SCHOOL = "synthetic_school"
+PROCESSED = "data/processed_data"
+
+# A synthetic school of 80 students that is feasible with these limits
+SEED = 11
+MIN_PREFS = 1
+DEVIATION = 0.15
+
+class School:
+    # The synthetic school in its own folder, data is shared by the tests that only read it
+    def __init__(self, folder):
+        self.folder = folder
+        self.data = self.read_data()
+        self.variables = read_variables(self.data)
+        self.instance = encode_instance(self.data, self.variables)
+        self.balance_attributes = CP.get_balance_attributes(self.data)
+
+    def read_data(self):
+        # A fresh copy for tests that change the input
+        cwd = os.getcwd()
+        os.chdir(self.folder)
+        try:
+            return read_dfs(SCHOOL, PROCESSED)
+        finally:
+            os.chdir(cwd)
+
+class SolvedSchool(School):
+    # One CP run on the synthetic school
+    def __init__(self, folder, df, timestamp, limits):
+        super().__init__(folder)
+        self.df = df
+        self.timestamp = timestamp
+        self.limits = limits
+
+@pytest.fixture(scope="session")
+def school(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("school")
+    generate_synthetic_school(dict(BENCHMARK_STATS), 80, os.path.join(folder, PROCESSED, SCHOOL), SEED)
+    return School(folder)
+
+@pytest.fixture(scope="session")
+def solved_school(school):
+    cwd = os.getcwd()
+    os.chdir(school.folder)
+    try:
+        df, timestamp, limits = CP.run_cp(SCHOOL, PROCESSED, 10, MIN_PREFS, DEVIATION)
+    finally:
+        os.chdir(cwd)
+    assert limits == (MIN_PREFS, DEVIATION)
+    return SolvedSchool(school.folder, df, timestamp, limits)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from conftest import MIN_PREFS, DEVIATION
+from code.evaluation.assignment_state import AssignmentState
+from code.evaluation.batch_score import score_batch
+from code.evaluation.check_constraints import assignment_groups
+
+def assert_same_state(state, fresh):
+    # Every incremental counter equals the one computed from scratch
+    assert state.objective() == pytest.approx(fresh.objective())
+    assert state.violations() == fresh.violations()
+    assert state.n_violated == fresh.n_violated
+    assert (state.satisfied == fresh.satisfied).all()
+    assert (state.sizes == fresh.sizes).all()
+    assert (state.extra_care == fresh.extra_care).all()
+    for attribute in fresh.counts:
+        assert (state.counts[attribute] == fresh.counts[attribute]).all()
+
+def test_random_edits_match_a_fresh_state(solved_school):
+    instance = solved_school.instance
+    group, _, _ = assignment_groups(instance, solved_school.df)
+    state = AssignmentState(instance, group, solved_school.balance_attributes, MIN_PREFS, DEVIATION)
+    assert state.is_valid()
+
+    # Moves, swaps and removals by name and by index, checked after every edit
+    rng = np.random.default_rng(5)
+    for step in range(300):
+        s1, s2 = rng.choice(instance.n_students, 2, replace=False)
+        kind = rng.choice(["move", "swap", "remove"], p=[0.5, 0.4, 0.1])
+        if kind == "move":
+            state.move(instance.students[s1], instance.teachers[rng.integers(instance.n_teachers)])
+        elif kind == "swap" and state.group[s1] >= 0 and state.group[s2] >= 0:
+            state.swap(instance.students[s1], instance.students[s2])
+        else:
+            state.move_index(s1, -1)
+
+        if step % 25 == 0 or step == 299:
+            fresh = AssignmentState(instance, state.group, solved_school.balance_attributes, MIN_PREFS, DEVIATION)
+            assert_same_state(state, fresh)
+            scores = score_batch(instance, state.group, solved_school.balance_attributes, MIN_PREFS, DEVIATION)
+            assert state.objective() == pytest.approx(scores.objective[0])
+            assert state.violations() == {family: int(counts[0]) for family, counts in scores.violations.items()}
+
+def test_change_is_undone_by_the_reverse_edit(solved_school):
+    instance = solved_school.instance
+    group, _, _ = assignment_groups(instance, solved_school.df)
+    state = AssignmentState(instance, group, solved_school.balance_attributes, MIN_PREFS, DEVIATION)
+    before = state.snapshot()
+
+    student = instance.students[0]
+    home = instance.teachers[group[0]]
+    other = instance.teachers[(group[0] + 1) % instance.n_teachers]
+    change = state.move(student, other)
+    back = state.move(student, home)
+    assert state.snapshot() == before
+    assert set(change) == set(back)
+    assert all(back[key] == pytest.approx(-value) for key, value in change.items())
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from ortools.sat.python import cp_model
+
+from conftest import SCHOOL, PROCESSED, MIN_PREFS, DEVIATION
+from code.models import CP
+from code.evaluation.check_constraints import solution_groups
+from code.evaluation.batch_score import score_batch
+
+class Collector(cp_model.CpSolverSolutionCallback):
+    # Every solution CP-SAT finds, with the objective it reports for it
+    def __init__(self, x):
+        super().__init__()
+        self.x = x
+        self.solutions = []
+        self.objectives = []
+
+    def on_solution_callback(self):
+        self.solutions.append({key: self.Value(var) for key, var in self.x.items()})
+        self.objectives.append(self.ObjectiveValue())
+
+def fixed_objective(model, x, solution):
+    # Best objective of the model with the assignment fixed. Solutions found during the search can leave slack in the
+    # fairness and balance variables, the score of an assignment is the objective with that slack removed
+    fixed = model.Clone()
+    fixed.ClearHints()
+    for key, var in x.items():
+        fixed.Add(fixed.GetBoolVarFromProtoIndex(var.Index()) == solution[key])
+    solver = cp_model.CpSolver()
+    solver.parameters.num_search_workers = 1
+    assert solver.Solve(fixed) == cp_model.OPTIMAL
+    return solver.ObjectiveValue()
+
+def test_scores_equal_the_solver_objective(school, monkeypatch):
+    monkeypatch.chdir(school.folder)
+    model, x = CP.lower_model(CP.create_model_ir(SCHOOL, PROCESSED).set_limits(MIN_PREFS, DEVIATION))
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = 5
+    solver.parameters.random_seed = 42
+    solver.parameters.num_search_workers = 1
+    collector = Collector(x)
+    solver.Solve(model, collector)
+    assert len(collector.solutions) > 1
+
+    # All solutions of the search scored as one batch
+    groups = np.array([solution_groups(school.instance, solution) for solution in collector.solutions])
+    scores = score_batch(school.instance, groups, school.balance_attributes, MIN_PREFS, DEVIATION)
+    assert scores.objective == pytest.approx([fixed_objective(model, x, solution) for solution in collector.solutions], abs=1e-6)
+    assert (scores.objective >= np.array(collector.objectives) - 1e-6).all()
+    assert (scores.n_violations == 0).all()
+
+    # A single assignment scores the same as its row in the batch
+    single = score_batch(school.instance, groups[-1], school.balance_attributes, MIN_PREFS, DEVIATION)
+    assert single.objective[0] == pytest.approx(scores.objective[-1])
@@ -0,0 +1,67 @@
+import os
+import csv
+import json
+import time
+
+from conftest import SCHOOL, PROCESSED, MIN_PREFS, DEVIATION
+from code.models import CP
+from code.models.checkpoint import Checkpointer, latest_checkpoint
+from code.evaluation.check_constraints import run_check_constraints
+
+RESULTS = os.path.join("data/results", SCHOOL, "CP")
+TIMELIMIT = 8
+ELAPSED = 4.0
+
+def interrupted_run(solved_school, timestamp):
+    # The checkpoint a run leaves behind when it is stopped in its min_prefs=0 phase after ELAPSED seconds
+    run_config = {"timelimit": TIMELIMIT, "min_prefs_start": MIN_PREFS, "deviation": DEVIATION}
+    checkpointer = Checkpointer(RESULTS, "CP", timestamp, run_config, 0.1)
+    checkpointer.start(0, DEVIATION)
+    solution = {(row.Student, row.Teacher): 1 for row in solved_school.df.itertuples()}
+    checkpointer.update(solution, 100.0, ELAPSED)
+
+    # The background thread writes it without waiting for close()
+    time.sleep(0.5)
+    assert os.path.exists(checkpointer.path)
+    checkpointer.close()
+    return checkpointer.path
+
+def test_checkpoint_is_read_back(solved_school, monkeypatch):
+    monkeypatch.chdir(solved_school.folder)
+    path = interrupted_run(solved_school, "01-01_00:00")
+    with open(path) as file:
+        assert json.load(file)["run"]["min_prefs_start"] == MIN_PREFS
+
+    checkpoint = latest_checkpoint(RESULTS, "CP")
+    assert checkpoint.path == path and checkpoint.timestamp == "01-01_00:00"
+    assert (checkpoint.min_prefs, checkpoint.deviation, checkpoint.elapsed, checkpoint.objective) == (0, DEVIATION, ELAPSED, 100.0)
+    assert checkpoint.skips(MIN_PREFS, DEVIATION) and not checkpoint.skips(0, DEVIATION)
+    x = {(student, teacher): None for student in solved_school.instance.students for teacher in solved_school.instance.teachers}
+    assert {key for key, value in checkpoint.hint(x).items() if value} == set(zip(solved_school.df["Student"], solved_school.df["Teacher"]))
+    os.remove(path)
+
+def test_resume_continues_the_elapsed_time_and_the_limits(solved_school, monkeypatch):
+    monkeypatch.chdir(solved_school.folder)
+    timestamp = "02-01_00:00"
+    path = interrupted_run(solved_school, timestamp)
+    checkpoint = latest_checkpoint(RESULTS, "CP")
+
+    start = time.time()
+    df, resumed_timestamp, limits = CP.run_cp(SCHOOL, PROCESSED, TIMELIMIT, MIN_PREFS, DEVIATION, checkpoint_interval=1, resume=checkpoint)
+    duration = time.time() - start
+
+    # The min_prefs=1 phase is skipped, the checkpointed phase only gets what is left of its time limit
+    assert resumed_timestamp == timestamp
+    assert limits == (0, DEVIATION)
+    assert duration < TIMELIMIT - ELAPSED + 2
+    assert run_check_constraints(df, solved_school.data, solved_school.variables, solved_school.balance_attributes, *limits) == []
+
+    # The log of the run continues after the checkpointed elapsed time
+    with open(os.path.join(RESULTS, "logs", f"CP_{timestamp}.csv")) as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == ["Resumed", str(ELAPSED)]
+    elapsed = [float(row[2]) for row in rows if row and row[0] == timestamp]
+    assert elapsed and min(elapsed) >= ELAPSED and max(elapsed) <= TIMELIMIT + 1
+
+    # A resumed run that finished has nothing left to resume
+    assert not os.path.exists(path)
@@ -0,0 +1,66 @@
+import os
+import sys
+import random
+from collections import defaultdict
+
+# Add the project root to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from code.preprocessing.coloring import k_colorability, dsatur_search
+
+def baseline_can_separate(graph, n_groups):
+    # The plain backtracking over all students that k_colorability replaced, kept as the reference
+    color = {}
+    students = list(graph)
+
+    def backtrack(idx):
+        if idx == len(students):
+            return True
+        student = students[idx]
+        for c in range(n_groups):
+            if all(color.get(neighbour) != c for neighbour in graph[student]):
+                color[student] = c
+                if backtrack(idx + 1):
+                    return True
+                del color[student]
+        return False
+    return backtrack(0)
+
+def random_graph(rng, n, density):
+    # 'Not together' pairs among n students, as validate_constraints builds them
+    graph = defaultdict(set)
+    for a in range(n):
+        for b in range(a + 1, n):
+            if rng.random() < density:
+                graph[f"S_{a}"].add(f"S_{b}")
+                graph[f"S_{b}"].add(f"S_{a}")
+    return graph
+
+def test_same_answer_as_backtracking():
+    rng = random.Random(7)
+    answers = set()
+    for _ in range(150):
+        graph = random_graph(rng, rng.randint(4, 11), rng.choice([0.2, 0.35, 0.5, 0.7]))
+        n_groups = rng.randint(2, 4)
+        separable, certificate = k_colorability(graph, n_groups)
+        assert separable == baseline_can_separate(graph, n_groups)
+        answers.add(separable)
+
+        # A certificate is a set of students that can not be split on its own
+        if separable is False:
+            subgraph = {v: graph[v] & certificate for v in certificate}
+            assert not baseline_can_separate(subgraph, n_groups)
+    assert answers == {True, False}
+
+def test_search_colouring_is_proper():
+    # The odd wheel needs 4 colours, DSATUR's search has to prove 3 are not enough
+    rim = [f"S_{i}" for i in range(5)]
+    graph = defaultdict(set)
+    for i, v in enumerate(rim):
+        for u in (rim[(i + 1) % 5], "hub"):
+            graph[v].add(u)
+            graph[u].add(v)
+    vertices = list(graph)
+    assert dsatur_search(graph, vertices, 3, {}) is False
+    color = dsatur_search(graph, vertices, 4, {})
+    assert all(color[v] != color[u] for v in vertices for u in graph[v])
+    assert k_colorability(graph, 3)[0] is False
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+from instance import PREFERENCE_COLUMNS
+from code.evaluation.kernel import evaluate_assignment
+from code.evaluation.helpers import get_satisfied_preferences_per_student
+
+# The row by row metrics the group index pass replaced, kept as the reference
+def baseline_satisfied(df):
+    satisfied = {}
+    for _, row in df.iterrows():
+        prefs = [p for p in row[PREFERENCE_COLUMNS] if pd.notna(p)]
+        satisfied[row['Student']] = sum(df.loc[df['Student'] == p, 'Assigned Group'].values[0] == row['Assigned Group'] for p in prefs)
+    return satisfied
+
+def baseline_provided(df):
+    return {row['Student']: int(row[PREFERENCE_COLUMNS].notna().sum()) for _, row in df.iterrows()}
+
+def baseline_balance(df, attribute):
+    result = {}
+    for value in df[attribute].dropna().unique():
+        subset = df[df[attribute] == value]
+        counts, percentages = subset['Assigned Group'].value_counts(), subset['Assigned Group'].value_counts(normalize=True)
+        result[value] = {"total": int(len(subset))}
+        for group, count in counts.items():
+            result[value][group] = {"count": int(count), "percent": round(percentages[group], 2)}
+    return result
+
+def baseline_only_minimum(df, minimum):
+    satisfied, provided = baseline_satisfied(df), baseline_provided(df)
+    eligible = [s for s in satisfied if provided[s] > minimum]
+    count_min = sum(satisfied[s] == minimum for s in eligible)
+    count_above_min = sum(satisfied[s] > minimum for s in eligible)
+    return (count_min, count_min / len(eligible)), (count_above_min, count_above_min / len(eligible))
+
+def merged(school, groups):
+    # Same merge run_evaluate does
+    df = pd.merge(groups, school.data.info_students, on='Student', how='left')
+    return df.rename(columns={'Teacher': 'Assigned Group'})
+
+def random_groups(school, seed):
+    rng = np.random.default_rng(seed)
+    teachers = school.data.info_teachers['Teacher'].to_numpy()
+    return pd.DataFrame({"Student": school.data.info_students['Student'], "Teacher": teachers[rng.integers(len(teachers), size=len(school.data.info_students))]})
+
+def check_against_baseline(df):
+    evaluation = evaluate_assignment(df)
+    satisfied, provided = baseline_satisfied(df), baseline_provided(df)
+    assert get_satisfied_preferences_per_student(df) == satisfied
+    assert evaluation.total_satisfied() == sum(satisfied.values())
+    assert evaluation.total_provided() == sum(provided.values())
+    minimum = min(satisfied[s] for s in satisfied if provided[s] > 0)
+    assert evaluation.minimum_satisfied() == minimum
+    assert evaluation.only_minimum() == baseline_only_minimum(df, minimum)
+    assert evaluation.group_sizes() == df['Assigned Group'].value_counts().to_dict()
+    for attribute in ['Gender', 'Grade', 'Extra Care', 'Behavior']:
+        if attribute in df.columns:
+            assert evaluation.balance(attribute) == baseline_balance(df, attribute)
+
+def test_solved_assignment_matches_baseline(solved_school):
+    check_against_baseline(merged(solved_school, solved_school.df))
+
+def test_random_assignments_match_baseline(school):
+    for seed in range(3):
+        check_against_baseline(merged(school, random_groups(school, seed)))
@@ -0,0 +1,55 @@
+import os
+import csv
+import time
+
+from conftest import SCHOOL, PROCESSED, MIN_PREFS, DEVIATION
+from code.models import CP
+from code.evaluation.check_constraints import solution_groups
+from code.evaluation.batch_score import score_batch
+
+TIMELIMIT = 6
+
+def lowered():
+    return CP.lower_model(CP.create_model_ir(SCHOOL, PROCESSED).set_limits(MIN_PREFS, DEVIATION))
+
+def log_rows(results_folder, timestamp):
+    with open(os.path.join(results_folder, "logs", f"CP_{timestamp}.csv")) as file:
+        return list(csv.reader(file))
+
+def test_first_solution_hints_the_optimization(school, monkeypatch, tmp_path):
+    monkeypatch.chdir(school.folder)
+    model, x = lowered()
+    priority = CP.priority_students(school.instance)
+    first, status = CP.find_first_solution(model, x, priority, TIMELIMIT)
+    assert status in ("FEASIBLE", "OPTIMAL")
+    first_score = score_batch(school.instance, solution_groups(school.instance, first), school.balance_attributes, MIN_PREFS, DEVIATION)
+    assert first_score.n_violations[0] == 0
+
+    solution, status = CP.solve_model(model, x, str(tmp_path), "first", TIMELIMIT, MIN_PREFS, DEVIATION, priority=priority)
+    score = score_batch(school.instance, solution_groups(school.instance, solution), school.balance_attributes, MIN_PREFS, DEVIATION)
+    assert score.n_violations[0] == 0 and score.objective[0] >= first_score.objective[0]
+    assert any(row and row[0] == "First Feasible" for row in log_rows(tmp_path, "first"))
+
+def test_unknown_stage_falls_back_to_the_normal_search(school, monkeypatch, tmp_path):
+    monkeypatch.chdir(school.folder)
+    # A feasibility stage that runs out of its share of the time without a solution
+    stages = []
+    def unknown(model, x, priority, timelimit, log_callback=None):
+        stages.append(timelimit)
+        time.sleep(timelimit)
+        return None, "UNKNOWN"
+    monkeypatch.setattr(CP, "find_first_solution", unknown)
+
+    model, x = lowered()
+    start = time.time()
+    solution, status = CP.solve_model(model, x, str(tmp_path), "unknown", TIMELIMIT, MIN_PREFS, DEVIATION,
+                                      priority=CP.priority_students(school.instance))
+    elapsed = time.time() - start
+
+    # The stage is capped at its share, the normal search gets the rest and still finds a valid assignment
+    assert stages == [TIMELIMIT * CP.FEASIBILITY_SHARE]
+    assert status in ("FEASIBLE", "OPTIMAL") and solution is not None
+    assert elapsed < TIMELIMIT + 2
+    score = score_batch(school.instance, solution_groups(school.instance, solution), school.balance_attributes, MIN_PREFS, DEVIATION)
+    assert score.n_violations[0] == 0
+    assert not any(row and row[0] == "First Feasible" for row in log_rows(tmp_path, "unknown"))
@@ -0,0 +1,106 @@
+import os
+import sys
+import time
+import pandas as pd
+
+# Add the project root to sys.path, benchmark_build adds the synthetic data generator
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from code.models.benchmark_build import BENCHMARK_STATS, generate_synthetic_school
+from helpers import read_dfs, read_variables
+from instance import encode_instance
+from code.models import CP
+from code.models.incremental import save_instance_snapshot, new_timestamp, resolve
+from code.models.repair import read_run_config
+from code.models.cache import instance_digest, model_key, get_cached_model
+from code.evaluation.check_constraints import assignment_groups, run_check_constraints
+
+SCHOOL = "incremental_school"
+PROCESSED = "data/processed_data"
+
+# A synthetic school of 80 students that is feasible with the limits below
+SEED = 11
+
+# Not the (1, 0.1) that re-solves used to fall back to, so a re-solve that loses the limits of its run is noticed.
+# The synthetic school is infeasible with two preferences per student
+MIN_PREFS = 1
+DEVIATION = 0.15
+
+def save_run(df, timestamp, limits):
+    # Same files main.py and incremental.py write for a run: the solution and the instance snapshot, no solver log
+    folder = os.path.join("data/results", SCHOOL, "CP", "solutions")
+    os.makedirs(folder, exist_ok=True)
+    df.to_csv(os.path.join(folder, f"CP_{timestamp}.csv"), index=False)
+    save_instance_snapshot(SCHOOL, PROCESSED, "CP", timestamp, limits)
+
+def violations(df):
+    data = read_dfs(SCHOOL, PROCESSED)
+    return run_check_constraints(df, data, read_variables(data), CP.get_balance_attributes(data), MIN_PREFS, DEVIATION)
+
+def assert_cached_model_is_fresh():
+    # A cached model must be the plain lowering of its instance, patch_model maps IR rows onto proto constraints by position
+    key = model_key(instance_digest(SCHOOL, PROCESSED), method="CP", min_prefs=MIN_PREFS, deviation=DEVIATION, debug_names=False)
+    cached = get_cached_model(SCHOOL, key, "pb")
+    if cached is None:
+        return
+    model, _ = CP.read_model(*cached)
+    fresh, _ = CP.lower_model(CP.create_model_ir(SCHOOL, PROCESSED).set_limits(MIN_PREFS, DEVIATION))
+    assert list(model.Proto().constraints) == list(fresh.Proto().constraints)
+
+def test_two_chained_constraint_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    generate_synthetic_school(dict(BENCHMARK_STATS), 80, os.path.join(PROCESSED, SCHOOL), SEED)
+
+    df, timestamp, limits = CP.run_cp(SCHOOL, PROCESSED, 20, MIN_PREFS, DEVIATION)
+    assert limits == (MIN_PREFS, DEVIATION)
+    save_run(df, timestamp, limits)
+
+    # 1. Two students that share a group may no longer be together
+    data = read_dfs(SCHOOL, PROCESSED)
+    instance = encode_instance(data, read_variables(data))
+    group, _, _ = assignment_groups(instance, df)
+    pairs = pd.read_csv(os.path.join(PROCESSED, SCHOOL, "constraints_students.csv"))
+    constrained = set(pairs["Student 1"]) | set(pairs["Student 2"]) | set(data.constraints_teachers["Student"])
+    free = [s for s in range(instance.n_students) if instance.students[s] not in constrained]
+    s1, s2 = [instance.students[s] for s in free if group[s] == group[free[0]]][:2]
+    pairs.loc[len(pairs)] = {"Student 1": s1, "Student 2": s2, "Together": "No"}
+    pairs.to_csv(os.path.join(PROCESSED, SCHOOL, "constraints_students.csv"), index=False)
+
+    result = resolve(SCHOOL, PROCESSED, "CP", timestamp, 20)
+    assert result is not None
+    df, limits = result
+    assert limits == (MIN_PREFS, DEVIATION)
+    assert violations(df) == []
+    assert_cached_model_is_fresh()
+    time.sleep(1)
+    timestamp = new_timestamp(SCHOOL, "CP")
+    save_run(df, timestamp, limits)
+
+    # The re-solved run has no solver log, its limits come from the snapshot
+    assert not os.path.exists(os.path.join("data/results", SCHOOL, "CP", "logs", f"CP_{timestamp}.csv"))
+    assert read_run_config(SCHOOL, "CP", timestamp) == (MIN_PREFS, DEVIATION)
+
+    # 2. A teacher constraint is removed, patching must still map rows onto the model they came from
+    teacher_rows = pd.read_csv(os.path.join(PROCESSED, SCHOOL, "constraints_teachers.csv"))
+    assert len(teacher_rows) > 0
+    teacher_rows.iloc[1:].to_csv(os.path.join(PROCESSED, SCHOOL, "constraints_teachers.csv"), index=False)
+
+    result = resolve(SCHOOL, PROCESSED, "CP", timestamp, 20)
+    assert result is not None
+    df, limits = result
+    assert limits == (MIN_PREFS, DEVIATION)
+    assert violations(df) == []
+    assert_cached_model_is_fresh()
+
+def test_resolve_without_stored_limits_fails(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    generate_synthetic_school(dict(BENCHMARK_STATS), 80, os.path.join(PROCESSED, SCHOOL), SEED)
+
+    df, timestamp, limits = CP.run_cp(SCHOOL, PROCESSED, 20, MIN_PREFS, DEVIATION)
+    save_run(df, timestamp, None)
+    os.remove(os.path.join("data/results", SCHOOL, "CP", "logs", f"CP_{timestamp}.csv"))
+
+    # A snapshot without limits and without a log must not be re-solved with default limits
+    pairs = pd.read_csv(os.path.join(PROCESSED, SCHOOL, "constraints_students.csv"))
+    pairs.iloc[1:].to_csv(os.path.join(PROCESSED, SCHOOL, "constraints_students.csv"), index=False)
+    assert read_run_config(SCHOOL, "CP", timestamp) is None
+    assert resolve(SCHOOL, PROCESSED, "CP", timestamp, 20) is None
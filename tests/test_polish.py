@@ -0,0 +1,59 @@
+import pytest
+
+from conftest import SCHOOL, PROCESSED, MIN_PREFS, DEVIATION
+from code.models import CP
+from code.models.polish import Polisher, neighbours, apply_moves, unsatisfied_students, EPSILON
+from code.evaluation.assignment_state import AssignmentState
+from code.evaluation.batch_score import score_batch
+from code.evaluation.check_constraints import solution_groups
+
+def first_solution(school):
+    # A valid but poor assignment, the first one of the feasibility stage that ignores the objective
+    model, x = CP.lower_model(CP.create_model_ir(SCHOOL, PROCESSED).set_limits(MIN_PREFS, DEVIATION))
+    solution, status = CP.find_first_solution(model, x, CP.priority_students(school.instance), 10)
+    assert status in ("FEASIBLE", "OPTIMAL")
+    return solution
+
+def score(school, solution):
+    return score_batch(school.instance, solution_groups(school.instance, solution), school.balance_attributes, MIN_PREFS, DEVIATION)
+
+@pytest.mark.parametrize("tabu", [False, True])
+def test_polish_keeps_the_solution_valid_and_never_worse(school, monkeypatch, tabu):
+    monkeypatch.chdir(school.folder)
+    solution = first_solution(school)
+    before = score(school, solution)
+
+    logged = []
+    polished = Polisher(SCHOOL, PROCESSED, school.balance_attributes, 3, tabu).polish(solution, MIN_PREFS, DEVIATION, logged.append)
+    after = score(school, polished)
+
+    # Same students and groups as the solver output, every student in exactly one group
+    assert set(polished) == set(solution)
+    assert after.n_violations[0] == 0
+    assert after.objective[0] >= before.objective[0] - EPSILON
+
+    # Every improvement is logged, the last one is the objective of the result
+    assert logged == sorted(logged)
+    if logged:
+        assert logged[-1] == pytest.approx(after.objective[0])
+
+def test_hill_climb_ends_in_a_local_optimum(school, monkeypatch):
+    monkeypatch.chdir(school.folder)
+    polished = Polisher(SCHOOL, PROCESSED, school.balance_attributes, 60).polish(first_solution(school), MIN_PREFS, DEVIATION, lambda objective: None)
+
+    # No valid move or swap of an unsatisfied student improves the objective any further
+    state = AssignmentState(school.instance, solution_groups(school.instance, polished), school.balance_attributes, MIN_PREFS, DEVIATION)
+    objective = state.objective()
+    for s in unsatisfied_students(state).tolist():
+        for moves in neighbours(state, s):
+            undo = apply_moves(state, moves)
+            assert not (state.is_valid() and state.objective() > objective + EPSILON)
+            apply_moves(state, undo)
+
+def test_invalid_solution_is_not_polished(school, monkeypatch):
+    monkeypatch.chdir(school.folder)
+    solution = first_solution(school)
+    student = school.instance.students[0]
+    for key in [key for key in solution if key[0] == student]:
+        solution[key] = 0
+    assert Polisher(SCHOOL, PROCESSED, school.balance_attributes, 3).polish(dict(solution), MIN_PREFS, DEVIATION, None) == solution
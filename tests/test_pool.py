@@ -0,0 +1,75 @@
+import os
+import glob
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import SCHOOL, PROCESSED, MIN_PREFS, DEVIATION
+from code.models import CP
+from code.models.pool import SolutionPool, MIN_DISTANCE
+from code.evaluation.check_constraints import assignment_groups, run_check_constraints
+from code.evaluation.batch_score import score_batch
+
+def as_solution(instance, group):
+    # The x values of an assignment, as the solver callback hands them to the pool
+    return {(student, teacher): int(group[s] == t) for s, student in enumerate(instance.students)
+            for t, teacher in enumerate(instance.teachers)}
+
+def moved(instance, group, n, seed):
+    # The assignment with n students in another group
+    rng = np.random.default_rng(seed)
+    group = group.copy()
+    for s in rng.choice(instance.n_students, n, replace=False):
+        group[s] = (group[s] + 1) % instance.n_teachers
+    return group
+
+def test_add_keeps_the_best_of_close_assignments(solved_school, monkeypatch):
+    monkeypatch.chdir(solved_school.folder)
+    instance = solved_school.instance
+    best, _, _ = assignment_groups(instance, solved_school.df)
+    pool = SolutionPool(SCHOOL, PROCESSED, solved_school.balance_attributes, 2)
+
+    assert pool.add(as_solution(instance, best), 10)
+    # The same assignment again, and a close one that is not better, stay out
+    assert not pool.add(as_solution(instance, best), 20)
+    assert not pool.add(as_solution(instance, moved(instance, best, 2, 0)), 10)
+    # A close and better assignment replaces it
+    close = moved(instance, best, 2, 1)
+    assert pool.add(as_solution(instance, close), 11)
+    assert len(pool.groups) == 1 and (pool.groups[0] == close).all()
+
+    # Distant assignments are kept next to it up to the size of the pool, ordered by objective
+    assert pool.add(as_solution(instance, moved(instance, best, MIN_DISTANCE + 5, 2)), 12)
+    assert not pool.add(as_solution(instance, moved(instance, best, MIN_DISTANCE + 5, 3)), 5)
+    assert list(pool.objectives) == [12, 11]
+
+def test_exported_alternatives_are_valid_and_distinct(school, monkeypatch):
+    monkeypatch.chdir(school.folder)
+    df, timestamp, limits = CP.run_cp(SCHOOL, PROCESSED, 5, MIN_PREFS, DEVIATION, pool_size=3)
+    assert limits == (MIN_PREFS, DEVIATION)
+
+    folder = os.path.join("data/results", SCHOOL, "CP", "pool", f"CP_{timestamp}")
+    summary = pd.read_csv(os.path.join(folder, "summary.csv"))
+    paths = sorted(glob.glob(os.path.join(folder, f"CP_{timestamp}_*.csv")))
+    assert 1 < len(paths) == len(summary) <= 3
+
+    groups = []
+    for path in paths:
+        alternative = pd.read_csv(path)
+        assert run_check_constraints(alternative, school.data, school.variables, school.balance_attributes, MIN_PREFS, DEVIATION) == []
+        groups.append(assignment_groups(school.instance, alternative)[0])
+    groups = np.array(groups)
+
+    # The best alternative is the solution of the run, the others are far enough from every other one
+    assert (groups[0] == assignment_groups(school.instance, df)[0]).all()
+    for i in range(len(groups)):
+        for j in range(i):
+            assert (groups[i] != groups[j]).sum() >= MIN_DISTANCE
+    assert (summary["Students Moved From Best"] == (groups != groups[:1]).sum(axis=1)).all()
+
+    # Ordered by the solver objective, which is never above the score of the assignment
+    objectives = summary["Solver Objective"].to_numpy()
+    assert (np.diff(objectives) <= 0).all()
+    scores = score_batch(school.instance, groups, school.balance_attributes, MIN_PREFS, DEVIATION)
+    assert (scores.objective >= objectives - 1e-6).all()
+    assert summary["Objective"].to_numpy() == pytest.approx(scores.objective)
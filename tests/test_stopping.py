@@ -0,0 +1,67 @@
+import os
+import csv
+import time
+
+from conftest import SCHOOL, PROCESSED, MIN_PREFS, DEVIATION
+from code.models import CP
+from code.models.stopping import StopRules, StopMonitor
+
+TIMELIMIT = 10
+
+def solve(school, results_folder, timestamp, stop_rules):
+    model, x = CP.lower_model(CP.create_model_ir(SCHOOL, PROCESSED).set_limits(MIN_PREFS, DEVIATION))
+    start = time.time()
+    solution, status = CP.solve_model(model, x, str(results_folder), timestamp, TIMELIMIT, MIN_PREFS, DEVIATION, stop_rules=stop_rules)
+    return solution, status, time.time() - start
+
+def log_rows(results_folder, timestamp):
+    with open(os.path.join(results_folder, "logs", f"CP_{timestamp}.csv")) as file:
+        return list(csv.reader(file))
+
+def test_monitor_fires_the_first_rule_once():
+    stops = []
+    monitor = StopMonitor(StopRules(gap=0.1, target=50), lambda: stops.append(True), watch=False)
+    monitor.solution(40, 100)
+    assert monitor.reason is None
+    monitor.solution(60, 100)
+    assert monitor.reason == "target"
+    monitor.best_bound(61)
+    assert monitor.reason == "target" and len(stops) == 1
+
+    # The gap counts from the latest bound, nothing fires once the search has ended
+    monitor = StopMonitor(StopRules(gap=0.1), lambda: stops.append(True), watch=False)
+    monitor.solution(40, 100)
+    monitor.best_bound(42)
+    assert monitor.reason == "gap"
+    monitor = StopMonitor(StopRules(target=50), lambda: stops.append(True), watch=False)
+    monitor.close()
+    monitor.solution(60)
+    assert monitor.reason is None and len(stops) == 2
+
+def test_plateau_is_watched_without_new_solutions():
+    stops = []
+    monitor = StopMonitor(StopRules(plateau=0.2), lambda: stops.append(True))
+    time.sleep(0.8)
+    # Nothing to stop before the first solution
+    assert monitor.reason is None
+    monitor.solution(10)
+    time.sleep(1.5)
+    monitor.close()
+    assert monitor.reason == "plateau" and stops == [True]
+
+def test_target_stops_the_search_early(school, monkeypatch, tmp_path):
+    monkeypatch.chdir(school.folder)
+    # Without rules the search runs until the time limit
+    solution, status, baseline_time = solve(school, tmp_path, "baseline", None)
+    assert status == "FEASIBLE" and baseline_time >= TIMELIMIT - 1
+    rows = log_rows(tmp_path, "baseline")
+    first = float(next(row for row in rows if row and row[0] == "baseline")[3])
+    assert next(row for row in rows if row and row[0] == "Status") == ["Status", "FEASIBLE"]
+
+    # A target the first solution reaches ends the search at that solution
+    solution, status, stopped_time = solve(school, tmp_path, "target", StopRules(target=first))
+    assert solution is not None and stopped_time < TIMELIMIT / 2
+    rows = log_rows(tmp_path, "target")
+    objectives = [float(row[3]) for row in rows if row and row[0] == "target"]
+    assert objectives[0] >= first
+    assert next(row for row in rows if row and row[0] == "Status") == ["Status", status, "target"]
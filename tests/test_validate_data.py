@@ -0,0 +1,154 @@
+import itertools
+import pandas as pd
+
+from instance import PREFERENCE_COLUMNS
+from code.preprocessing.validate_data import build_together_components, build_together_groups, check_conflicting_constraints, validation_report
+
+def baseline_conflicts(data, groups):
+    # The row by row scans the indexed validator replaced, kept as the reference
+    conflicts = []
+    pairs, teachers = data.constraints_students, data.constraints_teachers
+    for _, (s1, s2, together) in pairs.iterrows():
+        opposite = "No" if together == "Yes" else "Yes"
+        same = pairs[(((pairs['Student 1'] == s1) & (pairs['Student 2'] == s2)) | ((pairs['Student 1'] == s2) & (pairs['Student 2'] == s1)))
+                     & (pairs['Together'] == opposite)]
+        if not same.empty:
+            conflicts.append((s1, s2, "Duplicate constraints"))
+        teacher1, teacher2 = teachers[teachers['Student'] == s1], teachers[teachers['Student'] == s2]
+        if together == "Yes" and not teacher1.empty and not teacher2.empty:
+            if teacher1['Teacher'].values[0] != teacher2['Teacher'].values[0] and teacher1['Together'].values[0] == 'Yes' and teacher2['Together'].values[0] == 'Yes':
+                conflicts.append((s1, s2, "Conflicting teachers"))
+            if teacher1['Teacher'].values[0] == teacher2['Teacher'].values[0] and teacher1['Together'].values[0] != teacher2['Together'].values[0]:
+                conflicts.append((s1, s2, "Conflicting teachers"))
+
+    no_constraints = {tuple(sorted((row['Student 1'], row['Student 2']))) for _, row in pairs.iterrows() if row['Together'] == 'No'}
+    for group in groups:
+        for s1, s2 in itertools.combinations(group, 2):
+            if tuple(sorted((s1, s2))) in no_constraints:
+                conflicts.append((s1, s2, "Conflicting constraints: transitivity"))
+            teacher1, teacher2 = teachers[teachers['Student'] == s1], teachers[teachers['Student'] == s2]
+            if not teacher1.empty and not teacher2.empty and teacher1['Together'].values[0] != teacher2['Together'].values[0]:
+                conflicts.append((s1, s2, "Conflicting teachers"))
+    return conflicts
+
+def findings(conflicts):
+    # Pairs are unordered and the scans report some of them more than once
+    return {(frozenset((s1, s2)), reason) for s1, s2, reason in conflicts}
+
+def unconstrained(data, n):
+    constrained = set(data.constraints_students['Student 1']) | set(data.constraints_students['Student 2']) | set(data.constraints_teachers['Student'])
+    return [s for s in data.info_students['Student'] if s not in constrained][:n]
+
+def add_rows(df, rows):
+    return pd.concat([df, pd.DataFrame(rows, columns=df.columns)], ignore_index=True)
+
+def test_conflicts_match_the_row_scans(school):
+    data = school.read_data()
+    a, b, c, d, e, f, g = unconstrained(data, 7)
+    teachers = data.info_teachers['Teacher'].tolist()
+
+    # A pair that is both together and apart, a together chain closed by an apart pair
+    # and a together pair sent to two teachers
+    data.constraints_students = add_rows(data.constraints_students, [
+        (a, b, "Yes"), (a, b, "No"),
+        (c, d, "Yes"), (d, e, "Yes"), (c, e, "No"),
+        (f, g, "Yes")])
+    data.constraints_teachers = add_rows(data.constraints_teachers, [(f, teachers[0], "Yes"), (g, teachers[1], "Yes")])
+
+    parent = build_together_components(data)
+    new = findings(check_conflicting_constraints(data, parent))
+    old = findings(baseline_conflicts(data, build_together_groups(data, parent)))
+    assert new == old
+    assert (frozenset((a, b)), "Duplicate constraints") in new
+    assert (frozenset((c, e)), "Conflicting constraints: transitivity") in new
+    assert (frozenset((f, g)), "Conflicting teachers") in new
+
+def test_teacher_kept_from_its_component(school):
+    data = school.read_data()
+    a, b = unconstrained(data, 2)
+    teacher = data.info_teachers['Teacher'].iloc[0]
+    data.constraints_students = add_rows(data.constraints_students, [(a, b, "Yes")])
+    data.constraints_teachers = add_rows(data.constraints_teachers, [(a, teacher, "Yes"), (b, teacher, "No")])
+
+    parent = build_together_components(data)
+    new = findings(check_conflicting_constraints(data, parent))
+    assert new == findings(baseline_conflicts(data, build_together_groups(data, parent)))
+    assert new == {(frozenset((a, b)), "Conflicting teachers")}
+
+def test_synthetic_school_has_no_conflicts(school):
+    data = school.read_data()
+    parent = build_together_components(data)
+    assert check_conflicting_constraints(data, parent) == []
+    assert baseline_conflicts(data, build_together_groups(data, parent)) == []
+
+def baseline_group_findings(data, variables, groups):
+    # The per-group loop over info_students that the label counts replaced
+    findings = set()
+    for group in groups:
+        if len(group) > variables.max_group_size:
+            findings.add(("size", frozenset(group)))
+        extra_care = sum(data.info_students.loc[data.info_students['Student'] == student, 'Extra Care'].values[0] == "Yes" for student in group)
+        if extra_care > variables.max_extra_care:
+            findings.add(("extra_care", frozenset(group)))
+    return findings
+
+def baseline_preference_findings(data):
+    # Per student: themselves, a student twice or a student that does not exist
+    students = set(data.info_students['Student'])
+    findings = set()
+    for _, row in data.info_students.iterrows():
+        preferences = [p for p in row[PREFERENCE_COLUMNS] if pd.notna(p)]
+        if row['Student'] in preferences:
+            findings.add((row['Student'], "themselves"))
+        known = [p for p in preferences if p in students]
+        if len(known) != len(set(known)):
+            findings.add((row['Student'], "duplicate"))
+        if len(known) != len(preferences):
+            findings.add((row['Student'], "unknown"))
+    return findings
+
+def report_findings(report):
+    findings = set()
+    for finding in report.findings:
+        if finding.check == "together_groups":
+            findings.add(("size" if "group size" in finding.message else "extra_care", frozenset(finding.subjects)))
+        elif finding.check == "preferences":
+            kind = next(kind for kind in ("themselves", "duplicate", "unknown") if kind in finding.message)
+            findings.add((finding.subjects[0], kind))
+    return findings
+
+def test_report_matches_the_loops(school):
+    data = school.read_data()
+    variables = school.variables
+
+    # One together group above the maximum group size, one with too many extra care students
+    students = unconstrained(data, variables.max_group_size + variables.max_extra_care + 2)
+    big = students[:variables.max_group_size + 1]
+    extra_care = students[variables.max_group_size + 1:]
+    rows = [(a, b, "Yes") for a, b in zip(big, big[1:])] + [(a, b, "Yes") for a, b in zip(extra_care, extra_care[1:])]
+    data.constraints_students = add_rows(data.constraints_students, rows)
+    data.info_students.loc[data.info_students['Student'].isin(extra_care), 'Extra Care'] = "Yes"
+
+    # A student that prefers themselves, one with a duplicate and one with an unknown preference
+    index = data.info_students.index
+    data.info_students.loc[index[0], 'Preference 1'] = data.info_students.loc[index[0], 'Student']
+    data.info_students.loc[index[1], ['Preference 1', 'Preference 2']] = data.info_students.loc[index[2], 'Student']
+    data.info_students.loc[index[3], 'Preference 5'] = "Nobody"
+
+    report = validation_report(data, variables)
+    groups = build_together_groups(data)
+    expected = baseline_group_findings(data, variables, groups) | baseline_preference_findings(data)
+    assert report_findings(report) == expected
+    assert {kind for kind, _ in baseline_group_findings(data, variables, groups)} == {"size", "extra_care"}
+    assert {kind for _, kind in baseline_preference_findings(data)} == {"themselves", "duplicate", "unknown"}
+
+def test_synthetic_school_is_valid(school):
+    report = validation_report(school.read_data(), school.variables)
+    assert report.is_valid()
+
+def test_duplicate_names_are_reported(school):
+    data = school.read_data()
+    data.info_students.loc[data.info_students.index[1], 'Student'] = data.info_students['Student'].iloc[0]
+    report = validation_report(data, school.variables)
+    assert not report.is_valid()
+    assert [f.subjects for f in report.errors if f.check == "duplicate_names"] == [[data.info_students['Student'].iloc[0]]]
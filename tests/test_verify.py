@@ -0,0 +1,131 @@
+import os
+import math
+import numpy as np
+import pandas as pd
+
+from conftest import SCHOOL, PROCESSED
+import main
+from instance import PREFERENCE_COLUMNS
+from code.evaluation.check_constraints import (assignment_groups, assignment_frame, run_check_constraints, violates_group_size,
+                                               violates_student_pair, violates_teacher_pair, violates_max_extra_care, violates_ratio,
+                                               violates_min_prefs)
+from code.evaluation.helpers import get_satisfied_preferences_per_student
+
+def check(school, df):
+    min_prefs, deviation = school.limits
+    return run_check_constraints(df, school.data, school.variables, school.balance_attributes, min_prefs, deviation)
+
+def broken_assignment(school):
+    # The solved assignment with one 'not together' pair put in the same group and one student dropped
+    instance = school.instance
+    group, _, _ = assignment_groups(instance, school.df)
+    p = np.flatnonzero(~instance.pair_together)[0]
+    s1, s2 = instance.pair_s1[p], instance.pair_s2[p]
+    group[s2] = group[s1]
+    dropped = next(s for s in range(instance.n_students) if s not in (s1, s2))
+    group[dropped] = -1
+    return assignment_frame(instance, group), instance.students[dropped]
+
+def test_solved_assignment_is_valid(solved_school):
+    assert check(solved_school, solved_school.df) == []
+
+def test_broken_assignment_is_reported(solved_school):
+    df, dropped = broken_assignment(solved_school)
+    # Also a student that is not in the input and one assigned twice
+    extra = pd.DataFrame({"Student": ["Nobody", df["Student"].iloc[0]], "Teacher": [df["Teacher"].iloc[0], df["Teacher"].iloc[-1]]})
+    violations = check(solved_school, pd.concat([df, extra], ignore_index=True))
+
+    kinds = {kind for kind, _ in violations}
+    assert {"assignment", "student_pair"} <= kinds
+    messages = [message for _, message in violations]
+    assert f"Student {dropped} is not assigned to a group." in messages
+    assert any("Nobody" in message for message in messages)
+    assert any("is assigned to multiple groups" in message for message in messages)
+
+def test_pipeline_does_not_save_an_invalid_solution(solved_school, monkeypatch):
+    monkeypatch.chdir(solved_school.folder)
+    df, _ = broken_assignment(solved_school)
+    timestamp = "01-01_00:00"
+
+    # run_pipeline reads its settings from module globals set by __main__, only the CP run is replaced
+    settings = {"school": SCHOOL, "method": "CP", "processed_data_folder": PROCESSED,
+                "run_baseline_ilp": False, "run_cp_model": True, "run_highs_model": False}
+    for name in ("timelimit", "min_prefs_per_kid", "deviation", "use_cache", "polish_time", "tabu", "pool_size", "solver_log",
+                 "stop_rules", "feasibility_first", "checkpoint_interval", "resume", "upper_bounds"):
+        settings[name] = None
+    for name, value in settings.items():
+        monkeypatch.setattr(main, name, value, raising=False)
+    monkeypatch.setattr(main, "run_cp", lambda *args: (df, timestamp, solved_school.limits))
+
+    main.run_pipeline()
+
+    results_folder = os.path.join("data/results", SCHOOL, "CP")
+    assert os.path.exists(os.path.join(results_folder, "solutions", f"CP_{timestamp}_invalid.csv"))
+    assert not os.path.exists(os.path.join(results_folder, "solutions", f"CP_{timestamp}.csv"))
+    assert not os.path.exists(os.path.join(results_folder, "instances", f"CP_{timestamp}"))
+    assert not os.path.exists(os.path.join(results_folder, "evaluation", f"CP_{timestamp}.json"))
+
+def baseline_findings(school, df, min_prefs, deviation):
+    # The per-group loops of the old checker, with its group size and Behavior bugs fixed, kept as the reference.
+    # They stopped at the first violation, here every one is collected
+    data, variables = school.data, school.variables
+    merged = pd.merge(df, data.info_students, on='Student', how='left').rename(columns={'Teacher': 'Assigned Group'})
+    findings = set()
+    for group in data.info_teachers['Teacher']:
+        students = merged[merged['Assigned Group'] == group]['Student'].tolist()
+        if not variables.min_group_size <= len(students) <= variables.max_group_size:
+            findings.add(("group_size", group))
+        for _, (s1, s2, together) in data.constraints_students.iterrows():
+            if (together == 'Yes' and (s1 in students) != (s2 in students)) or (together != 'Yes' and s1 in students and s2 in students):
+                findings.add(("student_pair", s1, s2))
+        for _, (student, teacher, together) in data.constraints_teachers.iterrows():
+            if (together == 'Yes' and (student in students) != (group == teacher)) or (together != 'Yes' and student in students and group == teacher):
+                findings.add(("student_teacher", student, teacher))
+        if merged[(merged['Assigned Group'] == group) & (merged['Extra Care'] == 'Yes')].shape[0] > variables.max_extra_care:
+            findings.add(("extra_care", group))
+        for attribute in school.balance_attributes:
+            counts = merged[attribute].value_counts()
+            for category, total in counts.items():
+                target = total / variables.n_groups
+                actual = len(merged[(merged['Assigned Group'] == group) & (merged[attribute] == category)])
+                if not math.floor((1 - deviation) * target) <= actual <= math.ceil((1 + deviation) * target):
+                    findings.add((f"balance:{attribute}", group, category))
+
+    satisfied = get_satisfied_preferences_per_student(merged)
+    for _, row in merged.iterrows():
+        if row[PREFERENCE_COLUMNS].notna().any() and satisfied[row['Student']] < min_prefs:
+            findings.add(("min_prefs", row['Student']))
+    return findings
+
+def vectorized_findings(school, df, min_prefs, deviation):
+    instance = school.instance
+    students, teachers = instance.students, instance.teachers
+    group, _, _ = assignment_groups(instance, df)
+    findings = {("group_size", teachers[t]) for t in np.flatnonzero(violates_group_size(instance, group))}
+    findings |= {("student_pair", students[instance.pair_s1[p]], students[instance.pair_s2[p]]) for p in np.flatnonzero(violates_student_pair(instance, group))}
+    findings |= {("student_teacher", students[instance.teacher_student[r]], teachers[instance.teacher_teacher[r]]) for r in np.flatnonzero(violates_teacher_pair(instance, group))}
+    findings |= {("extra_care", teachers[t]) for t in np.flatnonzero(violates_max_extra_care(instance, group))}
+    for attribute in school.balance_attributes:
+        categories = instance.attributes[attribute][1]
+        findings |= {(f"balance:{attribute}", teachers[t], categories[c]) for c, t in zip(*np.nonzero(violates_ratio(instance, group, attribute, deviation)))}
+    findings |= {("min_prefs", students[s]) for s in np.flatnonzero(violates_min_prefs(instance, group, min_prefs))}
+    return findings
+
+def test_checks_match_the_old_loops(solved_school):
+    rng = np.random.default_rng(3)
+    n_teachers = solved_school.instance.n_teachers
+    solved, _, _ = assignment_groups(solved_school.instance, solved_school.df)
+    min_prefs, deviation = solved_school.limits
+    assert baseline_findings(solved_school, solved_school.df, min_prefs, deviation) == set()
+
+    # The solution with more and more students moved at random, so violations of several kinds show up
+    kinds = set()
+    for n_moved in (3, 10, 40, 80):
+        group = solved.copy()
+        moved = rng.choice(len(group), n_moved, replace=False)
+        group[moved] = rng.integers(n_teachers, size=n_moved)
+        df = assignment_frame(solved_school.instance, group)
+        expected = baseline_findings(solved_school, df, min_prefs, deviation)
+        assert vectorized_findings(solved_school, df, min_prefs, deviation) == expected
+        kinds |= {finding[0] for finding in expected}
+    assert {"group_size", "student_pair", "min_prefs"} <= kinds